@@ -4,7 +4,8 @@ This server runs alongside the voice chat application to provide health checks
 and future API endpoints for the microservices architecture.
 """
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
 from pydantic import BaseModel
@@ -15,12 +16,23 @@ from dotenv import load_dotenv
 # Configure logging before other imports
 import logging_config  # This configures loguru with standardized format
 from loguru import logger
+import asyncio
 import base64
+import httpx
 import assemblyai as aai
 from langchain_google_genai import ChatGoogleGenerativeAI
 import tempfile
 
 from dependencies import get_current_user, get_optional_user, UserContext
+from usage_metrics import usage_writer, estimate_stt_cost
+from idempotency import (
+    idempotency_store,
+    request_fingerprint,
+    IdempotencyConflict,
+    IdempotencyInProgress,
+    IDEMPOTENCY_HEADER,
+    REPLAYED_HEADER
+)
 
 load_dotenv(r"D:\Sama\.env")
 
@@ -40,6 +52,18 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def start_usage_metrics():
+    """Start the batched api_usage_metrics writer"""
+    usage_writer.start()
+
+
+@app.on_event("shutdown")
+async def stop_usage_metrics():
+    """Flush buffered usage metrics before exit"""
+    await usage_writer.stop()
+
+
 @app.get("/health")
 async def health_check():
     """
@@ -118,18 +142,102 @@ chat_model = ChatGoogleGenerativeAI(
     google_api_key=os.getenv("GOOGLE_API_KEY")
 )
 
+# Non-standard status used by nginx and others for "client closed request"
+CLIENT_CLOSED_REQUEST = 499
+DISCONNECT_POLL_INTERVAL_SECONDS = float(os.getenv("DISCONNECT_POLL_INTERVAL_SECONDS", "0.5"))
+
+
+# Fallback replies when the chat service can't answer; never replayed for idempotent retries
+CHAT_UNAVAILABLE_REPLY = "I'm having trouble connecting to my thought process right now."
+CHAT_ERROR_REPLY = "I'm sorry, I encountered an error processing your request."
+
+
+class ClientDisconnected(Exception):
+    """Raised when the caller disconnects before the work finished"""
+
+
+async def run_until_disconnected(http_request: Request, awaitable):
+    """
+    Await `awaitable`, cancelling it if the caller disconnects first.
+
+    Cancelling the downstream chat-service request closes its connection,
+    which in turn lets the chat service cancel its own LLM call.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("Client disconnected — cancelling downstream chat request")
+                task.cancel()
+                raise ClientDisconnected()
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+
 @app.post("/api/voice/chat", response_model=VoiceChatResponse)
 async def voice_chat(
     request: VoiceChatRequest,
+    http_request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
     user_context: UserContext = Depends(get_optional_user)
 ):
     """
     Process voice message: Audio -> STT -> LLM -> Response
+
+    If the caller disconnects, the downstream chat-service call is cancelled
+    so the abandoned turn stops using LLM quota and worker slots.
+
+    With an Idempotency-Key header a retried turn is transcribed and sent to
+    the chat service only once: retries join the running turn or get its
+    stored response. The key is forwarded to the chat service, and keyed
+    turns run to completion even if the caller disconnects.
     """
     user_id = user_context.user_id if user_context else request.user_id
     if not user_id:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
+    if not idempotency_key:
+        return await _process_voice_turn(request, http_request, user_id)
+
+    try:
+        result, replayed = await idempotency_store.run(
+            user_id,
+            idempotency_key,
+            request_fingerprint(request.audio, request.session_id),
+            lambda: _process_voice_turn(request, http_request, user_id, idempotency_key),
+            encode=lambda result: result.model_dump(mode="json"),
+            decode=VoiceChatResponse.model_validate,
+            # Fallback replies aren't kept, so the next retry tries the chat service again
+            keep=lambda result: result.data.get("reply_text") not in (CHAT_UNAVAILABLE_REPLY, CHAT_ERROR_REPLY)
+        )
+    except IdempotencyConflict:
+        raise HTTPException(
+            status_code=422,
+            detail=f"{IDEMPOTENCY_HEADER} was already used for a different request"
+        )
+    except IdempotencyInProgress:
+        raise HTTPException(
+            status_code=409,
+            detail=f"A request with this {IDEMPOTENCY_HEADER} is still in progress"
+        )
+    if replayed:
+        logger.info(f"Replayed voice turn for user {user_id} (idempotency key {idempotency_key})")
+        response.headers[REPLAYED_HEADER] = "true"
+    return result
+
+
+async def _process_voice_turn(
+    request: VoiceChatRequest,
+    http_request: Request,
+    user_id: str,
+    idempotency_key: Optional[str] = None
+) -> VoiceChatResponse:
+    """STT -> chat service -> response for one voice turn"""
     try:
         # 1. Decode Audio
         try:
@@ -150,11 +258,18 @@ async def voice_chat(
             temp_audio_path = temp_audio.name
         
         try:
-            transcript = transcriber.transcribe(temp_audio_path)
+            transcript = await run_in_threadpool(transcriber.transcribe, temp_audio_path)
             if transcript.status == aai.TranscriptStatus.error:
                  logger.error(f"AssemblyAI Error: {transcript.error}")
                  raise Exception(f"Transcript failed: {transcript.error}")
             text_input = transcript.text or ""
+            usage_writer.record(
+                "assemblyai",
+                endpoint_used="/api/voice/chat:transcribe",
+                user_id=user_id,
+                characters_processed=len(text_input),
+                cost_incurred=estimate_stt_cost(transcript.audio_duration)
+            )
         finally:
              if os.path.exists(temp_audio_path):
                  os.unlink(temp_audio_path)
@@ -180,19 +295,29 @@ async def voice_chat(
         CHECKIN_CHAT_URL = os.getenv("CHECKIN_CHAT_URL", "http://localhost:8000")
         
         try:
-            import requests
             chat_payload = {
                 "user_id": user_id,
                 "text": text_input,
                 "session_id": request.session_id
             }
-            
-            # Call the chat service
-            chat_response = requests.post(
-                f"{CHECKIN_CHAT_URL}/api/daily_checkin/chat",
-                json=chat_payload,
-                timeout=30
-            )
+
+            headers = {IDEMPOTENCY_HEADER: idempotency_key} if idempotency_key else None
+
+            if not idempotency_key and await http_request.is_disconnected():
+                raise ClientDisconnected()
+
+            # Call the chat service, abandoning the call if our caller goes
+            # away (unless a retry may still come back for the result)
+            async with httpx.AsyncClient(timeout=30) as client:
+                chat_call = client.post(
+                    f"{CHECKIN_CHAT_URL}/api/daily_checkin/chat",
+                    json=chat_payload,
+                    headers=headers
+                )
+                if idempotency_key:
+                    chat_response = await chat_call
+                else:
+                    chat_response = await run_until_disconnected(http_request, chat_call)
             
             if chat_response.status_code == 200:
                 chat_data = chat_response.json()
@@ -202,11 +327,13 @@ async def voice_chat(
                     request.session_id = chat_data.get("session_id")
             else:
                 logger.error(f"Chat service returned {chat_response.status_code}: {chat_response.text}")
-                reply_text = "I'm having trouble connecting to my thought process right now."
-                
+                reply_text = CHAT_UNAVAILABLE_REPLY
+
+        except ClientDisconnected:
+            raise
         except Exception as e:
             logger.error(f"Error calling chat service: {e}")
-            reply_text = "I'm sorry, I encountered an error processing your request."
+            reply_text = CHAT_ERROR_REPLY
         
         # 4. Construct Response
         return VoiceChatResponse(
@@ -226,6 +353,9 @@ async def voice_chat(
             }
         )
 
+    except ClientDisconnected:
+        logger.info(f"Voice turn for user {user_id} cancelled by client")
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
     except Exception as e:
         logger.exception(f"Voice processing critical error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,232 @@
+"""
+Idempotency-Key handling for voice turns.
+Keys are stored in the shared idempotency_keys table (scope 'voice'; see
+sama-wellness-backend-main/migrations/011), so a retried voice request is
+recognised on any replica. The first request inserts the key as 'pending'
+with a lease and runs the turn; a retry on the same replica joins its
+in-process future, a retry elsewhere waits for the stored response
+(IDEMPOTENCY_WAIT_SECONDS, then IdempotencyInProgress) and replays it.
+No second transcription or chat call either way. Failures, and results
+the caller doesn't want kept, are not stored. A key whose replica died
+mid-turn is taken over once its lease expires.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+from sqlalchemy import create_engine, text
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+IDEMPOTENCY_SCOPE = "voice"
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "90"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60"))
+IDEMPOTENCY_POLL_SECONDS = float(os.getenv("IDEMPOTENCY_POLL_SECONDS", "0.5"))
+PURGE_INTERVAL_SECONDS = 300
+
+# Inserts the key, or takes over an expired row or a pending row whose lease
+# ran out (same request only); no row back means someone else holds the key
+CLAIM_KEY_SQL = text("""
+    INSERT INTO idempotency_keys
+        (scope, user_id, idempotency_key, request_fingerprint, status, locked_until, expires_at)
+    VALUES
+        (:scope, :user_id, :key, :fingerprint, 'pending',
+         now() + make_interval(secs => :lease_seconds), now() + make_interval(secs => :ttl_seconds))
+    ON CONFLICT (scope, user_id, idempotency_key) DO UPDATE
+    SET request_fingerprint = EXCLUDED.request_fingerprint,
+        status = 'pending',
+        response = NULL,
+        locked_until = EXCLUDED.locked_until,
+        created_at = now(),
+        expires_at = EXCLUDED.expires_at
+    WHERE idempotency_keys.expires_at < now()
+       OR (idempotency_keys.status = 'pending'
+           AND idempotency_keys.locked_until < now()
+           AND idempotency_keys.request_fingerprint = EXCLUDED.request_fingerprint)
+    RETURNING idempotency_key
+""")
+
+GET_KEY_SQL = text("""
+    SELECT request_fingerprint, status, response
+    FROM idempotency_keys
+    WHERE scope = :scope AND user_id = :user_id AND idempotency_key = :key
+      AND expires_at >= now()
+""")
+
+COMPLETE_KEY_SQL = text("""
+    UPDATE idempotency_keys
+    SET status = 'completed', response = CAST(:response AS jsonb), locked_until = NULL
+    WHERE scope = :scope AND user_id = :user_id AND idempotency_key = :key
+      AND status = 'pending'
+""")
+
+RELEASE_KEY_SQL = text("""
+    DELETE FROM idempotency_keys
+    WHERE scope = :scope AND user_id = :user_id AND idempotency_key = :key
+      AND status = 'pending'
+""")
+
+PURGE_KEYS_SQL = text("DELETE FROM idempotency_keys WHERE expires_at < now()")
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a request with a different body"""
+
+
+class IdempotencyInProgress(Exception):
+    """The key's request is still running elsewhere after the wait limit"""
+
+
+def request_fingerprint(*parts: Any) -> str:
+    """Stable hash of the request fields that identify a turn"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class IdempotencyStore:
+    """Durable key records plus in-process futures of the turns this replica runs"""
+
+    def __init__(
+        self,
+        scope: str = IDEMPOTENCY_SCOPE,
+        ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS,
+        lease_seconds: float = IDEMPOTENCY_LEASE_SECONDS,
+        wait_seconds: float = IDEMPOTENCY_WAIT_SECONDS,
+        poll_seconds: float = IDEMPOTENCY_POLL_SECONDS
+    ):
+        self.scope = scope
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self.wait_seconds = wait_seconds
+        self.poll_seconds = poll_seconds
+        # (user_id, key) -> (fingerprint, future)
+        self._in_flight: Dict[Tuple[str, str], tuple] = {}
+        self._tasks: set = set()
+        self._engine = None
+        self._next_purge = 0.0
+
+    async def run(
+        self,
+        user_id: str,
+        key: str,
+        fingerprint: str,
+        work: Callable[[], Awaitable[Any]],
+        encode: Callable[[Any], dict] = lambda result: result,
+        decode: Callable[[dict], Any] = lambda response: response,
+        keep: Callable[[Any], bool] = lambda result: True
+    ) -> tuple:
+        """
+        Run work() once per (user_id, key) across replicas; returns (result,
+        replayed). Results for which keep() is False are returned but not
+        stored, so the next retry runs the work again.
+        """
+        local_key = (str(user_id), key)
+        entry = self._in_flight.get(local_key)
+        if entry is not None:
+            if entry[0] != fingerprint:
+                raise IdempotencyConflict()
+            result, _ = await asyncio.shield(entry[1])
+            return result, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[local_key] = (fingerprint, future)
+        # Detached so the turn survives the first caller going away
+        task = asyncio.create_task(self._execute(local_key, fingerprint, work, encode, decode, keep, future))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return await asyncio.shield(future)
+
+    async def _execute(self, local_key, fingerprint, work, encode, decode, keep, future: asyncio.Future):
+        try:
+            outcome = await self._run_once(local_key, fingerprint, work, encode, decode, keep)
+        except asyncio.CancelledError:
+            self._in_flight.pop(local_key, None)
+            future.cancel()
+            raise
+        except Exception as e:
+            self._in_flight.pop(local_key, None)
+            future.set_exception(e)
+            future.exception()  # Mark retrieved when nobody is waiting any more
+            return
+        self._in_flight.pop(local_key, None)
+        future.set_result(outcome)
+
+    async def _run_once(self, local_key, fingerprint, work, encode, decode, keep) -> tuple:
+        user_id, key = local_key
+        params = {"scope": self.scope, "user_id": user_id, "key": key}
+        deadline = time.monotonic() + self.wait_seconds
+        while not await run_in_threadpool(self._claim, params, fingerprint):
+            row = await run_in_threadpool(self._execute_sql, GET_KEY_SQL, params)
+            if row is not None:
+                if row["request_fingerprint"] != fingerprint:
+                    raise IdempotencyConflict()
+                if row["status"] == "completed":
+                    response = row["response"]
+                    return decode(json.loads(response) if isinstance(response, str) else response), True
+            # Running on another replica (or released/expired just now: claim again)
+            if time.monotonic() >= deadline:
+                raise IdempotencyInProgress()
+            await asyncio.sleep(self.poll_seconds)
+
+        try:
+            result = await work()
+        except Exception:
+            await self._release(params)
+            raise
+        if not keep(result):
+            await self._release(params)
+            return result, False
+        try:
+            await run_in_threadpool(
+                self._execute_sql, COMPLETE_KEY_SQL, {**params, "response": json.dumps(encode(result), default=str)}
+            )
+        except Exception as e:
+            # The turn already ran; a retry after the lease expires runs it again
+            logger.error(f"Failed to store idempotent voice response for key {key}: {e}")
+        return result, False
+
+    async def _release(self, params: dict):
+        try:
+            await run_in_threadpool(self._execute_sql, RELEASE_KEY_SQL, params)
+        except Exception as e:
+            logger.error(f"Failed to release idempotency key {params['key']}: {e}")
+
+    def _connect(self):
+        if self._engine is None:
+            database_url = os.getenv("DATABASE_URL")
+            if not database_url:
+                raise RuntimeError("DATABASE_URL not configured")
+            self._engine = create_engine(database_url, pool_pre_ping=True)
+        return self._engine.begin()
+
+    def _claim(self, params: dict, fingerprint: str) -> bool:
+        with self._connect() as connection:
+            if time.monotonic() >= self._next_purge:
+                self._next_purge = time.monotonic() + PURGE_INTERVAL_SECONDS
+                connection.execute(PURGE_KEYS_SQL)
+            claimed = connection.execute(CLAIM_KEY_SQL, {
+                **params,
+                "fingerprint": fingerprint,
+                "lease_seconds": self.lease_seconds,
+                "ttl_seconds": self.ttl_seconds
+            }).first()
+        return claimed is not None
+
+    def _execute_sql(self, statement, params: dict) -> Optional[dict]:
+        with self._connect() as connection:
+            result = connection.execute(statement, params)
+            row = result.mappings().first() if result.returns_rows else None
+        return dict(row) if row is not None else None
+
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,156 @@
+"""
+Usage and cost accounting for checkin-voice provider calls.
+Records are buffered in memory and flushed to the shared api_usage_metrics
+table in bulk by a background task, so accounting adds no DB round trip
+to the voice request path. Rows the DB rejects are isolated by bisecting the
+batch and dropped; a batch that fails otherwise is retried on later ticks
+and dropped after USAGE_METRICS_MAX_RETRIES attempts.
+"""
+
+import asyncio
+import os
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DataError, IntegrityError, ProgrammingError
+
+# AssemblyAI bills per hour of audio
+ASSEMBLYAI_COST_PER_HOUR = float(os.getenv("ASSEMBLYAI_COST_PER_HOUR", "0.37"))
+FLUSH_INTERVAL_SECONDS = float(os.getenv("USAGE_METRICS_FLUSH_INTERVAL_SECONDS", "5"))
+MAX_BUFFER = int(os.getenv("USAGE_METRICS_MAX_BUFFER", "10000"))
+MAX_RETRIES = int(os.getenv("USAGE_METRICS_MAX_RETRIES", "5"))
+
+# Errors caused by the rows themselves: retrying the same batch can't succeed
+ROW_ERRORS = (IntegrityError, DataError, ProgrammingError)
+
+INSERT_USAGE_SQL = text("""
+    INSERT INTO api_usage_metrics
+        (api_provider, endpoint_used, tokens_used, characters_processed, cost_incurred, timestamp, user_id)
+    VALUES
+        (:api_provider, :endpoint_used, :tokens_used, :characters_processed, :cost_incurred, :timestamp, :user_id)
+""")
+
+
+def estimate_stt_cost(audio_seconds: Optional[float]) -> float:
+    """Estimated AssemblyAI cost (USD) for a transcription"""
+    return round((audio_seconds or 0) / 3600 * ASSEMBLYAI_COST_PER_HOUR, 4)
+
+
+class UsageMetricsWriter:
+    """Bounded buffer of usage records with a periodic bulk insert"""
+
+    def __init__(
+        self,
+        max_buffer: int = MAX_BUFFER,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS,
+        max_retries: int = MAX_RETRIES
+    ):
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._buffer = deque(maxlen=max_buffer)
+        # (failed attempts, batch) waiting to be retried
+        self._retry = deque()
+        self._retry_rows = 0
+        self._task: Optional[asyncio.Task] = None
+        self._engine = None
+        self.dropped = 0
+
+    def record(
+        self,
+        api_provider: str,
+        endpoint_used: Optional[str] = None,
+        user_id: Optional[str] = None,
+        tokens_used: Optional[int] = None,
+        characters_processed: Optional[int] = None,
+        cost_incurred: Optional[float] = None
+    ):
+        """Queue one usage record; never blocks and never touches the DB"""
+        self._buffer.append({
+            "api_provider": api_provider,
+            "endpoint_used": endpoint_used,
+            "user_id": user_id,
+            "tokens_used": tokens_used,
+            "characters_processed": characters_processed,
+            "cost_incurred": cost_incurred,
+            "timestamp": datetime.utcnow()
+        })
+
+    async def flush(self) -> int:
+        """
+        Write all buffered records in one bulk insert, then retry earlier
+        failed batches; returns rows written
+        """
+        retries = [self._retry.popleft() for _ in range(len(self._retry))]
+        self._retry_rows = 0
+        total = 0
+        if self._buffer:
+            batch = [self._buffer.popleft() for _ in range(len(self._buffer))]
+            total += await self._write(batch, attempts=0)
+        for attempts, batch in retries:
+            total += await self._write(batch, attempts)
+        return total
+
+    async def _write(self, batch: list, attempts: int) -> int:
+        """Insert one batch, bisecting on row errors; returns rows written"""
+        try:
+            await run_in_threadpool(self._write_batch, batch)
+            return len(batch)
+        except ROW_ERRORS as e:
+            if len(batch) == 1:
+                self.dropped += 1
+                logger.error(f"Dropped usage metric rejected by the DB ({batch[0]['api_provider']}): {e}")
+                return 0
+            middle = len(batch) // 2
+            return await self._write(batch[:middle], attempts) + await self._write(batch[middle:], attempts)
+        except Exception as e:
+            attempts += 1
+            if attempts >= self.max_retries:
+                self.dropped += len(batch)
+                logger.error(f"Dropped {len(batch)} usage metrics after {attempts} failed flushes: {e}")
+                return 0
+            self._retry.append((attempts, batch))
+            self._retry_rows += len(batch)
+            while self._retry_rows > self._buffer.maxlen:
+                _, oldest = self._retry.popleft()
+                self._retry_rows -= len(oldest)
+                self.dropped += len(oldest)
+                logger.error(f"Dropped {len(oldest)} usage metrics: retry backlog full")
+            logger.error(f"Failed to flush {len(batch)} usage metrics (attempt {attempts}): {e}")
+            return 0
+
+    def _write_batch(self, batch: list):
+        if self._engine is None:
+            database_url = os.getenv("DATABASE_URL")
+            if not database_url:
+                raise RuntimeError("DATABASE_URL not configured")
+            self._engine = create_engine(database_url, pool_pre_ping=True)
+        with self._engine.begin() as connection:
+            connection.execute(INSERT_USAGE_SQL, batch)
+
+    def start(self):
+        """Start the background flush loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write whatever is left"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+usage_writer = UsageMetricsWriter()
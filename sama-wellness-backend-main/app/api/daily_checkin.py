@@ -1,33 +1,64 @@
 # app/api/daily_checkin.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from datetime import datetime
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Optional
+import asyncio
+import base64
 import logging
+import time
 import uuid
-from .llm import get_llm_response
+from .llm import get_llm_response, stream_llm_response
 
-from app.database.connection import get_db
+from app.database.connection import get_db, AsyncSessionLocal
 from app.services.database_service import (
-    get_user_profile,
-    get_user_preferences,
-    get_user_dosha_type_from_preferences,
-    get_conversation_history,
+    get_user_profile_context,
+    get_conversation_history_page,
+    list_conversation_sessions,
     create_conversation_session,
-    get_conversation_session,
     save_conversation_message,
-    get_session_messages,
-    get_recent_messages_last_two_days,
-    get_prakriti_bikriti_and_history,
-    get_relevant_knowledge
+    save_checkin_turn,
+    record_turn_progress,
+    record_turn_emotion,
+    load_checkin_context,
+    get_relevant_knowledge,
+    get_knowledge_by_ids
 )
-from app.services.prompt_builder import build_checkin_prompt
+from app.services.prompt_builder import build_checkin_prompt, is_crisis_message
+from app.services.llm_scheduler import LLMPriority
+from app.services.cancellation import run_until_disconnected, ClientDisconnected, CLIENT_CLOSED_REQUEST
+from app.services.fast_path import classify_trivial_turn, build_fast_reply, user_local_now
+from app.config import settings
 from app.services.emotion_service import get_emotion_service
+from app.services.timing import StageTimer, get_latency_recorder
+from app.services.session_locks import session_lock
+from app.services.post_response import OutboxJob, get_post_response_queue
+from app.services.export_service import stream_user_export
+from app.services.knowledge_index import get_knowledge_index
+from app.services.knowledge_catalog import get_knowledge_catalog
+from app.services.embedding_index import get_embedding_index
+from app.services.cache import get_user_context_cache
+from app.services.idempotency import (
+    get_idempotency_store,
+    request_fingerprint,
+    IdempotencyConflict,
+    IdempotencyInProgress,
+    KeyCompletion,
+    CHECKIN_SCOPE,
+    IDEMPOTENCY_HEADER,
+    REPLAYED_HEADER
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+SERVER_TIMING_HEADER = "Server-Timing"
+
 
 # Request/Response Models
 class DailyCheckinRequest(BaseModel):
@@ -48,22 +79,128 @@ class CheckinResponse(BaseModel):
 @router.post("/chat", response_model=CheckinResponse)
 async def daily_checkin(
     request: DailyCheckinRequest,
+    http_request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
     db: AsyncSession = Depends(get_db)
 ):
+    """
+    Process a check-in turn (see _run_checkin).
+
+    With an Idempotency-Key header the turn runs at most once per user and
+    key on any replica: a retry waits for the original request while it is
+    still running (409 after IDEMPOTENCY_WAIT_SECONDS), or gets its stored
+    response afterwards (IDEMPOTENCY_TTL_SECONDS). The response is stored
+    in the turn's own transaction. Keyed turns aren't cancelled when the
+    client disconnects, so a retry can still collect the reply.
+    """
+    if not idempotency_key:
+        return await _process_checkin(request, http_request, db, response)
+
+    async def run_keyed():
+        # Own session: the work may outlive the request that started it
+        async with AsyncSessionLocal() as keyed_db:
+            return await _process_checkin(
+                request, http_request, keyed_db, response,
+                cancel_on_disconnect=False, idempotency_key=idempotency_key
+            )
+
+    try:
+        result, replayed = await get_idempotency_store().run(
+            request.user_id,
+            idempotency_key,
+            request_fingerprint(request.model_dump()),
+            run_keyed,
+            encode=lambda result: result.model_dump(mode="json"),
+            decode=CheckinResponse.model_validate
+        )
+    except IdempotencyConflict:
+        raise HTTPException(
+            status_code=422,
+            detail=f"{IDEMPOTENCY_HEADER} was already used for a different request"
+        )
+    except IdempotencyInProgress:
+        raise HTTPException(
+            status_code=409,
+            detail=f"A request with this {IDEMPOTENCY_HEADER} is still in progress"
+        )
+    if replayed:
+        logger.info(f"Replayed check-in for user {request.user_id} (idempotency key {idempotency_key})")
+        response.headers[REPLAYED_HEADER] = "true"
+    return result
+
+
+async def _process_checkin(
+    request: DailyCheckinRequest,
+    http_request: Request,
+    db: AsyncSession,
+    response: Optional[Response] = None,
+    cancel_on_disconnect: bool = True,
+    idempotency_key: Optional[str] = None
+) -> CheckinResponse:
+    """
+    Run a turn (one at a time per existing session on this replica) and
+    record its stage timings: latency histograms, a per-turn timing record
+    (both on /metrics) and a Server-Timing header on the response.
+    """
+    timer = StageTimer("checkin")
+    outcome = "error"
+    try:
+        if not request.session_id:
+            result = await _run_checkin(request, http_request, db, timer, cancel_on_disconnect, idempotency_key)
+        else:
+            lock = session_lock(request.session_id)
+            await timer.run("session_lock", lock.acquire())
+            try:
+                result = await _run_checkin(request, http_request, db, timer, cancel_on_disconnect, idempotency_key)
+            finally:
+                lock.release()
+        outcome = "ok"
+        return result
+    except HTTPException as e:
+        outcome = str(e.status_code)
+        raise
+    finally:
+        get_latency_recorder().observe(timer, user_id=request.user_id, outcome=outcome)
+        if response is not None:
+            response.headers[SERVER_TIMING_HEADER] = timer.server_timing()
+
+
+async def _run_checkin(
+    request: DailyCheckinRequest,
+    http_request: Request,
+    db: AsyncSession,
+    timer: StageTimer,
+    cancel_on_disconnect: bool,
+    idempotency_key: Optional[str] = None
+) -> CheckinResponse:
     """
     Process daily check-in conversation with personalized response using Supabase schema
     
-    Flow:
-    1. Validate request
-    2. Fetch user profile from DB (UUID-based)
-    3. Get or create conversation session
-    4. Fetch conversation history for this session
-    5. Analyze emotion from user text (BERT)
-    6. Fetch relevant Ayurveda knowledge (RAG)
-    7. Build personalized prompt with context
-    8. Call LLM for AI response
-    9. Save both user message and AI response + emotion analysis
-    10. Return response with session_id
+    Flow (independent stages overlap — latency tracks the longest branch):
+    1. Validate request; classify trivial turns (pure text, no I/O)
+    2. Start in parallel: emotion analysis (BERT, worker thread) and
+       knowledge retrieval (RAG, its own DB session)
+    3. Meanwhile load user profile, preferences, dosha context, session
+       history and last 2 days of messages (one query, see load_checkin_context)
+    4. Get or create conversation session
+    5. Build personalized prompt as soon as context + knowledge are ready
+    6. Call LLM for AI response
+    7. Save both user message and AI response in one transaction, together
+       with the outbox jobs of step 8 and, for a keyed turn, the response
+       stored with its Idempotency-Key
+    8. After the response: streak and daily progress, and (separately)
+       emotion analysis persistence and dosha tracking (see
+       app.services.post_response)
+    9. Return response with session_id
+
+    If the client disconnects while waiting for the LLM (and
+    cancel_on_disconnect is set), the call is cancelled and only the user
+    message is stored, marked as a cancelled turn.
+
+    Trivial turns (greetings, acknowledgements, closings) take a fast path
+    after step 4: a personalized template reply, no emotion analysis,
+    retrieval or LLM call. Not in sessions with a recent crisis message.
     """
     
     logger.info(f"Processing daily check-in for user {request.user_id}")
@@ -71,137 +208,436 @@ async def daily_checkin(
     # Step 1: Validate request
     if not request.user_id or not request.text:
         raise HTTPException(status_code=400, detail="user_id and text are required")
-    
-    # Step 2: Fetch user data from database
-    user = await get_user_profile(db, request.user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail=f"User {request.user_id} not found")
-    
-    logger.info(f"Found user profile: {user.full_name}")
-    
-    # Fetch user preferences and dosha info
-    preferences = await get_user_preferences(db, request.user_id)
-    dosha_type_name = await get_user_dosha_type_from_preferences(db, request.user_id)
-    
-    logger.info(f"Fetched preferences and dosha for user {request.user_id}")
-    
-    # Step 3: Get or create conversation session
-    session = None
-    if request.session_id:
-        # Try to find existing session
-        session = await get_conversation_session(db, request.session_id, request.user_id)
-        if not session:
-            raise HTTPException(status_code=404, detail=f"Session {request.session_id} not found for user")
-    else:
-        # Create new session
-        session = await create_conversation_session(db, request.user_id, 'checkin')
-    
-    session_id = str(session.session_id)
-    logger.info(f"Using session {session_id}")
-    
-    # Step 4: Fetch conversation history for this session
-    conversation_history = await get_session_messages(db, session_id)
-    logger.info(f"Session {session_id} has {len(conversation_history)} messages")
-    
-    # Step 5: Analyze emotion using BERT
-    emotion_service = get_emotion_service()
-    emotion_analysis = emotion_service.analyze_emotion(request.text)
-    logger.info(f"Emotion analysis: {emotion_analysis['primary_emotion']} → {emotion_analysis['dosha']} dosha")
 
-    # Fetch recent messages across all sessions for broader context
-    recent_messages = await get_recent_messages_last_two_days(db, request.user_id)
-    logger.info(f"Fetched {len(recent_messages)} messages from last 2 days for user {request.user_id}")
+    trivial_kind = classify_trivial_turn(request.text) if settings.FAST_PATH_ENABLED else None
+
+    # Step 2: Stages that only need the message text start right away
+    emotion_task = knowledge_task = None
+    if not trivial_kind:
+        emotion_task, knowledge_task = _start_turn_analysis(request.text, request.user_id, timer)
 
-    # Fetch dosha context (prakriti + bikriti + yesterday/today history)
-    dosha_context = await get_prakriti_bikriti_and_history(db, request.user_id)
-    
-    # Step 6: Fetch relevant Ayurveda knowledge (RAG)
-    relevant_knowledge = await get_relevant_knowledge(db, request.text)
-    logger.info(f"Found {len(relevant_knowledge)} relevant knowledge items")
-
-    # Step 7: Build personalized prompt with context
-    personalized_prompt = build_checkin_prompt(
-        user=user,
-        preferences=preferences,
-        dosha_type_name=dosha_type_name,
-        user_text=request.text,
-        conversation_history=conversation_history,
-        recent_messages=recent_messages,
-        dosha_context=dosha_context,
-        knowledge_context=relevant_knowledge
-    )
-    
-    logger.info(f"Built personalized prompt for user {request.user_id}")
-    logger.info(f"=== PROMPT BEING SENT TO LLM ===\n{personalized_prompt}\n=== END PROMPT ===")
-    
-    # Step 8: Call LLM
-    response_text = await get_llm_response(
-        messages=[{"role": "user", "content": personalized_prompt}]
-    )
-    
-    logger.info(f"Received LLM response for user {request.user_id}")
-    
-    # Step 9: Save messages to database
     try:
-        # Calculate sequence numbers
-        next_sequence = len(conversation_history) + 1
+        # Step 3: Load user, preferences, dosha context, session history and
+        # the last 2 days of messages in one round trip
+        context = await timer.run("context", load_checkin_context(db, request.user_id, request.session_id))
+        user = context.user
+        if not user:
+            raise HTTPException(status_code=404, detail=f"User {request.user_id} not found")
+        
+        logger.info(f"Found user profile: {user.full_name}")
+        
+        preferences = context.preferences
+        dosha_type_name = context.dosha_type_name
+        
+        # Step 4: Get or create conversation session
+        if request.session_id:
+            if not context.session_found:
+                raise HTTPException(status_code=404, detail=f"Session {request.session_id} not found for user")
+            session_id = request.session_id
+        else:
+            # Create new session
+            session = await timer.run("session", create_conversation_session(db, request.user_id, 'checkin'))
+            session_id = str(session.session_id)
+        
+        logger.info(f"Using session {session_id}")
 
-        # Save user message — returns the saved message with its message_id
-        user_msg = await save_conversation_message(
-            db=db,
-            session_id=session_id,
+        conversation_history = context.session_messages
+        logger.info(f"Session {session_id} has {len(conversation_history)} messages")
+
+        if trivial_kind and _crisis_in_session(conversation_history):
+            # "ok" or "thanks" after a crisis message still gets the full pipeline
+            trivial_kind = None
+            emotion_task, knowledge_task = _start_turn_analysis(request.text, request.user_id, timer)
+
+        # Fast path: greetings, thanks and goodbyes skip emotion analysis, RAG and the LLM
+        if trivial_kind:
+            return await _fast_path_checkin(
+                db, request, session_id, trivial_kind, preferences, dosha_type_name, timer, idempotency_key
+            )
+
+        recent_messages = context.recent_messages
+        logger.info(f"Loaded {len(recent_messages)} messages from last 2 days for user {request.user_id}")
+
+        relevant_knowledge = await _await_knowledge(
+            knowledge_task, request.text, context.dosha_context, emotion_task, timer
+        )
+        logger.info(f"Found {len(relevant_knowledge)} relevant knowledge items")
+
+        # Step 5: Build personalized prompt with context
+        with timer.stage("prompt"):
+            personalized_prompt = build_checkin_prompt(
+                user=user,
+                preferences=preferences,
+                dosha_type_name=dosha_type_name,
+                user_text=request.text,
+                conversation_history=conversation_history,
+                recent_messages=recent_messages,
+                dosha_context=context.dosha_context,
+                knowledge_context=relevant_knowledge
+            )
+        
+        logger.info(f"Built personalized prompt for user {request.user_id}")
+        logger.info(f"=== PROMPT BEING SENT TO LLM ===\n{personalized_prompt}\n=== END PROMPT ===")
+        
+        # Step 6: Call LLM (crisis turns go to the high-priority lane),
+        # cancelling it if the client goes away
+        priority = LLMPriority.CRISIS if is_crisis_message(request.text) else LLMPriority.INTERACTIVE
+        llm_call = get_llm_response(
+            messages=[{"role": "user", "content": personalized_prompt}],
+            priority=priority,
             user_id=request.user_id,
-            sequence_number=next_sequence,
-            transcript_text=request.text,
-            input_type='text'
+            endpoint=http_request.url.path
         )
+        try:
+            if cancel_on_disconnect:
+                if await http_request.is_disconnected():
+                    llm_call.close()
+                    raise ClientDisconnected()
+                llm_call = run_until_disconnected(http_request, llm_call)
+            response_text = await timer.run("llm", llm_call)
+        except ClientDisconnected:
+            await _record_cancelled_turn(db, request, session_id)
+            raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+        
+        logger.info(f"Received LLM response for user {request.user_id}")
 
-        # Save AI response message
-        await save_conversation_message(
-            db=db,
-            session_id=session_id,
+        checkin_response = CheckinResponse(
+            message=response_text,
             user_id=request.user_id,
-            sequence_number=next_sequence + 1,
-            ai_response_text=response_text
+            session_id=session_id,
+            timestamp=datetime.now()
         )
 
-        # Save emotion analysis — must use message_id (NOT NULL FK in schema)
-        from app.models.emotion_analysis import EmotionAnalysis
+        # Step 7: Save both messages in one transaction; the client gets its
+        # reply once they are committed
+        try:
+            await timer.run("persist", save_checkin_turn(
+                db=db,
+                session_id=session_id,
+                user_id=request.user_id,
+                transcript_text=request.text,
+                ai_response_text=response_text,
+                # Step 8: emotion analysis, dosha tracking, streak and daily
+                # progress are outbox jobs committed with the turn and run
+                # after the response (the emotion job awaits the emotion task)
+                post_response_jobs=_turn_jobs(request.user_id, request.text, emotion_task, timer, date.today()),
+                idempotency=_key_completion(idempotency_key, checkin_response)
+            ))
+            logger.info(f"Saved conversation messages for user {request.user_id}")
+        except Exception as e:
+            logger.error(f"Error saving conversation messages: {e}")
+            raise HTTPException(status_code=500, detail="Failed to save conversation")
+        emotion_task = None  # Owned by the emotion job now
+    finally:
+        # Don't leave overlapped stages running after an early exit
+        for task in (emotion_task, knowledge_task):
+            if task is not None and not task.done():
+                task.cancel()
+        logger.info(f"Check-in stage timings for user {request.user_id}: {timer.summary()}")
+    
+    # Step 9: Return response
+    return checkin_response
 
-        # Map emotion_service output to real schema column names
-        all_emotions_data = emotion_analysis.get('all_emotions', {})
-        if isinstance(all_emotions_data, list):
-            # Convert list to dict if needed
-            all_emotions_data = {e: 0.0 for e in all_emotions_data} if all_emotions_data else {}
 
-        emotion_record = EmotionAnalysis(
-            message_id=user_msg.message_id,          # Required NOT NULL FK
-            user_id=request.user_id,
-            primary_emotion=emotion_analysis['primary_emotion'],
-            primary_confidence=emotion_analysis.get('emotion_confidence', 0.0),
-            all_emotions=all_emotions_data,           # JSONB, NOT NULL
-            emotion_intensity=None,                   # Optional
-            recommended_dosha_focus=emotion_analysis.get('dosha'),
-            bert_model_version='bert-v1',
-            processing_time_ms=0
+def _key_completion(idempotency_key: Optional[str], response: CheckinResponse) -> Optional[KeyCompletion]:
+    """The keyed turn's response, stored with its Idempotency-Key in the turn's transaction"""
+    if not idempotency_key:
+        return None
+    return KeyCompletion(CHECKIN_SCOPE, response.user_id, idempotency_key, response.model_dump(mode="json"))
+
+
+def _start_turn_analysis(text: str, user_id: str, timer: StageTimer) -> tuple:
+    """
+    Start emotion analysis and knowledge retrieval, which only need the
+    message text. Returns (emotion_task, knowledge_task).
+
+    When the embedding index was built with the emotion detector's encoder,
+    emotion analysis also returns the message's pooled BERT embedding and
+    retrieval waits for it instead of encoding the text again. With a ready
+    in-process index there is no knowledge task: ranking takes microseconds
+    and runs once the user's doshas are loaded (see _await_knowledge).
+    """
+    embedding_index = get_embedding_index()
+    reuse_embedding = (
+        settings.KNOWLEDGE_RETRIEVAL_BACKEND == "embedding"
+        and embedding_index.ready
+        and embedding_index.uses_emotion_encoder
+    )
+    emotion_service = get_emotion_service()
+    emotion_task = asyncio.create_task(
+        timer.run("emotion", asyncio.to_thread(emotion_service.analyze_emotion, text, reuse_embedding))
+    )
+    if settings.KNOWLEDGE_RETRIEVAL_BACKEND == "memory" and get_knowledge_index().ready:
+        return emotion_task, None
+    if reuse_embedding:
+        knowledge = _knowledge_from_emotion_embedding(text, user_id, emotion_task)
+    else:
+        knowledge = _fetch_relevant_knowledge(text, user_id)
+    knowledge_task = asyncio.create_task(timer.run("knowledge", knowledge))
+    return emotion_task, knowledge_task
+
+
+async def _await_knowledge(
+    knowledge_task: Optional[asyncio.Task],
+    text: str,
+    dosha_context: dict,
+    emotion_task: Optional[asyncio.Task],
+    timer: StageTimer
+) -> list:
+    """
+    Relevant knowledge for the turn: the knowledge task's result, or the
+    in-process index ranked with the user's prakriti and bikriti and the
+    detected emotion. Emotion analysis usually runs past the context load,
+    so ranking waits up to KNOWLEDGE_EMOTION_WAIT_MS for it and ranks
+    without the emotion if it isn't ready by then.
+    """
+    if knowledge_task is not None:
+        return await knowledge_task
+
+    with timer.stage("knowledge"):
+        emotion = await _detected_emotion(emotion_task, settings.KNOWLEDGE_EMOTION_WAIT_MS / 1000)
+        bikriti = (dosha_context or {}).get("bikriti") or {}
+        return get_knowledge_index().search(
+            text,
+            prakriti=(dosha_context or {}).get("prakriti"),
+            bikriti=bikriti.get("dosha"),
+            emotion=emotion,
+            content_types=settings.KNOWLEDGE_CONTENT_TYPES,
+            now=user_local_now()
         )
-        db.add(emotion_record)
-        await db.commit()
 
-        logger.info(f"Saved emotion analysis to database (message_id={user_msg.message_id})")
-        logger.info(f"Saved conversation messages for user {request.user_id}")
-    except Exception as e:
-        logger.error(f"Error saving conversation messages: {e}")
-        raise HTTPException(status_code=500, detail="Failed to save conversation")
-    
-    # Step 10: Return response
-    return CheckinResponse(
+
+async def _detected_emotion(emotion_task: Optional[asyncio.Task], timeout: float) -> Optional[str]:
+    """Primary emotion of the turn if analysis finishes within timeout (never cancels it)"""
+    if emotion_task is None:
+        return None
+    try:
+        # Shielded: the emotion job still needs the analysis after a timeout
+        emotion = await asyncio.wait_for(asyncio.shield(emotion_task), timeout=timeout)
+    except asyncio.TimeoutError:
+        return None
+    except Exception:
+        # Failed analysis is handled by the emotion job
+        return None
+    return emotion.get("primary_emotion")
+
+
+def _cached_prakriti(user_id: Optional[str]) -> Optional[str]:
+    """The user's dosha if their profile is already cached (never waits on the DB)"""
+    profile = get_user_context_cache().get(str(user_id)) if user_id else None
+    return profile.prakriti if profile else None
+
+
+async def _knowledge_from_emotion_embedding(text: str, user_id: str, emotion_task: asyncio.Task) -> list:
+    """Embedding retrieval using the query embedding produced by emotion analysis"""
+    # Shielded: cancelling retrieval must not cancel the emotion analysis it shares
+    emotion = await asyncio.shield(emotion_task)
+    # Popped so the array doesn't travel on with the emotion result
+    embedding = emotion.pop("embedding", None)
+    if embedding is None:
+        # Keyword fallback detection has no embedding
+        return await _fetch_relevant_knowledge(text, user_id)
+
+    knowledge_ids = get_embedding_index().search_vector(
+        embedding, dosha=_cached_prakriti(user_id), emotion=emotion.get("primary_emotion")
+    )
+    return await _knowledge_entries(knowledge_ids)
+
+
+async def _knowledge_entries(knowledge_ids: list) -> list:
+    """Catalog entries for the ids, in order; ids it doesn't have yet are read from the DB"""
+    catalog = get_knowledge_catalog()
+    entries, missing = catalog.get_many(knowledge_ids)
+    if not missing:
+        return entries
+    async with AsyncSessionLocal() as knowledge_db:
+        fetched = catalog.resolve(await get_knowledge_by_ids(knowledge_db, missing))
+    by_id = {entry.knowledge_id: entry for entry in entries + fetched}
+    return [by_id[knowledge_id] for knowledge_id in knowledge_ids if knowledge_id in by_id]
+
+
+async def _fetch_relevant_knowledge(user_text: str, user_id: Optional[str] = None) -> list:
+    """
+    Knowledge retrieval: from the in-process BM25 index once it's built
+    (memory backend) or from the embedding index once it's loaded (embedding
+    backend), otherwise full-text search. Runs on its own session so it can
+    overlap the main DB load. Returns knowledge catalog entries, whose prompt
+    snippets are already rendered.
+    """
+    backend = settings.KNOWLEDGE_RETRIEVAL_BACKEND
+    knowledge_index = get_knowledge_index()
+    if backend == "memory" and knowledge_index.ready:
+        return knowledge_index.search(user_text)
+
+    embedding_index = get_embedding_index()
+    if backend == "embedding" and embedding_index.ready:
+        # Filter by the user's dosha when their profile is already cached;
+        # the context query is still running, so don't wait for it
+        knowledge_ids = await asyncio.to_thread(
+            embedding_index.search, user_text, dosha=_cached_prakriti(user_id)
+        )
+        return await _knowledge_entries(knowledge_ids)
+
+    async with AsyncSessionLocal() as knowledge_db:
+        items = await get_relevant_knowledge(knowledge_db, user_text)
+    return get_knowledge_catalog().resolve(items)
+
+
+# Outbox job types for the writes that follow a turn (see app.services.post_response)
+TURN_PROGRESS_JOB = "checkin_turn_progress"
+TURN_EMOTION_JOB = "checkin_turn_emotion"
+
+
+@dataclass(eq=False)
+class _EmotionJobContext:
+    """The turn's running emotion analysis, handed to its job on this replica"""
+    task: asyncio.Task
+    timer: StageTimer
+
+
+def _turn_jobs(
+    user_id: str,
+    text: str,
+    emotion_task: Optional[asyncio.Task],
+    timer: Optional[StageTimer],
+    day: date
+):
+    """post_response_jobs builder for save_checkin_turn: progress, plus emotion unless fast-path"""
+    def build(user_message_id: str) -> list:
+        jobs = [OutboxJob(TURN_PROGRESS_JOB, {"user_id": str(user_id), "day": day.isoformat()})]
+        if emotion_task is not None:
+            jobs.append(OutboxJob(
+                TURN_EMOTION_JOB,
+                {"user_id": str(user_id), "message_id": user_message_id, "text": text, "day": day.isoformat()},
+                context=_EmotionJobContext(emotion_task, timer)
+            ))
+        return jobs
+    return build
+
+
+async def _record_turn_progress(db: AsyncSession, payload: dict, context):
+    """Post-response job: streak and daily conversation count"""
+    await record_turn_progress(db, payload["user_id"], date.fromisoformat(payload["day"]))
+
+
+async def _record_turn_emotion(db: AsyncSession, payload: dict, context: Optional[_EmotionJobContext]):
+    """
+    Post-response job: persist emotion analysis and update dosha tracking and
+    daily progress. Uses the turn's emotion task when it ran on this replica,
+    otherwise (after a restart, or if it failed) analyses the text again.
+    """
+    emotion_analysis = None
+    processing_ms = None
+    task = context.task if context is not None else None
+    if task is not None and not task.cancelled():
+        try:
+            emotion_analysis = await task
+            # Emotion analysis usually finishes after the response was recorded
+            get_latency_recorder().observe_late(context.timer)
+            processing_ms = context.timer.stages.get("emotion")
+        except Exception as e:
+            logger.warning(f"Turn emotion analysis failed, analysing again: {e}")
+    if emotion_analysis is None:
+        start = time.perf_counter()
+        emotion_analysis = await asyncio.to_thread(get_emotion_service().analyze_emotion, payload["text"])
+        processing_ms = (time.perf_counter() - start) * 1000
+    emotion_analysis.pop("embedding", None)
+    logger.info(f"Emotion analysis: {emotion_analysis['primary_emotion']} → {emotion_analysis['dosha']} dosha")
+
+    # Map emotion_service output to real schema column names
+    all_emotions_data = emotion_analysis.get('all_emotions', {})
+    if isinstance(all_emotions_data, list):
+        # Convert list to dict if needed
+        all_emotions_data = {e: 0.0 for e in all_emotions_data} if all_emotions_data else {}
+
+    emotion_values = {
+        "primary_emotion": emotion_analysis['primary_emotion'],
+        "primary_confidence": emotion_analysis.get('emotion_confidence', 0.0),
+        "all_emotions": all_emotions_data,           # JSONB, NOT NULL
+        "emotion_intensity": None,                   # Optional
+        "recommended_dosha_focus": emotion_analysis.get('dosha'),
+        "bert_model_version": 'bert-v1',
+        "processing_time_ms": round(processing_ms or 0)
+    }
+
+    await record_turn_emotion(
+        db, payload["user_id"], date.fromisoformat(payload["day"]),
+        user_message_id=payload["message_id"],
+        emotion=emotion_analysis,
+        emotion_values=emotion_values
+    )
+
+
+get_post_response_queue().register(TURN_PROGRESS_JOB, _record_turn_progress)
+get_post_response_queue().register(TURN_EMOTION_JOB, _record_turn_emotion)
+
+
+def _crisis_in_session(messages: list) -> bool:
+    """True when one of the session's recent user messages shows signs of crisis"""
+    recent = list(messages)[-settings.FAST_PATH_CRISIS_LOOKBACK_MESSAGES:]
+    return any(is_crisis_message(message.transcript_text or "") for message in recent)
+
+
+async def _fast_path_checkin(
+    db: AsyncSession,
+    request: DailyCheckinRequest,
+    session_id: str,
+    trivial_kind: str,
+    preferences,
+    dosha_type_name: str,
+    timer: StageTimer,
+    idempotency_key: Optional[str] = None
+) -> CheckinResponse:
+    """Answer a trivial turn from templates and persist it without calling the LLM"""
+    nickname = getattr(preferences, 'nickname', None) or "friend"
+    response_text = build_fast_reply(trivial_kind, nickname=nickname, dosha=dosha_type_name)
+    checkin_response = CheckinResponse(
         message=response_text,
         user_id=request.user_id,
         session_id=session_id,
         timestamp=datetime.now()
     )
 
+    try:
+        await timer.run("persist", save_checkin_turn(
+            db=db,
+            session_id=session_id,
+            user_id=request.user_id,
+            transcript_text=request.text,
+            ai_response_text=response_text,
+            detected_context=f"fast_path:{trivial_kind}",
+            post_response_jobs=_turn_jobs(request.user_id, request.text, None, None, date.today()),
+            idempotency=_key_completion(idempotency_key, checkin_response)
+        ))
+    except Exception as e:
+        logger.error(f"Error saving fast-path conversation messages: {e}")
+        raise HTTPException(status_code=500, detail="Failed to save conversation")
+
+    logger.info(f"Answered {trivial_kind} turn via fast path for user {request.user_id}")
+
+    return checkin_response
+
+
+async def _record_cancelled_turn(
+    db: AsyncSession,
+    request: DailyCheckinRequest,
+    session_id: str,
+    detected_context: str = 'cancelled'
+):
+    """Store the user's message of an unanswered turn, marked as cancelled (or failed)"""
+    try:
+        await save_conversation_message(
+            db=db,
+            session_id=session_id,
+            user_id=request.user_id,
+            transcript_text=request.text,
+            input_type='text',
+            detected_context=detected_context
+        )
+        logger.info(f"Recorded {detected_context} check-in turn for user {request.user_id} in session {session_id}")
+    except Exception as e:
+        logger.error(f"Error recording cancelled turn: {e}")
+
 
 class ConversationMessage(BaseModel):
     """Individual message in conversation"""
@@ -216,42 +652,66 @@ class ConversationHistoryResponse(BaseModel):
     session_id: str = None
     messages: list[ConversationMessage]
     total_messages: int
+    has_more: bool = False
+    next_cursor: Optional[str] = None  # Pass as `before` to fetch older messages
+
+
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+def _encode_keyset_cursor(timestamp: datetime, row_id) -> str:
+    """(timestamp, id) keyset position -> opaque cursor"""
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_keyset_cursor(cursor: str) -> tuple:
+    """Opaque cursor -> (timestamp, id); 400 if it wasn't issued by us"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(timestamp), uuid.UUID(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
 
 
 @router.get("/history/{user_id}", response_model=ConversationHistoryResponse)
 async def get_chat_history(
     user_id: str,
     session_id: str = None,
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    before: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
     """
-    Retrieve conversation history for a user
+    Retrieve conversation history for a user, newest page first
     
     Args:
         user_id: User ID (UUID)
         session_id: Optional session ID to get specific session history
-        limit: Number of recent messages to retrieve (default: 20)
+        limit: Number of messages per page (default: 20, max: 100)
+        before: Cursor from a previous page's next_cursor, to page further back
     
     Returns:
-        List of messages with type (user/ai) and content
+        List of messages with type (user/ai) and content in chronological
+        order, and next_cursor while there are older messages
     """
     logger.info(f"Fetching conversation history for user {user_id}")
+    before_key = _decode_keyset_cursor(before) if before else None
     
-    # Verify user exists
-    user = await get_user_profile(db, user_id)
-    if not user:
+    # Verify user exists (cached per user)
+    profile = await get_user_profile_context(db, user_id)
+    if not profile:
         raise HTTPException(status_code=404, detail=f"User {user_id} not found")
     
-    # Fetch conversation history
-    if session_id:
-        messages = await get_session_messages(db, session_id)
-    else:
-        messages = await get_conversation_history(db, user_id, limit=limit)
+    # Fetch one page of conversation history
+    page = await get_conversation_history_page(
+        db, user_id, limit=limit, before=before_key, session_id=session_id
+    )
     
     # Format response
     formatted_messages = []
-    for msg in messages:
+    for msg in page.messages:
         if msg.transcript_text:
             # User message
             formatted_messages.append(ConversationMessage(
@@ -273,5 +733,327 @@ async def get_chat_history(
         user_id=user_id,
         session_id=session_id,
         messages=formatted_messages,
-        total_messages=len(formatted_messages)
+        total_messages=len(formatted_messages),
+        has_more=page.has_more,
+        next_cursor=_encode_keyset_cursor(*page.next_before) if page.next_before else None
+    )
+
+
+class SessionSummary(BaseModel):
+    """One past check-in session"""
+    session_id: str
+    session_type: Optional[str] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    message_count: int
+    last_message_at: Optional[datetime] = None
+    last_message_preview: Optional[str] = None
+    dominant_emotion: Optional[str] = None
+
+
+class SessionListResponse(BaseModel):
+    """Response model for a page of sessions"""
+    user_id: str
+    sessions: list[SessionSummary]
+    has_more: bool = False
+    next_cursor: Optional[str] = None  # Pass as `before` to fetch older sessions
+
+
+@router.get("/sessions/{user_id}", response_model=SessionListResponse)
+async def list_sessions(
+    user_id: str,
+    limit: int = Query(20, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    List a user's conversation sessions, newest first
+    
+    Args:
+        user_id: User ID (UUID)
+        limit: Number of sessions per page (default: 20, max: 100)
+        before: Cursor from a previous page's next_cursor, to page further back
+    
+    Returns:
+        Each session's start time, message count, last message preview and
+        dominant emotion, and next_cursor while there are older sessions
+    """
+    logger.info(f"Listing conversation sessions for user {user_id}")
+    before_key = _decode_keyset_cursor(before) if before else None
+    
+    # Verify user exists (cached per user)
+    profile = await get_user_profile_context(db, user_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail=f"User {user_id} not found")
+    
+    page = await list_conversation_sessions(db, user_id, limit=limit, before=before_key)
+    
+    return SessionListResponse(
+        user_id=user_id,
+        sessions=[
+            SessionSummary(
+                session_id=str(row.session_id),
+                session_type=row.session_type,
+                start_time=row.start_time,
+                end_time=row.end_time,
+                message_count=row.message_count,
+                last_message_at=row.last_message_at,
+                last_message_preview=row.last_message_preview,
+                dominant_emotion=row.dominant_emotion
+            )
+            for row in page.sessions
+        ],
+        has_more=page.has_more,
+        next_cursor=_encode_keyset_cursor(*page.next_before) if page.next_before else None
+    )
+
+
+@router.get("/export/{user_id}")
+async def export_chat_history(
+    user_id: str,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Export a user's full conversation history
+    
+    Streams gzip-compressed NDJSON: an "export" header line, then one line
+    per session, message, emotion analysis and dosha tracking record, each
+    tagged with its "type".
+    """
+    logger.info(f"Exporting conversation history for user {user_id}")
+    
+    # Verify user exists before committing to a 200 streaming response
+    profile = await get_user_profile_context(db, user_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail=f"User {user_id} not found")
+    
+    filename = f"sama-history-{user_id}-{date.today().isoformat()}.ndjson.gz"
+    return StreamingResponse(
+        stream_user_export(user_id),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+# ---------------------------------------------------------------------------
+# WebSocket check-in
+# ---------------------------------------------------------------------------
+
+WS_NORMAL_CLOSURE = 1000
+WS_POLICY_VIOLATION = 1008
+WS_INTERNAL_ERROR = 1011
+WS_TRY_AGAIN_LATER = 1013
+
+_ws_connections = 0
+
+
+def websocket_stats() -> dict:
+    """Open WebSocket check-ins on this replica"""
+    return {"connections": _ws_connections, "max_connections": settings.WS_MAX_CONNECTIONS}
+
+
+@dataclass
+class _WebSocketCheckin:
+    """Context held in memory for the life of one WebSocket connection"""
+    user_id: str
+    session_id: str
+    user: object
+    preferences: object
+    dosha_type_name: str
+    dosha_context: dict
+    history: list = field(default_factory=list)
+    recent: list = field(default_factory=list)
+
+    def add_turn(self, messages: list):
+        """Append a saved turn, keeping the newest WS_CONTEXT_MAX_MESSAGES of each list"""
+        limit = settings.WS_CONTEXT_MAX_MESSAGES
+        self.history = (self.history + messages)[-limit:]
+        self.recent = (self.recent + messages)[-limit:]
+
+
+@router.websocket("/ws")
+async def checkin_websocket(websocket: WebSocket, user_id: str, session_id: str = None):
+    """
+    Daily check-in over a WebSocket.
+
+    User, preferences, dosha context and session history are loaded once at
+    connect and kept in memory; each turn then only runs emotion analysis,
+    knowledge retrieval and the LLM (streamed), and writes the finished turn.
+
+    Client → server: {"text": "..."}
+    Server → client: {"type": "ready", "session_id"} once, then per turn
+    {"type": "token", "text"}... and {"type": "done", "message", "session_id",
+    "timestamp", "timings_ms"}, or {"type": "error", "detail"}.
+
+    Connections are closed after WS_IDLE_TIMEOUT_SECONDS without a message,
+    and each replica serves at most WS_MAX_CONNECTIONS at once. A turn that
+    fails gets an error frame; the connection stays open.
+    """
+    global _ws_connections
+    if _ws_connections >= settings.WS_MAX_CONNECTIONS:
+        # Rejected during the handshake (HTTP 403), before any upgrade work
+        await websocket.close(code=WS_TRY_AGAIN_LATER, reason="Too many connections")
+        return
+
+    _ws_connections += 1
+    try:
+        await websocket.accept()
+        try:
+            state = await _open_ws_checkin(user_id, session_id)
+        except Exception as e:
+            logger.error(f"Error loading WebSocket check-in context for user {user_id}: {e}")
+            await websocket.close(code=WS_INTERNAL_ERROR, reason="Failed to load context")
+            return
+        if state is None:
+            await websocket.close(code=WS_POLICY_VIOLATION, reason="User or session not found")
+            return
+
+        logger.info(f"WebSocket check-in opened for user {user_id} (session {state.session_id})")
+        await websocket.send_json({"type": "ready", "session_id": state.session_id})
+
+        while True:
+            try:
+                message = await asyncio.wait_for(websocket.receive_json(), timeout=settings.WS_IDLE_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                await websocket.close(code=WS_NORMAL_CLOSURE, reason="Idle timeout")
+                return
+            except ValueError:
+                await websocket.send_json({"type": "error", "detail": "Messages must be JSON"})
+                continue
+
+            text = message.get("text") if isinstance(message, dict) else None
+            if not text:
+                await websocket.send_json({"type": "error", "detail": "text is required"})
+                continue
+
+            try:
+                async with session_lock(state.session_id):
+                    await _ws_turn(websocket, state, text)
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                logger.error(f"WebSocket check-in turn failed for user {user_id}: {e}")
+                await websocket.send_json({"type": "error", "detail": "Failed to process message"})
+    except WebSocketDisconnect:
+        logger.info(f"WebSocket check-in closed by client for user {user_id}")
+    finally:
+        _ws_connections -= 1
+
+
+async def _open_ws_checkin(user_id: str, session_id: Optional[str]) -> Optional[_WebSocketCheckin]:
+    """Load the connection's context once; creates a session when none is given"""
+    async with AsyncSessionLocal() as db:
+        context = await load_checkin_context(db, user_id, session_id)
+        if not context.user or (session_id and not context.session_found):
+            return None
+        if not session_id:
+            session = await create_conversation_session(db, user_id, 'checkin')
+            session_id = str(session.session_id)
+
+    return _WebSocketCheckin(
+        user_id=user_id,
+        session_id=session_id,
+        user=context.user,
+        preferences=context.preferences,
+        dosha_type_name=context.dosha_type_name,
+        dosha_context=context.dosha_context,
+        history=list(context.session_messages)[-settings.WS_CONTEXT_MAX_MESSAGES:],
+        recent=list(context.recent_messages)[-settings.WS_CONTEXT_MAX_MESSAGES:]
     )
+
+
+async def _ws_turn(websocket: WebSocket, state: _WebSocketCheckin, text: str):
+    """One WebSocket turn: stream the reply, then persist it and queue its side effects"""
+    timer = StageTimer("checkin_ws")
+    request = DailyCheckinRequest(user_id=state.user_id, text=text, session_id=state.session_id)
+    trivial_kind = classify_trivial_turn(text) if settings.FAST_PATH_ENABLED else None
+    if trivial_kind and _crisis_in_session(state.history):
+        trivial_kind = None
+
+    if trivial_kind:
+        nickname = getattr(state.preferences, 'nickname', None) or "friend"
+        response_text = build_fast_reply(trivial_kind, nickname=nickname, dosha=state.dosha_type_name)
+        await websocket.send_json({"type": "token", "text": response_text})
+        emotion_task = None
+        detected_context = f"fast_path:{trivial_kind}"
+    else:
+        emotion_task, knowledge_task = _start_turn_analysis(text, state.user_id, timer)
+        detected_context = None
+        parts = []
+        try:
+            relevant_knowledge = await _await_knowledge(
+                knowledge_task, text, state.dosha_context, emotion_task, timer
+            )
+            with timer.stage("prompt"):
+                personalized_prompt = build_checkin_prompt(
+                    user=state.user,
+                    preferences=state.preferences,
+                    dosha_type_name=state.dosha_type_name,
+                    user_text=text,
+                    conversation_history=state.history,
+                    recent_messages=state.recent,
+                    dosha_context=state.dosha_context,
+                    knowledge_context=relevant_knowledge
+                )
+
+            priority = LLMPriority.CRISIS if is_crisis_message(text) else LLMPriority.INTERACTIVE
+            stream = stream_llm_response(
+                messages=[{"role": "user", "content": personalized_prompt}],
+                priority=priority,
+                user_id=state.user_id,
+                endpoint=websocket.url.path
+            )
+            # aclosing: a disconnect mid-stream closes the provider stream and
+            # frees the admission slot now, not whenever the generator is collected
+            with timer.stage("llm"):
+                async with aclosing(stream):
+                    async for chunk in stream:
+                        parts.append(chunk)
+                        await websocket.send_json({"type": "token", "text": chunk})
+        except WebSocketDisconnect:
+            emotion_task.cancel()
+            async with AsyncSessionLocal() as db:
+                await _record_cancelled_turn(db, request, state.session_id)
+            raise
+        except Exception as e:
+            # e.g. a DB error in the full-text search fallback
+            logger.error(f"WebSocket check-in turn failed for user {state.user_id}: {e}")
+            emotion_task.cancel()
+            async with AsyncSessionLocal() as db:
+                await _record_cancelled_turn(db, request, state.session_id, detected_context='failed')
+            get_latency_recorder().observe(timer, user_id=state.user_id, outcome="error")
+            await websocket.send_json({"type": "error", "detail": "Failed to generate a reply"})
+            return
+        finally:
+            if knowledge_task is not None and not knowledge_task.done():
+                knowledge_task.cancel()
+        response_text = "".join(parts)
+
+    try:
+        async with AsyncSessionLocal() as db:
+            saved = await timer.run("persist", save_checkin_turn(
+                db=db,
+                session_id=state.session_id,
+                user_id=state.user_id,
+                transcript_text=text,
+                ai_response_text=response_text,
+                detected_context=detected_context,
+                post_response_jobs=_turn_jobs(state.user_id, text, emotion_task, timer, date.today())
+            ))
+    except Exception as e:
+        logger.error(f"Error saving WebSocket check-in turn: {e}")
+        if emotion_task is not None:
+            emotion_task.cancel()
+        await websocket.send_json({"type": "error", "detail": "Failed to save conversation"})
+        return
+    state.add_turn(list(saved))
+
+    logger.info(f"WebSocket check-in stage timings for user {state.user_id}: {timer.summary()}")
+    get_latency_recorder().observe(timer, user_id=state.user_id, outcome="ok")
+    await websocket.send_json({
+        "type": "done",
+        "message": response_text,
+        "session_id": state.session_id,
+        "timestamp": datetime.now().isoformat(),
+        "timings_ms": {name: round(ms, 1) for name, ms in timer.stages.items()}
+    })
@@ -2,8 +2,15 @@
 LLM Service using Google Gemini via the google-genai package.
 Falls back to google.generativeai if google-genai is not installed.
 """
+import asyncio
 import logging
+import time
+import traceback
+from typing import AsyncIterator
 from app.config import settings
+from app.services.circuit_breaker import get_circuit_breaker
+from app.services.llm_scheduler import get_llm_scheduler, LLMPriority, AdmissionRejected
+from app.services.usage_metrics import record_usage, estimate_llm_cost
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +31,22 @@ except ImportError:
 
 
 GEMINI_MODEL = "gemini-2.5-flash"  # Stable v1 model (replacement for deprecated 1.5 Flash)
+LLM_PROVIDER = "gemini"
+
+# Returned when the provider is failing, timing out or its circuit is open
+LLM_FALLBACK_RESPONSE = (
+    "I'm really glad you reached out, and I'm here with you. "
+    "I'm having a little trouble finding my words right now — could you give me a moment and try again?"
+)
+
+
+LLM_UNAVAILABLE_RESPONSE = "I'm having trouble connecting to my AI brain right now. Please try again in a moment."
+
+# Outcomes tagged on usage records of calls that never returned a full response
+CALL_TIMED_OUT = "timeout"
+HEDGE_LOST = "hedge_lost"
+CALL_CANCELLED = "cancelled"
+CALL_FAILED = "error"
 
 
 class LLMService:
@@ -32,6 +55,7 @@ class LLMService:
     def __init__(self):
         self.client = None
         self.model = None
+        self.breaker = get_circuit_breaker(LLM_PROVIDER)
 
         if not settings.GOOGLE_API_KEY:
             logger.warning("GOOGLE_API_KEY not set — LLM service disabled")
@@ -51,12 +75,134 @@ class LLMService:
             self.client = None
             self.model = None
 
-    async def generate_response(self, messages: list, system_prompt: str = None) -> str:
-        """Generate response from Gemini"""
+    async def generate_response(
+        self,
+        messages: list,
+        system_prompt: str = None,
+        priority: str = LLMPriority.INTERACTIVE,
+        user_id: str = None,
+        endpoint: str = None
+    ) -> str:
+        """
+        Generate response from Gemini.
+
+        Fails fast while the provider circuit is open, then waits for a slot
+        in the given admission lane before calling the provider. Token usage
+        of every provider call is recorded against user_id and endpoint.
+        """
         if not self.client and not self.model:
-            return "I'm having trouble connecting to my AI brain right now. Please try again in a moment."
+            return LLM_UNAVAILABLE_RESPONSE
+
+        prompt = self._build_prompt(messages, system_prompt)
 
-        # Build the full prompt from messages
+        if not self.breaker.allow_request():
+            logger.warning(f"Circuit for {LLM_PROVIDER} is open — returning fallback response")
+            return LLM_FALLBACK_RESPONSE
+
+        admitted = False
+        try:
+            async with get_llm_scheduler().admit(priority, timeout=settings.LLM_ADMISSION_TIMEOUT_SECONDS):
+                admitted = True
+                return await self._call_with_timeout(prompt, {"user_id": user_id, "endpoint_used": endpoint}, priority)
+        except AdmissionRejected as e:
+            logger.warning(f"LLM call not admitted ({priority}): {e}")
+        finally:
+            if not admitted:
+                # Rejected, cancelled or timed out while queued: the provider was
+                # never called, so a half-open probe must not stay taken
+                self.breaker.release_probe()
+        return LLM_FALLBACK_RESPONSE
+
+    async def stream_response(
+        self,
+        messages: list,
+        system_prompt: str = None,
+        priority: str = LLMPriority.INTERACTIVE,
+        user_id: str = None,
+        endpoint: str = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream a response from Gemini chunk by chunk.
+
+        Same circuit breaker, admission and usage accounting as
+        generate_response (no hedging). If the provider fails before the
+        first chunk the fallback response is yielded instead; a failure
+        mid-stream ends the stream early.
+        """
+        if not self.client and not self.model:
+            yield LLM_UNAVAILABLE_RESPONSE
+            return
+
+        prompt = self._build_prompt(messages, system_prompt)
+
+        if not self.breaker.allow_request():
+            logger.warning(f"Circuit for {LLM_PROVIDER} is open — returning fallback response")
+            yield LLM_FALLBACK_RESPONSE
+            return
+
+        admitted = False
+        try:
+            async with get_llm_scheduler().admit(priority, timeout=settings.LLM_ADMISSION_TIMEOUT_SECONDS):
+                admitted = True
+                async for chunk in self._stream_attempt(prompt, {"user_id": user_id, "endpoint_used": endpoint}):
+                    yield chunk
+        except AdmissionRejected as e:
+            logger.warning(f"LLM stream not admitted ({priority}): {e}")
+        finally:
+            if not admitted:
+                # Rejected, cancelled or closed while queued: release a half-open probe
+                self.breaker.release_probe()
+        if not admitted:
+            yield LLM_FALLBACK_RESPONSE
+
+    async def _stream_attempt(self, prompt: str, usage_tags: dict) -> AsyncIterator[str]:
+        """One streaming provider call under the overall LLM timeout"""
+        start = time.perf_counter()
+        deadline = start + settings.LLM_TIMEOUT_SECONDS
+        parts = []
+        last_chunk = None
+        try:
+            if _USE_NEW_SDK and self.client:
+                stream = await self.client.aio.models.generate_content_stream(
+                    model=GEMINI_MODEL,
+                    contents=prompt,
+                )
+            else:
+                stream = await self.model.generate_content_async(prompt, stream=True)
+            chunks = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - time.perf_counter(), 0))
+                except StopAsyncIteration:
+                    break
+                last_chunk = chunk
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield chunk.text
+        except (asyncio.CancelledError, GeneratorExit):
+            # Consumer went away — not a provider failure
+            self.breaker.release_probe()
+            self._record_unfinished_call(prompt, usage_tags, CALL_CANCELLED)
+            raise
+        except Exception as e:
+            self.breaker.record_failure((time.perf_counter() - start) * 1000)
+            if isinstance(e, asyncio.TimeoutError):
+                logger.error(f"LLM stream timed out after {settings.LLM_TIMEOUT_SECONDS}s [Model: {GEMINI_MODEL}]")
+                self._record_unfinished_call(prompt, usage_tags, CALL_TIMED_OUT)
+            else:
+                logger.error(f"Error streaming LLM response: {e}\n{traceback.format_exc()}")
+                self._record_unfinished_call(prompt, usage_tags, CALL_FAILED)
+            if not parts:
+                yield LLM_FALLBACK_RESPONSE
+            return
+
+        self.breaker.record_success((time.perf_counter() - start) * 1000)
+        # The final chunk carries usage for the whole response
+        self._record_usage(last_chunk, prompt, "".join(parts), usage_tags)
+
+    @staticmethod
+    def _build_prompt(messages: list, system_prompt: str = None) -> str:
+        """Flatten chat messages (and an optional system prompt) into one prompt"""
         prompt = ""
         for msg in messages:
             content = msg.get("content", "")
@@ -65,43 +211,187 @@ class LLMService:
 
         if system_prompt:
             prompt = f"System Instruction: {system_prompt}\n\n{prompt}"
+        return prompt
 
+    async def _call_with_timeout(
+        self,
+        prompt: str,
+        usage_tags: dict,
+        priority: str = LLMPriority.INTERACTIVE
+    ) -> str:
+        """Call the provider (hedged if enabled) under the overall LLM timeout"""
+        hedge_delay = self._hedge_delay_seconds()
+        start = time.perf_counter()
         try:
-            import asyncio
-            from functools import partial
+            if hedge_delay is not None:
+                call = asyncio.create_task(self._hedged_call(prompt, hedge_delay, usage_tags, priority))
+            else:
+                call = asyncio.create_task(self._attempt(prompt, usage_tags))
+            try:
+                done, _ = await asyncio.wait({call}, timeout=settings.LLM_TIMEOUT_SECONDS)
+            except asyncio.CancelledError:
+                call.cancel()
+                raise
+            if not done:
+                # Not wait_for: the message tells the attempts why they were cancelled
+                call.cancel(CALL_TIMED_OUT)
+                await asyncio.gather(call, return_exceptions=True)
+                raise asyncio.TimeoutError()
+            return call.result()
 
-            loop = asyncio.get_event_loop()
+        except asyncio.TimeoutError:
+            self.breaker.record_failure((time.perf_counter() - start) * 1000)
+            logger.error(f"LLM call timed out after {settings.LLM_TIMEOUT_SECONDS}s [Model: {GEMINI_MODEL}]")
+        except Exception as e:
+            logger.error(f"Error generating LLM response: {e}\n{traceback.format_exc()}")
 
-            if _USE_NEW_SDK and self.client:
-                response = await loop.run_in_executor(
-                    None,
-                    partial(
-                        self.client.models.generate_content,
-                        model=GEMINI_MODEL,
-                        contents=prompt,
-                    )
-                )
-                return response.text
+        return LLM_FALLBACK_RESPONSE
 
-            elif self.model:
-                response = await loop.run_in_executor(
-                    None,
-                    partial(self.model.generate_content, prompt)
-                )
-                return response.text
+    async def _call_provider(self, prompt: str) -> str:
+        """Single async call to Gemini (cancellable, unlike an executor thread)"""
+        if _USE_NEW_SDK and self.client:
+            response = await self.client.aio.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=prompt,
+            )
+        else:
+            response = await self.model.generate_content_async(prompt)
+        return response
 
-        except Exception as e:
-            import traceback
-            logger.error(f"Error generating LLM response: {e}\n{traceback.format_exc()}")
-            return f"I'm having a moment of difficulty. Please try again shortly. (Error: {str(e)}) [Model: {GEMINI_MODEL}]"
+    async def _attempt(self, prompt: str, usage_tags: dict) -> str:
+        """Call the provider once and record the outcome and token usage"""
+        start = time.perf_counter()
+        try:
+            response = await self._call_provider(prompt)
+            text = response.text
+        except asyncio.CancelledError as e:
+            # Lost a hedge race or hit the overall timeout — not a provider failure
+            self.breaker.release_probe()
+            self._record_unfinished_call(prompt, usage_tags, e.args[0] if e.args else CALL_CANCELLED)
+            raise
+        except Exception:
+            self.breaker.record_failure((time.perf_counter() - start) * 1000)
+            self._record_unfinished_call(prompt, usage_tags, CALL_FAILED)
+            raise
+        self.breaker.record_success((time.perf_counter() - start) * 1000)
+        self._record_usage(response, prompt, text, usage_tags)
+        return text
+
+    def _record_usage(self, response, prompt: str, text: str, usage_tags: dict):
+        """Queue a usage record for api_usage_metrics (buffered, no DB call here)"""
+        usage = getattr(response, "usage_metadata", None)
+        input_tokens = getattr(usage, "prompt_token_count", None) or 0
+        output_tokens = getattr(usage, "candidates_token_count", None) or 0
+        total_tokens = getattr(usage, "total_token_count", None) or (input_tokens + output_tokens)
+        record_usage(
+            LLM_PROVIDER,
+            endpoint_used=usage_tags.get("endpoint_used") or f"generate_content:{GEMINI_MODEL}",
+            user_id=usage_tags.get("user_id"),
+            tokens_used=total_tokens,
+            characters_processed=len(prompt) + len(text or ""),
+            cost_incurred=estimate_llm_cost(input_tokens, output_tokens)
+        )
 
-        return "I'm unable to respond right now. Please try again."
+    def _record_unfinished_call(self, prompt: str, usage_tags: dict, outcome: str):
+        """
+        Queue a usage record for a call that reached the provider but returned
+        no full response. Tokens are unknown (the provider may still bill
+        them), so they stay null and the outcome is appended to the endpoint.
+        """
+        endpoint = usage_tags.get("endpoint_used") or f"generate_content:{GEMINI_MODEL}"
+        record_usage(
+            LLM_PROVIDER,
+            endpoint_used=f"{endpoint}:{outcome}",
+            user_id=usage_tags.get("user_id"),
+            tokens_used=None,
+            characters_processed=len(prompt),
+            cost_incurred=None
+        )
+
+    async def _hedged_call(
+        self,
+        prompt: str,
+        hedge_delay: float,
+        usage_tags: dict,
+        priority: str = LLMPriority.INTERACTIVE
+    ) -> str:
+        """
+        Start one request; if it has not finished after hedge_delay seconds,
+        start a second one and return whichever succeeds first. The second
+        request needs its own admission slot in the same lane; when none is
+        free right away the call is not hedged.
+        """
+        primary = asyncio.create_task(self._attempt(prompt, usage_tags))
+        pending = {primary}
+        cancel_reason = None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+            if not done:
+                if get_llm_scheduler().try_acquire(priority):
+                    logger.info(f"LLM call exceeded hedge delay ({hedge_delay * 1000:.0f}ms) — sending hedged request")
+                    pending.add(asyncio.create_task(self._hedge_attempt(prompt, usage_tags)))
+                else:
+                    logger.info(f"LLM call exceeded hedge delay ({hedge_delay * 1000:.0f}ms) — no free slot, not hedging")
+
+            last_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        cancel_reason = HEDGE_LOST
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        except asyncio.CancelledError as e:
+            # Timed out or abandoned: the attempts are cancelled for the same reason
+            cancel_reason = e.args[0] if e.args else None
+            raise
+        finally:
+            for task in pending:
+                task.cancel(cancel_reason)
+
+    async def _hedge_attempt(self, prompt: str, usage_tags: dict) -> str:
+        """The hedged request; gives back the slot taken for it"""
+        try:
+            return await self._attempt(prompt, usage_tags)
+        finally:
+            get_llm_scheduler().release()
+
+    def _hedge_delay_seconds(self):
+        """Hedge delay derived from recent latency, or None when hedging is off"""
+        if not settings.LLM_HEDGING_ENABLED or self.breaker.state != self.breaker.CLOSED:
+            return None
+        p95 = self.breaker.latency_percentile(settings.LLM_HEDGE_PERCENTILE)
+        if p95 is None:
+            return None
+        return max(p95, settings.LLM_HEDGE_MIN_DELAY_MS) / 1000
 
 
 # Singleton instance
 llm = LLMService()
 
 
-async def get_llm_response(messages: list, system_prompt: str = None) -> str:
-    """Convenience function for getting LLM responses"""
-    return await llm.generate_response(messages, system_prompt)
\ No newline at end of file
+async def get_llm_response(
+    messages: list,
+    system_prompt: str = None,
+    priority: str = LLMPriority.INTERACTIVE,
+    user_id: str = None,
+    endpoint: str = None
+) -> str:
+    """
+    Convenience function for getting LLM responses. Callers that don't answer
+    a waiting user (summaries, weekly insights) must pass LLMPriority.BACKGROUND
+    so their calls queue behind check-in turns and are shed first under load.
+    """
+    return await llm.generate_response(messages, system_prompt, priority, user_id, endpoint)
+
+
+def stream_llm_response(
+    messages: list,
+    system_prompt: str = None,
+    priority: str = LLMPriority.INTERACTIVE,
+    user_id: str = None,
+    endpoint: str = None
+) -> AsyncIterator[str]:
+    """Convenience function for streaming LLM responses"""
+    return llm.stream_response(messages, system_prompt, priority, user_id, endpoint)
\ No newline at end of file
@@ -6,6 +6,8 @@ import logging
 import uuid
 
 from app.database.connection import get_db
+from app.services.cache import invalidate_user_context
+from app.services.invalidation_bus import publish_change
 from app.services.questionnaire_service import (
     get_phase1_questions,
     get_phase2_questions,
@@ -170,7 +172,9 @@ async def submit_phase2(
     onboarding.prakriti_type = final_result['classification']['label']
     onboarding.completed = True
     
+    await publish_change(db, "user_onboarding", request.user_id)
     await db.commit()
+    invalidate_user_context(request.user_id)
     
     return FinalResultResponse(
         user_id=request.user_id,
@@ -222,6 +226,8 @@ async def update_health_baseline(
         onboarding.health_baseline = request.baseline
         onboarding.step_1_completed = True
         
+    await publish_change(db, "user_onboarding", request.user_id)
     await db.commit()
+    invalidate_user_context(request.user_id)
     
     return {"status": "success", "message": "Health baseline updated"}
@@ -30,7 +30,39 @@ class Settings(BaseSettings):
     LLM_MODEL_NAME: str = "sama-wellness-model"
     LLM_MAX_TOKENS: int = 500
     LLM_TEMPERATURE: float = 0.7
-    
+    LLM_TIMEOUT_SECONDS: float = 20.0  # Hard cap on a single check-in LLM call
+
+    # LLM circuit breaker (per provider)
+    LLM_CIRCUIT_WINDOW_SIZE: int = 20  # Recent calls considered
+    LLM_CIRCUIT_MIN_CALLS: int = 5  # Calls needed before the circuit can open
+    LLM_CIRCUIT_ERROR_RATE: float = 0.5  # Open when this share of calls fail
+    LLM_CIRCUIT_SLOW_CALL_MS: int = 10000  # Calls slower than this count as slow
+    LLM_CIRCUIT_SLOW_CALL_RATE: float = 0.8  # Open when this share of calls are slow
+    LLM_CIRCUIT_COOLDOWN_SECONDS: float = 30.0  # Time open before a probe call
+
+    # LLM hedged requests
+    LLM_HEDGING_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 0.95  # Fire the hedge after this latency percentile
+    LLM_HEDGE_MIN_DELAY_MS: int = 500
+
+    # LLM admission control (shared across all lanes)
+    LLM_MAX_CONCURRENCY: int = 8  # Concurrent LLM calls per replica
+    LLM_RATE_LIMIT_PER_SECOND: float = 5.0  # 0 disables the rate limit
+    LLM_RATE_LIMIT_BURST: int = 10
+    LLM_CRISIS_RESERVED_SLOTS: int = 2  # Extra slots only crisis turns may use
+    LLM_ADMISSION_MAX_QUEUE: int = 50  # Total queued calls before lower lanes are shed
+    LLM_BACKGROUND_MAX_QUEUE: int = 10
+    LLM_ADMISSION_TIMEOUT_SECONDS: float = 10.0  # Max wait in a lane before giving up
+    DISCONNECT_POLL_INTERVAL_SECONDS: float = 0.5  # How often to check for abandoned requests
+
+    # Usage & cost accounting (api_usage_metrics)
+    LLM_COST_PER_1K_INPUT_TOKENS: float = 0.0003  # USD, Gemini 2.5 Flash list price
+    LLM_COST_PER_1K_OUTPUT_TOKENS: float = 0.0025
+    USAGE_METRICS_FLUSH_INTERVAL_SECONDS: float = 5.0
+    USAGE_METRICS_BATCH_SIZE: int = 500  # Rows per bulk insert
+    USAGE_METRICS_MAX_BUFFER: int = 10000  # Oldest records are dropped beyond this
+    USAGE_METRICS_MAX_RETRIES: int = 5  # Flush attempts before a batch is dropped (DB unreachable)
+
     # AssemblyAI (Speech-to-Text)
     ASSEMBLYAI_API_KEY: str
     
@@ -43,6 +75,69 @@ class Settings(BaseSettings):
     AUDIO_STORAGE_URL: str = ""  # S3 or Cloud Storage URL
     MAX_AUDIO_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
     
+    # Fast path for trivial turns (greetings, thanks, goodbyes)
+    FAST_PATH_ENABLED: bool = True
+    FAST_PATH_UTC_OFFSET_MINUTES: int = 330  # Local time for "good morning" etc. (IST)
+    FAST_PATH_CRISIS_LOOKBACK_MESSAGES: int = 20  # Session messages checked for crisis signs first
+
+    # Per-user profile/preferences/prakriti cache
+    USER_CONTEXT_CACHE_TTL_SECONDS: int = 900
+    USER_CONTEXT_CACHE_MAX_ENTRIES: int = 10000
+
+    # Per-session transcript cache
+    SESSION_TRANSCRIPT_CACHE_MAX_SESSIONS: int = 2000
+    SESSION_TRANSCRIPT_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+
+    # Post-response work (emotion analysis, dosha tracking, streaks, progress),
+    # durable in the post_response_jobs outbox (migrations/010)
+    POST_RESPONSE_QUEUE_MAX_SIZE: int = 1000  # Jobs handed to this replica's workers directly
+    POST_RESPONSE_WORKERS: int = 2
+    POST_RESPONSE_MAX_ATTEMPTS: int = 5
+    POST_RESPONSE_RETRY_BASE_SECONDS: float = 0.5
+    POST_RESPONSE_LEASE_SECONDS: float = 60  # A job is claimed again if its worker hasn't finished by then
+    POST_RESPONSE_POLL_SECONDS: float = 5  # Idle workers check the outbox for retries and orphaned jobs
+    POST_RESPONSE_DRAIN_TIMEOUT_SECONDS: float = 10
+
+    # Idempotency-Key handling for check-in turns
+    IDEMPOTENCY_TTL_SECONDS: int = 24 * 60 * 60
+    IDEMPOTENCY_LEASE_SECONDS: float = 60  # Another replica may take a key over if its turn runs longer
+    IDEMPOTENCY_WAIT_SECONDS: float = 35  # How long a retry waits for the original turn before a 409
+    IDEMPOTENCY_POLL_SECONDS: float = 0.25
+
+    # WebSocket check-ins
+    WS_MAX_CONNECTIONS: int = 500  # Per replica
+    WS_IDLE_TIMEOUT_SECONDS: float = 300
+    WS_CONTEXT_MAX_MESSAGES: int = 100  # Session / recent messages kept in memory per connection
+
+    # Latency instrumentation
+    LATENCY_RECENT_TURNS: int = 200  # Per-turn timing records kept for /metrics
+
+    # Knowledge retrieval
+    # "memory": in-process BM25 index (Postgres full-text search while it builds)
+    # "postgres": full-text search on the GIN-indexed search_vector, for knowledge
+    # bases too large to index on every replica
+    # "embedding": semantic search over offline-built sentence embeddings
+    # (build_knowledge_embeddings.py; full-text search until they're loaded)
+    KNOWLEDGE_RETRIEVAL_BACKEND: str = "memory"
+    # A sentence-transformers model, or "bert-emotion" to embed with the emotion
+    # detector's encoder and reuse each message's emotion forward pass
+    KNOWLEDGE_EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    KNOWLEDGE_EMBEDDINGS_PATH: str = "data/knowledge_embeddings.npy"
+    KNOWLEDGE_EMBEDDING_MIN_SCORE: float = 0.25  # Cosine similarity below this isn't relevant
+    KNOWLEDGE_INDEX_REFRESH_SECONDS: float = 300  # Full rebuild interval when the invalidation bus is off
+    KNOWLEDGE_CONTENT_TYPES: list[str] = []  # Restrict in-process ranking to these content types (empty = all)
+    KNOWLEDGE_EMOTION_WAIT_MS: float = 150  # How long ranking waits for emotion analysis to finish
+    KNOWLEDGE_CATALOG_REFRESH_SECONDS: float = 60  # updated_at fingerprint check interval when the bus is off
+
+    # Conversation history export
+    EXPORT_CHUNK_ROWS: int = 500  # Rows fetched per server-side cursor round trip
+    EXPORT_GZIP_LEVEL: int = 6
+
+    # Cross-replica cache invalidation (Postgres LISTEN/NOTIFY)
+    INVALIDATION_BUS_ENABLED: bool = True
+    INVALIDATION_LISTEN_DATABASE_URL: str = ""  # Direct/session-mode URL; transaction poolers drop LISTEN
+    INVALIDATION_RECONNECT_SECONDS: float = 5
+
     # Context Management
     MAX_CONVERSATION_HISTORY: int = 10  # Last N messages to include
     CONTEXT_SUMMARY_LENGTH: int = 200  # Characters
@@ -71,7 +71,9 @@ async def init_db():
                 app_configuration,
                 error_logs,
                 api_usage_metrics,
-                push_subscriptions
+                push_subscriptions,
+                post_response_job,
+                idempotency_key
             )
             
             # Create all tables
@@ -9,6 +9,22 @@ from app.config import settings
 from app.database.connection import init_db, close_db
 from app.api import daily_checkin, onboarding
 from app.middleware.error_handler import register_error_handlers
+from app.services.circuit_breaker import get_circuit_breaker_stats
+from app.services.llm_scheduler import get_llm_scheduler
+from app.services.usage_metrics import get_usage_writer
+from app.services.cache import (
+    get_user_context_cache,
+    get_session_transcript_cache,
+    invalidate_user_context,
+    USER_CONTEXT_TABLES
+)
+from app.services.invalidation_bus import get_invalidation_bus
+from app.services.post_response import get_post_response_queue
+from app.services.idempotency import get_idempotency_store
+from app.services.timing import get_latency_recorder
+from app.services.knowledge_index import get_knowledge_index, KNOWLEDGE_TABLES
+from app.services.knowledge_catalog import get_knowledge_catalog
+from app.services.embedding_index import get_embedding_index
 
 # Configure logging
 logging.basicConfig(
@@ -27,11 +43,45 @@ async def lifespan(app: FastAPI):
     logger.info("Starting Sama Wellness Backend...")
     await init_db()
     logger.info("Database initialized successfully")
+    get_usage_writer().start()
+    get_post_response_queue().start()
+    if settings.INVALIDATION_BUS_ENABLED:
+        bus = get_invalidation_bus()
+        for table in USER_CONTEXT_TABLES:
+            bus.subscribe(table, invalidate_user_context, on_reset=get_user_context_cache().clear)
+        if settings.KNOWLEDGE_RETRIEVAL_BACKEND == "memory":
+            knowledge_index = get_knowledge_index()
+            for table in KNOWLEDGE_TABLES:
+                bus.subscribe(table, knowledge_index.schedule_refresh, on_reset=knowledge_index.schedule_rebuild)
+        else:
+            knowledge_catalog = get_knowledge_catalog()
+            bus.subscribe(
+                "ayurveda_knowledge",
+                knowledge_catalog.schedule_refresh_entry,
+                on_reset=knowledge_catalog.schedule_reload
+            )
+        bus.start()
+    if settings.KNOWLEDGE_RETRIEVAL_BACKEND == "memory":
+        # Built in the background (loading the catalog); retrieval uses the DB until it's ready
+        get_knowledge_index().schedule_rebuild()
+        if not settings.INVALIDATION_BUS_ENABLED:
+            get_knowledge_index().start_periodic_refresh(settings.KNOWLEDGE_INDEX_REFRESH_SECONDS)
+    else:
+        get_knowledge_catalog().schedule_reload()
+        if not settings.INVALIDATION_BUS_ENABLED:
+            get_knowledge_catalog().start_periodic_refresh(settings.KNOWLEDGE_CATALOG_REFRESH_SECONDS)
+    if settings.KNOWLEDGE_RETRIEVAL_BACKEND == "embedding":
+        get_embedding_index().start()
     
     yield
     
     # Shutdown
     logger.info("Shutting down Sama Wellness Backend...")
+    await get_invalidation_bus().stop()
+    await get_knowledge_index().stop()
+    await get_knowledge_catalog().stop()
+    await get_post_response_queue().stop(timeout=settings.POST_RESPONSE_DRAIN_TIMEOUT_SECONDS)
+    await get_usage_writer().stop()
     await close_db()
     logger.info("Database connections closed")
 
@@ -51,6 +101,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
 # Register error handlers
@@ -88,6 +139,32 @@ async def health_check():
     }
 
 
+@app.get("/metrics")
+async def metrics():
+    """
+    In-process performance metrics for this replica
+    """
+    return {
+        "llm": {
+            "admission": get_llm_scheduler().snapshot(),
+            "circuit_breakers": get_circuit_breaker_stats()
+        },
+        "usage_metrics": get_usage_writer().snapshot(),
+        "post_response_queue": get_post_response_queue().snapshot(),
+        "idempotency": get_idempotency_store().snapshot(),
+        "websocket_checkins": daily_checkin.websocket_stats(),
+        "latency": get_latency_recorder().snapshot(),
+        "caches": {
+            "user_context": get_user_context_cache().snapshot(),
+            "session_transcripts": get_session_transcript_cache().snapshot(),
+            "knowledge_catalog": get_knowledge_catalog().snapshot(),
+            "knowledge_index": get_knowledge_index().snapshot(),
+            "embedding_index": get_embedding_index().snapshot(),
+            "invalidation_bus": get_invalidation_bus().snapshot()
+        }
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
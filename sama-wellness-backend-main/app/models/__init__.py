@@ -24,6 +24,8 @@ from app.models.app_configuration import AppConfiguration
 from app.models.error_logs import ErrorLog
 from app.models.api_usage_metrics import ApiUsageMetric
 from app.models.push_subscriptions import PushSubscription
+from app.models.post_response_job import PostResponseJob
+from app.models.idempotency_key import IdempotencyKey
 
 __all__ = [
     "User",
@@ -48,4 +50,6 @@ __all__ = [
     "ErrorLog",
     "ApiUsageMetric",
     "PushSubscription",
+    "PostResponseJob",
+    "IdempotencyKey",
 ]
@@ -1,7 +1,8 @@
 # app/models/ayurveda_knowledge.py
 
 from sqlalchemy import Column, String, Integer, TIMESTAMP, Text, CheckConstraint, JSON, DECIMAL
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
+from sqlalchemy.orm import deferred
 import uuid
 from app.database.connection import Base
 
@@ -49,6 +50,10 @@ class AyurvedaKnowledge(Base):
     created_at = Column(TIMESTAMP, default=func.now())
     updated_at = Column(TIMESTAMP, default='CURRENT_TIMESTAMP')
 
+    # Weighted full-text vector maintained by triggers (migrations/008); deferred
+    # so loading knowledge rows doesn't pull it
+    search_vector = deferred(Column(TSVECTOR))
+
     __table_args__ = (
         CheckConstraint(
             "content_type IN ('breathing', 'yoga', 'diet', 'herb', 'lifestyle', 'mantra')",
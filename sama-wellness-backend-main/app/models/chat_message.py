@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, Text, CheckConstraint, DECIMAL
+from sqlalchemy import Column, String, Integer, ForeignKey, Text, CheckConstraint, UniqueConstraint, DECIMAL
 from sqlalchemy.sql import func
 from sqlalchemy.types import TIMESTAMP
 from sqlalchemy.dialects.postgresql import UUID
@@ -39,4 +39,6 @@ class ConversationMessage(Base):
             "input_type IN ('voice', 'text')",
             name='chk_input_type'
         ),
+        # Added by migration 005_conversation_sequence_counter.sql
+        UniqueConstraint('session_id', 'sequence_number', name='uq_conversation_messages_session_sequence'),
     )
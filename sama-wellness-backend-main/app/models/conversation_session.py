@@ -21,6 +21,9 @@ class ConversationSession(Base):
     network_type = Column(String(10))
     location_city = Column(String(50))
 
+    # Last allocated conversation_messages.sequence_number (migration 005)
+    last_sequence_number = Column(Integer, nullable=False, default=0, server_default="0")
+
     __table_args__ = (
         CheckConstraint(
             "session_type IN ('first_chat', 'regular', 'crisis', 'checkin')",
@@ -0,0 +1,30 @@
+# app/models/idempotency_key.py
+
+from sqlalchemy import Column, String, CheckConstraint, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.types import TIMESTAMP
+from sqlalchemy.sql import func
+from app.database.connection import Base
+
+
+class IdempotencyKey(Base):
+    """Idempotency-Key record shared by all replicas (migration 011)"""
+    __tablename__ = "idempotency_keys"
+
+    scope = Column(String(20), primary_key=True)
+    user_id = Column(String(255), primary_key=True)
+    idempotency_key = Column(String(255), primary_key=True)
+    request_fingerprint = Column(String(64), nullable=False)
+    status = Column(String(10), nullable=False, default='pending', server_default='pending')
+    response = Column(JSONB)
+    locked_until = Column(TIMESTAMP(timezone=True))
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False)
+
+    __table_args__ = (
+        CheckConstraint(
+            "status IN ('pending', 'completed')",
+            name='chk_idempotency_key_status'
+        ),
+        Index('idx_idempotency_keys_expires_at', 'expires_at'),
+    )
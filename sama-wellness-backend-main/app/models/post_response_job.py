@@ -0,0 +1,30 @@
+# app/models/post_response_job.py
+
+from sqlalchemy import Column, String, Integer, BigInteger, Text, CheckConstraint, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.types import TIMESTAMP
+from sqlalchemy.sql import func
+from app.database.connection import Base
+
+
+class PostResponseJob(Base):
+    """Outbox row for work that follows a check-in turn (migration 010)"""
+    __tablename__ = "post_response_jobs"
+
+    job_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    job_type = Column(String(50), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    status = Column(String(10), nullable=False, default='pending', server_default='pending')
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    available_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    locked_until = Column(TIMESTAMP(timezone=True))
+    last_error = Column(Text)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        CheckConstraint(
+            "status IN ('pending', 'failed')",
+            name='chk_post_response_job_status'
+        ),
+        Index('idx_post_response_jobs_pending', 'job_id', postgresql_where=text("status = 'pending'")),
+    )
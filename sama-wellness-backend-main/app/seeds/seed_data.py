@@ -149,7 +149,8 @@ async def seed_test_data():
                         user_id=user_id,
                         session_type="regular",
                         device_info={"model": "iPhone 13", "os": "iOS 16.5"},
-                        network_type="wifi"
+                        network_type="wifi",
+                        last_sequence_number=1
                     )
                     db.add(session)
                     await db.flush()  # Get session_id
@@ -70,6 +70,43 @@ class BERTEmotionDetector:
             'attention_mask': encoding['attention_mask'].to(self.device)
         }
     
+    def _forward(self, inputs: Dict[str, torch.Tensor], return_embedding: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        One forward pass. Returns (probabilities, embedding) where embedding is
+        the pooled sentence embedding (None unless return_embedding)
+        """
+        with torch.no_grad():
+            outputs = self.model(**inputs, output_hidden_states=return_embedding)
+            probabilities = F.softmax(outputs.logits, dim=1).cpu().numpy()[0]
+            embedding = None
+            if return_embedding:
+                embedding = self._pool(outputs.hidden_states[-1], inputs['attention_mask'])[0]
+        return probabilities, embedding
+    
+    @staticmethod
+    def _pool(hidden_states: torch.Tensor, attention_mask: torch.Tensor) -> np.ndarray:
+        """Mean of the last hidden layer over real tokens, L2-normalised"""
+        mask = attention_mask.unsqueeze(-1).to(hidden_states.dtype)
+        pooled = (hidden_states * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        return F.normalize(pooled, p=2, dim=1).cpu().numpy().astype(np.float32)
+    
+    def _rank_emotions(
+        self,
+        probabilities: np.ndarray,
+        top_k: int = config.TOP_K_EMOTIONS,
+        threshold: float = config.CONFIDENCE_THRESHOLD
+    ) -> List[Tuple[str, float]]:
+        # Get emotion-confidence pairs
+        emotion_scores = [
+            (self.emotion_labels[i], float(probabilities[i]))
+            for i in range(len(self.emotion_labels))
+            if probabilities[i] >= threshold
+        ]
+        
+        # Sort by confidence and return top K
+        emotion_scores.sort(key=lambda x: x[1], reverse=True)
+        return emotion_scores[:top_k]
+    
     def predict_emotions(
         self, 
         text: str, 
@@ -87,41 +124,61 @@ class BERTEmotionDetector:
         Returns:
             List of (emotion, confidence) tuples
         """
-        # Preprocess
-        inputs = self.preprocess_text(text)
-        
-        # Predict
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            logits = outputs.logits
-            probabilities = F.softmax(logits, dim=1).cpu().numpy()[0]
-        
-        # Get emotion-confidence pairs
-        emotion_scores = [
-            (self.emotion_labels[i], float(probabilities[i]))
-            for i in range(len(self.emotion_labels))
-            if probabilities[i] >= threshold
-        ]
+        probabilities, _ = self._forward(self.preprocess_text(text))
+        return self._rank_emotions(probabilities, top_k, threshold)
+    
+    def embed(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """
+        Pooled sentence embeddings from the same encoder, for indexing
+        documents that queries embedded by predict_with_dosha are compared to
         
-        # Sort by confidence and return top K
-        emotion_scores.sort(key=lambda x: x[1], reverse=True)
-        return emotion_scores[:top_k]
+        Args:
+            texts: Input texts
+            batch_size: Texts per forward pass
+            
+        Returns:
+            float32 array (len(texts) x hidden size), rows L2-normalised
+        """
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encoding = self.tokenizer(
+                texts[start:start + batch_size],
+                add_special_tokens=True,
+                max_length=config.MAX_LENGTH,
+                padding=True,
+                truncation=True,
+                return_attention_mask=True,
+                return_tensors='pt'
+            )
+            inputs = {
+                'input_ids': encoding['input_ids'].to(self.device),
+                'attention_mask': encoding['attention_mask'].to(self.device)
+            }
+            with torch.no_grad():
+                outputs = self.model(**inputs, output_hidden_states=True)
+            batches.append(self._pool(outputs.hidden_states[-1], inputs['attention_mask']))
+        if not batches:
+            return np.zeros((0, self.model.config.hidden_size), dtype=np.float32)
+        return np.concatenate(batches)
     
-    def predict_with_dosha(self, text: str) -> Dict:
+    def predict_with_dosha(self, text: str, return_embedding: bool = False) -> Dict:
         """
         Predict emotions and map to Ayurvedic doshas
         
         Args:
             text: Input text
+            return_embedding: Also return the pooled sentence embedding from
+                the same forward pass (key 'embedding')
             
         Returns:
             Dictionary with emotions, doshas, and recommendations
         """
         # Get emotion predictions
-        emotions = self.predict_emotions(text)
+        probabilities, embedding = self._forward(self.preprocess_text(text), return_embedding)
+        emotions = self._rank_emotions(probabilities)
         
         if not emotions:
-            return {
+            result = {
                 'text': text,
                 'emotions': [],
                 'primary_emotion': 'neutral',
@@ -129,6 +186,9 @@ class BERTEmotionDetector:
                 'dosha': 'Balanced',
                 'dosha_scores': {'Vata': 0, 'Pitta': 0, 'Kapha': 0, 'Balanced': 1}
             }
+            if return_embedding:
+                result['embedding'] = embedding
+            return result
         
         # Calculate dosha scores
         dosha_scores = {'Vata': 0, 'Pitta': 0, 'Kapha': 0, 'Balanced': 0}
@@ -145,7 +205,7 @@ class BERTEmotionDetector:
         # Get primary dosha
         primary_dosha = max(dosha_scores.items(), key=lambda x: x[1])[0]
         
-        return {
+        result = {
             'text': text,
             'emotions': [
                 {'emotion': e, 'confidence': round(c, 3)} 
@@ -156,6 +216,9 @@ class BERTEmotionDetector:
             'dosha': primary_dosha,
             'dosha_scores': {k: round(v, 3) for k, v in dosha_scores.items()}
         }
+        if return_embedding:
+            result['embedding'] = embedding
+        return result
     
     def batch_predict(self, texts: List[str]) -> List[Dict]:
         """
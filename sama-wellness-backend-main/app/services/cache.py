@@ -0,0 +1,221 @@
+# app/services/cache.py
+"""
+In-process caches.
+
+TTLCache is a size-bounded LRU whose entries also expire after a TTL.
+The per-user context cache holds data that changes rarely (profile,
+preferences, prakriti) and is invalidated explicitly by writers.
+
+SessionTranscriptCache keeps the messages of active conversation sessions,
+bounded by session count and total text size, so a turn only reads the
+messages it hasn't seen yet.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU cache with a max size and per-entry time-to-live"""
+
+    def __init__(self, name: str, max_entries: int = 10000, ttl_seconds: float = 900):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        self._entries[key] = (time.monotonic() + (ttl_seconds or self.ttl_seconds), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Drop one key; returns True if it was cached"""
+        if self._entries.pop(key, _MISSING) is _MISSING:
+            return False
+        self.invalidations += 1
+        return True
+
+    def clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+
+class SessionTranscriptCache:
+    """LRU of session_id -> messages (ordered by sequence_number), bounded by sessions and bytes"""
+
+    # Rough per-message overhead on top of the text itself
+    MESSAGE_OVERHEAD_BYTES = 200
+
+    def __init__(self, max_sessions: int = 2000, max_bytes: int = 32 * 1024 * 1024):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.gap_invalidations = 0
+
+    @classmethod
+    def _size_of(cls, messages: list) -> int:
+        return sum(
+            cls.MESSAGE_OVERHEAD_BYTES + len(m.transcript_text or "") + len(m.ai_response_text or "")
+            for m in messages
+        )
+
+    def get(self, session_id: str) -> Optional[list]:
+        """Cached messages of a session (a copy), or None"""
+        entry = self._sessions.get(str(session_id))
+        if entry is None:
+            self.misses += 1
+            return None
+        self._sessions.move_to_end(str(session_id))
+        self.hits += 1
+        return list(entry[0])
+
+    def put(self, session_id: str, messages: list):
+        """Replace a session's transcript"""
+        self._drop(str(session_id))
+        size = self._size_of(messages)
+        self._sessions[str(session_id)] = (list(messages), size)
+        self.total_bytes += size
+        self._evict()
+
+    def append(self, session_id: str, messages: list):
+        """
+        Add newly saved messages; ignored for sessions that aren't cached.
+
+        The transcript must stay a gap-free prefix of the session, since the
+        next turn only reads messages after its last sequence number. If the
+        new messages don't follow on directly (another turn committed in
+        between), the session is dropped and re-read in full next time.
+        """
+        entry = self._sessions.get(str(session_id))
+        if entry is None:
+            return
+        transcript, size = entry
+        last = transcript[-1].sequence_number if transcript else 0
+        messages = sorted((m for m in messages if m.sequence_number > last), key=lambda m: m.sequence_number)
+        if not messages:
+            return
+        if messages[0].sequence_number != last + 1:
+            self._drop(str(session_id))
+            self.gap_invalidations += 1
+            return
+        added = self._size_of(messages)
+        transcript.extend(messages)
+        self._sessions[str(session_id)] = (transcript, size + added)
+        self._sessions.move_to_end(str(session_id))
+        self.total_bytes += added
+        self._evict()
+
+    def invalidate(self, session_id: str):
+        self._drop(str(session_id))
+
+    def _drop(self, session_id: str):
+        entry = self._sessions.pop(session_id, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def _evict(self):
+        while self._sessions and (len(self._sessions) > self.max_sessions or self.total_bytes > self.max_bytes):
+            _, (_, size) = self._sessions.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "gap_invalidations": self.gap_invalidations
+        }
+
+
+# Tables whose changes (keyed by user id) invalidate the user context
+USER_CONTEXT_TABLES = ("users", "user_preferences", "dosha_assessment", "user_onboarding")
+
+# Global instances
+_user_context_cache = None
+_session_transcript_cache = None
+
+
+def get_user_context_cache() -> TTLCache:
+    """Per-user cache of profile, preferences and prakriti"""
+    global _user_context_cache
+    if _user_context_cache is None:
+        _user_context_cache = TTLCache(
+            "user_context",
+            max_entries=settings.USER_CONTEXT_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.USER_CONTEXT_CACHE_TTL_SECONDS
+        )
+    return _user_context_cache
+
+
+def invalidate_user_context(user_id: str):
+    """
+    Drop this replica's cached context for a user. Other replicas are
+    notified through the invalidation bus (see publish_change).
+    """
+    if get_user_context_cache().invalidate(str(user_id)):
+        logger.info(f"Invalidated cached context for user {user_id}")
+
+
+def get_session_transcript_cache() -> SessionTranscriptCache:
+    """Per-session cache of conversation messages"""
+    global _session_transcript_cache
+    if _session_transcript_cache is None:
+        _session_transcript_cache = SessionTranscriptCache(
+            max_sessions=settings.SESSION_TRANSCRIPT_CACHE_MAX_SESSIONS,
+            max_bytes=settings.SESSION_TRANSCRIPT_CACHE_MAX_BYTES
+        )
+    return _session_transcript_cache
@@ -0,0 +1,47 @@
+# app/services/cancellation.py
+"""
+Propagate client disconnects into in-flight work.
+
+Starlette does not cancel a handler when the client goes away, so long
+awaits (the LLM call) are raced against a disconnect poll and cancelled
+as soon as nobody is waiting for the answer.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, TypeVar
+
+from fastapi import Request
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Non-standard status used by nginx and others for "client closed request"
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client disconnects before the work finished"""
+
+
+async def run_until_disconnected(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    Await `awaitable`, cancelling it and raising ClientDisconnected
+    if the client disconnects first.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=settings.DISCONNECT_POLL_INTERVAL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info(f"Client disconnected from {request.url.path} — cancelling in-flight work")
+                task.cancel()
+                raise ClientDisconnected()
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
@@ -0,0 +1,167 @@
+# app/services/circuit_breaker.py
+"""
+Per-provider circuit breaker for outbound AI calls.
+
+Tracks error rate and latency over a sliding window of recent calls and
+rejects new calls while a provider is failing, so slow requests do not pile up.
+"""
+
+import logging
+import math
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Sliding-window circuit breaker with closed / open / half-open states"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int = 20,
+        min_calls: int = 5,
+        error_rate_threshold: float = 0.5,
+        slow_call_ms: float = 10000,
+        slow_call_rate_threshold: float = 0.8,
+        cooldown_seconds: float = 30.0
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_ms = slow_call_ms
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.cooldown_seconds = cooldown_seconds
+
+        # (succeeded, latency_ms) for the most recent calls
+        self._outcomes = deque(maxlen=window_size)
+        # Latencies of recent successful calls, used for percentile estimates
+        self._latencies = deque(maxlen=max(window_size * 5, 100))
+
+        self.state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected_calls = 0
+
+    def allow_request(self) -> bool:
+        """Return True if a call may go through to the provider"""
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.cooldown_seconds:
+                self.rejected_calls += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+            logger.info(f"Circuit '{self.name}' half-open, allowing a probe call")
+
+        # Half-open: let exactly one probe through
+        if self._probe_in_flight:
+            self.rejected_calls += 1
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self, latency_ms: float):
+        """Record a completed call"""
+        self._latencies.append(latency_ms)
+        if self.state == self.HALF_OPEN:
+            self._close()
+            return
+        self._outcomes.append((True, latency_ms))
+        self._evaluate()
+
+    def record_failure(self, latency_ms: float):
+        """Record a failed or timed-out call"""
+        if self.state == self.HALF_OPEN:
+            self._open("probe call failed")
+            return
+        self._outcomes.append((False, latency_ms))
+        self._evaluate()
+
+    def release_probe(self):
+        """Allow another probe when a half-open probe ended without an outcome"""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def latency_percentile(self, percentile: float, min_samples: int = 10) -> Optional[float]:
+        """Latency (ms) at the given percentile of recent successful calls"""
+        if len(self._latencies) < min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, max(0, math.ceil(percentile * len(ordered)) - 1))
+        return ordered[index]
+
+    def snapshot(self) -> dict:
+        """Current state and window statistics"""
+        calls = len(self._outcomes)
+        failures = sum(1 for ok, _ in self._outcomes if not ok)
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "error_rate": round(failures / calls, 3) if calls else 0.0,
+            "p50_ms": self.latency_percentile(0.5, min_samples=1),
+            "p95_ms": self.latency_percentile(0.95, min_samples=1),
+            "rejected_calls": self.rejected_calls
+        }
+
+    def _evaluate(self):
+        calls = len(self._outcomes)
+        if calls < self.min_calls:
+            return
+
+        failures = sum(1 for ok, _ in self._outcomes if not ok)
+        slow = sum(1 for _, latency in self._outcomes if latency >= self.slow_call_ms)
+
+        if failures / calls >= self.error_rate_threshold:
+            self._open(f"error rate {failures}/{calls}")
+        elif slow / calls >= self.slow_call_rate_threshold:
+            self._open(f"slow call rate {slow}/{calls}")
+
+    def _open(self, reason: str):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._outcomes.clear()
+        logger.warning(f"Circuit '{self.name}' opened ({reason}); failing fast for {self.cooldown_seconds}s")
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._probe_in_flight = False
+        self._outcomes.clear()
+        logger.info(f"Circuit '{self.name}' closed")
+
+
+# Registry of breakers, one per provider
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    """Get or create the circuit breaker for a provider"""
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        breaker = CircuitBreaker(
+            name=provider,
+            window_size=settings.LLM_CIRCUIT_WINDOW_SIZE,
+            min_calls=settings.LLM_CIRCUIT_MIN_CALLS,
+            error_rate_threshold=settings.LLM_CIRCUIT_ERROR_RATE,
+            slow_call_ms=settings.LLM_CIRCUIT_SLOW_CALL_MS,
+            slow_call_rate_threshold=settings.LLM_CIRCUIT_SLOW_CALL_RATE,
+            cooldown_seconds=settings.LLM_CIRCUIT_COOLDOWN_SECONDS
+        )
+        _breakers[provider] = breaker
+    return breaker
+
+
+def get_circuit_breaker_stats() -> dict:
+    """Snapshot of every registered breaker"""
+    return {name: breaker.snapshot() for name, breaker in _breakers.items()}
@@ -1,7 +1,9 @@
 # app/services/database_service.py
 
-from sqlalchemy import select, desc, and_, func
+from sqlalchemy import select, insert, desc, and_, or_, func, text
+from dataclasses import dataclass, field
 from datetime import date, datetime, timedelta
+from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.user import User
 from app.models.user_preferences import UserPreferences
@@ -9,6 +11,12 @@ from app.models.dosha_tracking import DoshaTracking
 from app.models.dosha_assessment import DoshaAssessment
 from app.models.conversation_session import ConversationSession
 from app.models.chat_message import ConversationMessage
+from app.models.emotion_analysis import EmotionAnalysis
+from app.services.cache import get_user_context_cache, get_session_transcript_cache
+from app.services.post_response import stage_jobs, get_post_response_queue
+from app.services.idempotency import KeyCompletion, complete_key
+import json
+import re
 import uuid
 
 
@@ -80,6 +88,9 @@ async def create_conversation_session(
     db.add(session)
     await db.commit()
     await db.refresh(session)
+
+    # A new session has no messages; start its transcript so the first turns are hits
+    get_session_transcript_cache().put(str(session.session_id), [])
     
     return session
 
@@ -104,34 +115,280 @@ async def get_conversation_session(
     return result.scalars().first()
 
 
+ALLOCATE_SEQUENCE_SQL = text("""
+UPDATE conversation_sessions
+SET last_sequence_number = last_sequence_number + :count
+WHERE session_id = CAST(:session_id AS uuid)
+RETURNING last_sequence_number
+""")
+
+
+async def allocate_sequence_numbers(db: AsyncSession, session_id: str, count: int = 1) -> int:
+    """
+    Reserve `count` consecutive message sequence numbers in a session and
+    return the first. The counter row stays locked until the caller's
+    transaction ends, so concurrent turns (on any replica) never share numbers.
+    """
+    result = await db.execute(ALLOCATE_SEQUENCE_SQL, {"session_id": session_id, "count": count})
+    last = result.scalar_one_or_none()
+    if last is None:
+        raise ValueError(f"Conversation session {session_id} not found")
+    return last - count + 1
+
+
 async def save_conversation_message(
     db: AsyncSession,
     session_id: str,
     user_id: str,
-    sequence_number: int,
     transcript_text: str = None,
     ai_response_text: str = None,
-    input_type: str = 'text'
+    input_type: str = 'text',
+    detected_context: str = None
 ) -> ConversationMessage:
     """
     Save conversation message to database (supports both user input and AI response)
     """
+    try:
+        sequence_number = await allocate_sequence_numbers(db, session_id)
+    except Exception:
+        await db.rollback()
+        raise
+
     message = ConversationMessage(
         session_id=session_id,
         user_id=user_id,
         sequence_number=sequence_number,
         transcript_text=transcript_text,
         ai_response_text=ai_response_text,
-        input_type=input_type if transcript_text else None
+        input_type=input_type if transcript_text else None,
+        detected_context=detected_context
     )
     
     db.add(message)
     await db.commit()
     await db.refresh(message)
+
+    get_session_transcript_cache().append(session_id, [
+        CheckinMessage(
+            message_id=str(message.message_id),
+            sequence_number=message.sequence_number,
+            transcript_text=message.transcript_text,
+            ai_response_text=message.ai_response_text,
+            created_at=message.created_at
+        )
+    ])
     
     return message
 
 
+async def save_checkin_turn(
+    db: AsyncSession,
+    session_id: str,
+    user_id: str,
+    transcript_text: str,
+    ai_response_text: str,
+    input_type: str = 'text',
+    detected_context: str = None,
+    emotion: dict = None,
+    post_response_jobs=None,
+    idempotency: Optional[KeyCompletion] = None
+) -> tuple:
+    """
+    Persist a whole check-in turn in one transaction: the user message and
+    the AI reply (two sequence numbers allocated from the session counter)
+    and, if given, the emotion analysis of the user message (EmotionAnalysis
+    column values, without message_id/user_id). Generated values come back
+    via RETURNING, so the turn costs one statement per table plus the
+    allocation and a single commit; on failure nothing is written.
+
+    post_response_jobs, if given, is called with the user message id and
+    returns OutboxJobs that are written to the outbox in the same
+    transaction and handed to the post-response workers after the commit.
+    idempotency, if given, marks the turn's Idempotency-Key completed with
+    its response in the same transaction.
+
+    Returns (user_message, ai_message) as CheckinMessage.
+    """
+    try:
+        sequence_number = await allocate_sequence_numbers(db, session_id, count=2)
+
+        user_message_id = uuid.uuid4()
+        rows = [
+            {
+                "message_id": user_message_id,
+                "session_id": session_id,
+                "user_id": user_id,
+                "sequence_number": sequence_number,
+                "transcript_text": transcript_text,
+                "ai_response_text": None,
+                "input_type": input_type,
+                "detected_context": detected_context
+            },
+            {
+                "message_id": uuid.uuid4(),
+                "session_id": session_id,
+                "user_id": user_id,
+                "sequence_number": sequence_number + 1,
+                "transcript_text": None,
+                "ai_response_text": ai_response_text,
+                "input_type": None,
+                "detected_context": None
+            }
+        ]
+
+        result = await db.execute(
+            insert(ConversationMessage)
+            .values(rows)
+            .returning(ConversationMessage.message_id, ConversationMessage.created_at)
+        )
+        created_at = {row.message_id: row.created_at for row in result}
+
+        if emotion is not None:
+            await db.execute(
+                insert(EmotionAnalysis).values(message_id=user_message_id, user_id=user_id, **emotion)
+            )
+
+        staged_jobs = []
+        if post_response_jobs is not None:
+            staged_jobs = await stage_jobs(db, post_response_jobs(str(user_message_id)))
+
+        if idempotency is not None:
+            await complete_key(db, idempotency)
+
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    get_post_response_queue().dispatch(staged_jobs)
+
+    saved = tuple(
+        CheckinMessage(
+            message_id=str(row["message_id"]),
+            sequence_number=row["sequence_number"],
+            transcript_text=row["transcript_text"],
+            ai_response_text=row["ai_response_text"],
+            created_at=created_at.get(row["message_id"])
+        )
+        for row in rows
+    )
+    get_session_transcript_cache().append(session_id, list(saved))
+    return saved
+
+
+UPSERT_DOSHA_TRACKING_SQL = text("""
+INSERT INTO dosha_tracking
+    (user_id, date, vikriti_scores, dominant_imbalance, imbalance_intensity,
+     detected_emotion, emotion_to_dosha_mapping)
+VALUES
+    (CAST(:user_id AS uuid), :day, CAST(:vikriti_scores AS jsonb), :dominant_imbalance,
+     :imbalance_intensity, :detected_emotion, CAST(:emotion_to_dosha_mapping AS jsonb))
+ON CONFLICT (user_id, date) DO UPDATE SET
+    vikriti_scores = EXCLUDED.vikriti_scores,
+    dominant_imbalance = COALESCE(EXCLUDED.dominant_imbalance, dosha_tracking.dominant_imbalance),
+    imbalance_intensity = COALESCE(EXCLUDED.imbalance_intensity, dosha_tracking.imbalance_intensity),
+    detected_emotion = EXCLUDED.detected_emotion,
+    emotion_to_dosha_mapping = EXCLUDED.emotion_to_dosha_mapping,
+    created_at = now()
+""")
+
+# Same streak rules as the Node streakService: consecutive day +1, same day no-op, gap resets
+UPDATE_USER_STREAK_SQL = text("""
+INSERT INTO user_streaks (user_id, current_streak, longest_streak, last_active_date)
+VALUES (CAST(:user_id AS uuid), 1, 1, :day)
+ON CONFLICT (user_id) DO UPDATE SET
+    current_streak = CASE
+        WHEN user_streaks.last_active_date = EXCLUDED.last_active_date THEN user_streaks.current_streak
+        WHEN user_streaks.last_active_date = EXCLUDED.last_active_date - 1 THEN user_streaks.current_streak + 1
+        ELSE 1
+    END,
+    longest_streak = GREATEST(user_streaks.longest_streak, CASE
+        WHEN user_streaks.last_active_date = EXCLUDED.last_active_date THEN user_streaks.current_streak
+        WHEN user_streaks.last_active_date = EXCLUDED.last_active_date - 1 THEN user_streaks.current_streak + 1
+        ELSE 1
+    END),
+    last_active_date = EXCLUDED.last_active_date
+""")
+
+# A turn counts towards today's conversations; emotion fields come from the
+# emotion job, which may run first (hence its insert with a zero count)
+UPSERT_DAILY_PROGRESS_SQL = text("""
+INSERT INTO user_progress_daily (user_id, date, conversations_count)
+VALUES (CAST(:user_id AS uuid), :day, 1)
+ON CONFLICT (user_id, date) DO UPDATE SET
+    conversations_count = user_progress_daily.conversations_count + 1
+""")
+
+UPSERT_DAILY_PROGRESS_EMOTION_SQL = text("""
+INSERT INTO user_progress_daily
+    (user_id, date, primary_emotion_day, dominant_imbalance, imbalance_intensity, conversations_count)
+VALUES
+    (CAST(:user_id AS uuid), :day, :primary_emotion, :dominant_imbalance, :imbalance_intensity, 0)
+ON CONFLICT (user_id, date) DO UPDATE SET
+    primary_emotion_day = COALESCE(EXCLUDED.primary_emotion_day, user_progress_daily.primary_emotion_day),
+    dominant_imbalance = COALESCE(EXCLUDED.dominant_imbalance, user_progress_daily.dominant_imbalance),
+    imbalance_intensity = COALESCE(EXCLUDED.imbalance_intensity, user_progress_daily.imbalance_intensity)
+""")
+
+
+def _imbalance_from_emotion(emotion: dict) -> tuple:
+    """(dominant_imbalance, intensity 1-10) from emotion_service output; (None, None) when balanced"""
+    dosha = emotion.get('dosha')
+    if dosha not in ("Vata", "Pitta", "Kapha"):
+        return None, None
+    confidence = float(emotion.get('emotion_confidence') or 0)
+    return dosha, max(1, min(10, round(confidence * 10)))
+
+
+async def record_turn_progress(db: AsyncSession, user_id: str, day: date):
+    """
+    Post-response writes every turn makes: the user's streak and today's
+    conversation count. Doesn't commit (the outbox job commits with its
+    own completion).
+    """
+    await db.execute(UPDATE_USER_STREAK_SQL, {"user_id": user_id, "day": day})
+    await db.execute(UPSERT_DAILY_PROGRESS_SQL, {"user_id": user_id, "day": day})
+
+
+async def record_turn_emotion(
+    db: AsyncSession,
+    user_id: str,
+    day: date,
+    user_message_id: str,
+    emotion: dict,
+    emotion_values: dict
+):
+    """
+    Post-response writes that depend on emotion analysis: the analysis of
+    the user message (EmotionAnalysis column values), today's dosha
+    tracking and the emotion fields of daily progress. emotion is the raw
+    emotion_service output. Doesn't commit.
+    """
+    dominant_imbalance, intensity = _imbalance_from_emotion(emotion)
+
+    await db.execute(
+        insert(EmotionAnalysis).values(message_id=user_message_id, user_id=user_id, **emotion_values)
+    )
+    await db.execute(UPSERT_DOSHA_TRACKING_SQL, {
+        "user_id": user_id,
+        "day": day,
+        "vikriti_scores": json.dumps({
+            k.lower(): v for k, v in (emotion.get('dosha_scores') or {}).items()
+        }),
+        "dominant_imbalance": dominant_imbalance,
+        "imbalance_intensity": intensity,
+        "detected_emotion": emotion.get('primary_emotion'),
+        "emotion_to_dosha_mapping": json.dumps({emotion.get('primary_emotion'): emotion.get('dosha')})
+    })
+    await db.execute(UPSERT_DAILY_PROGRESS_EMOTION_SQL, {
+        "user_id": user_id,
+        "day": day,
+        "primary_emotion": emotion.get('primary_emotion'),
+        "dominant_imbalance": dominant_imbalance,
+        "imbalance_intensity": intensity
+    })
+
+
 async def get_session_messages(
     db: AsyncSession,
     session_id: str
@@ -165,6 +422,151 @@ async def get_conversation_history(
     return list(reversed(messages))
 
 
+@dataclass
+class HistoryPage:
+    """One page of history, newest-first keyset; messages are in chronological order"""
+    messages: list
+    has_more: bool
+    next_before: Optional[tuple] = None  # (created_at, message_id) of the oldest row
+
+
+async def get_conversation_history_page(
+    db: AsyncSession,
+    user_id: str,
+    limit: int = 20,
+    before: Optional[tuple] = None,
+    session_id: Optional[str] = None
+) -> HistoryPage:
+    """
+    Fetch a page of a user's messages older than the `before` cursor
+    (created_at, message_id), optionally limited to one session.
+
+    Seeks on idx_conv_messages_user (user_id, created_at DESC) instead of
+    OFFSET and selects only the columns /history returns.
+    """
+    query = (
+        select(
+            ConversationMessage.message_id,
+            ConversationMessage.created_at,
+            ConversationMessage.sequence_number,
+            ConversationMessage.transcript_text,
+            ConversationMessage.ai_response_text
+        )
+        .where(ConversationMessage.user_id == user_id)
+        .order_by(desc(ConversationMessage.created_at), desc(ConversationMessage.message_id))
+        .limit(limit + 1)
+    )
+    if session_id:
+        query = query.where(ConversationMessage.session_id == session_id)
+    if before:
+        before_created_at, before_message_id = before
+        # created_at <= :c is the index range; the OR breaks ties on message_id
+        query = query.where(
+            ConversationMessage.created_at <= before_created_at,
+            or_(
+                ConversationMessage.created_at < before_created_at,
+                ConversationMessage.message_id < before_message_id
+            )
+        )
+
+    rows = (await db.execute(query)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_before = (rows[-1].created_at, rows[-1].message_id) if has_more else None
+    # A turn's user and AI rows share created_at; sequence_number keeps them in order
+    rows.sort(key=lambda row: (row.created_at, row.sequence_number))
+    return HistoryPage(messages=rows, has_more=has_more, next_before=next_before)
+
+
+SESSION_PREVIEW_CHARS = 120
+
+# One page of a user's sessions with per-session aggregates. Every step is an
+# index(-only) scan on the covering indexes from migration 006. The first page
+# and cursor pages are separate statements: an "IS NULL OR (...)" cursor
+# filter would keep a generic plan from using the cursor as an index bound.
+_SESSION_LIST_SQL = """
+WITH page AS (
+    SELECT session_id, session_type, start_time, end_time
+    FROM conversation_sessions
+    WHERE user_id = CAST(:user_id AS uuid){cursor_filter}
+    ORDER BY start_time DESC, session_id DESC
+    LIMIT :limit
+),
+stats AS (
+    SELECT m.session_id, COUNT(*) AS message_count, MAX(m.sequence_number) AS last_sequence
+    FROM conversation_messages m
+    JOIN page USING (session_id)
+    GROUP BY m.session_id
+),
+emotions AS (
+    SELECT
+        m.session_id,
+        e.primary_emotion,
+        ROW_NUMBER() OVER (
+            PARTITION BY m.session_id
+            ORDER BY COUNT(*) DESC, MAX(e.analysis_timestamp) DESC
+        ) AS emotion_rank
+    FROM conversation_messages m
+    JOIN page USING (session_id)
+    JOIN emotion_analysis e ON e.message_id = m.message_id
+    GROUP BY m.session_id, e.primary_emotion
+)
+SELECT
+    page.session_id,
+    page.session_type,
+    page.start_time,
+    page.end_time,
+    COALESCE(stats.message_count, 0) AS message_count,
+    last_msg.created_at AS last_message_at,
+    LEFT(COALESCE(last_msg.ai_response_text, last_msg.transcript_text), :preview_chars) AS last_message_preview,
+    emotions.primary_emotion AS dominant_emotion
+FROM page
+LEFT JOIN stats USING (session_id)
+LEFT JOIN conversation_messages last_msg
+    ON last_msg.session_id = page.session_id AND last_msg.sequence_number = stats.last_sequence
+LEFT JOIN emotions
+    ON emotions.session_id = page.session_id AND emotions.emotion_rank = 1
+ORDER BY page.start_time DESC, page.session_id DESC
+"""
+SESSION_LIST_FIRST_PAGE_SQL = text(_SESSION_LIST_SQL.format(cursor_filter=""))
+SESSION_LIST_AFTER_CURSOR_SQL = text(_SESSION_LIST_SQL.format(
+    cursor_filter="\n      AND (start_time, session_id) < (CAST(:before_start AS timestamp), CAST(:before_id AS uuid))"
+))
+
+
+@dataclass
+class SessionListPage:
+    """One page of session summaries, newest first"""
+    sessions: list
+    has_more: bool
+    next_before: Optional[tuple] = None  # (start_time, session_id) of the last session
+
+
+async def list_conversation_sessions(
+    db: AsyncSession,
+    user_id: str,
+    limit: int = 20,
+    before: Optional[tuple] = None
+) -> SessionListPage:
+    """
+    Fetch a page of a user's sessions older than the `before` cursor
+    (start_time, session_id) with message count, last message preview and
+    dominant emotion, in one query.
+    """
+    params = {"user_id": user_id, "limit": limit + 1, "preview_chars": SESSION_PREVIEW_CHARS}
+    if before:
+        before_start, before_id = before
+        statement = SESSION_LIST_AFTER_CURSOR_SQL
+        params.update(before_start=before_start, before_id=str(before_id))
+    else:
+        statement = SESSION_LIST_FIRST_PAGE_SQL
+    rows = (await db.execute(statement, params)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_before = (rows[-1].start_time, rows[-1].session_id) if has_more else None
+    return SessionListPage(sessions=rows, has_more=has_more, next_before=next_before)
+
+
 async def get_recent_messages_last_two_days(
     db: AsyncSession,
     user_id: str
@@ -240,40 +642,320 @@ async def get_prakriti_bikriti_and_history(
         "history": history
     }
 
+# ---------------------------------------------------------------------------
+# Check-in context loader
+# ---------------------------------------------------------------------------
+
+@dataclass
+class CheckinUser:
+    """User fields needed by a check-in turn"""
+    id: str
+    full_name: Optional[str] = None
+
+
+@dataclass
+class CheckinPreferences:
+    """Preference fields used by the check-in prompt"""
+    nickname: Optional[str] = None
+    preferred_language: Optional[str] = None
+    emotional_attachment: Optional[int] = None
+
+
+@dataclass
+class CheckinMessage:
+    """Lightweight conversation message (no ORM identity)"""
+    message_id: str
+    sequence_number: int
+    transcript_text: Optional[str] = None
+    ai_response_text: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+
+@dataclass
+class UserProfileContext:
+    """Slow-changing per-user data; cached between turns (see app.services.cache)"""
+    user: CheckinUser
+    preferences: Optional[CheckinPreferences]
+    prakriti: str
+
+
+@dataclass
+class CheckinContext:
+    """Everything daily_checkin needs from the DB before calling the LLM"""
+    user: Optional[CheckinUser]
+    preferences: Optional[CheckinPreferences]
+    dosha_type_name: str
+    dosha_context: dict
+    session_found: bool
+    session_messages: list = field(default_factory=list)
+    recent_messages: list = field(default_factory=list)
+
+
+# load_checkin_context is assembled from two halves so the per-user
+# profile part can be skipped when it is already cached
+_PROFILE_CTES = """
+    u AS (
+        SELECT id, full_name FROM users WHERE id = CAST(:user_id AS uuid)
+    ),
+    p AS (
+        SELECT nickname, preferred_language, emotional_attachment
+        FROM user_preferences WHERE user_id = CAST(:user_id AS uuid)
+        LIMIT 1
+    ),
+    latest_assessment AS (
+        SELECT primary_dosha FROM dosha_assessment
+        WHERE user_id = CAST(:user_id AS uuid)
+        ORDER BY completed_at DESC
+        LIMIT 1
+    )"""
+
+_PROFILE_COLUMNS = """
+    (SELECT row_to_json(u) FROM u) AS user_row,
+    (SELECT row_to_json(p) FROM p) AS preferences_row,
+    (SELECT primary_dosha FROM latest_assessment) AS prakriti"""
+
+_TURN_CTES = """
+    latest_tracking AS (
+        SELECT dominant_imbalance, imbalance_intensity, created_at FROM dosha_tracking
+        WHERE user_id = CAST(:user_id AS uuid)
+        ORDER BY created_at DESC
+        LIMIT 1
+    ),
+    tracking_history AS (
+        SELECT DISTINCT ON (date) date, dominant_imbalance, imbalance_intensity, created_at
+        FROM dosha_tracking
+        WHERE user_id = CAST(:user_id AS uuid) AND date >= :yesterday
+        ORDER BY date, created_at DESC
+    ),
+    s AS (
+        SELECT session_id FROM conversation_sessions
+        WHERE session_id = CAST(:session_id AS uuid) AND user_id = CAST(:user_id AS uuid)
+    ),
+    session_messages AS (
+        -- Only messages the session transcript cache hasn't seen yet
+        SELECT message_id, sequence_number, transcript_text, ai_response_text, created_at
+        FROM conversation_messages
+        WHERE session_id IN (SELECT session_id FROM s)
+          AND (CAST(:after_sequence AS integer) IS NULL OR sequence_number > CAST(:after_sequence AS integer))
+    ),
+    recent_messages AS (
+        -- The current session's share of the window comes from session_messages
+        SELECT message_id, sequence_number, transcript_text, ai_response_text, created_at
+        FROM conversation_messages
+        WHERE user_id = CAST(:user_id AS uuid) AND created_at >= :recent_since
+          AND session_id IS DISTINCT FROM CAST(:session_id AS uuid)
+    )"""
+
+_TURN_COLUMNS = """
+    (SELECT row_to_json(latest_tracking) FROM latest_tracking) AS bikriti_row,
+    (SELECT json_agg(tracking_history) FROM tracking_history) AS history_rows,
+    EXISTS (SELECT 1 FROM s) AS session_found,
+    (SELECT json_agg(m ORDER BY m.sequence_number) FROM session_messages m) AS session_rows,
+    (SELECT json_agg(m ORDER BY m.created_at) FROM recent_messages m) AS recent_rows"""
+
+CHECKIN_CONTEXT_SQL = text(
+    f"WITH{_PROFILE_CTES},{_TURN_CTES}\nSELECT{_PROFILE_COLUMNS},{_TURN_COLUMNS}"
+)
+CHECKIN_TURN_CONTEXT_SQL = text(f"WITH{_TURN_CTES}\nSELECT{_TURN_COLUMNS}")
+USER_PROFILE_CONTEXT_SQL = text(f"WITH{_PROFILE_CTES}\nSELECT{_PROFILE_COLUMNS}")
+
+
+def _json_value(value):
+    """JSON columns may arrive decoded or as text depending on the driver codec"""
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+
+def _parse_timestamp(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def _to_messages(rows) -> list[CheckinMessage]:
+    return [
+        CheckinMessage(
+            message_id=row["message_id"],
+            sequence_number=row["sequence_number"],
+            transcript_text=row.get("transcript_text"),
+            ai_response_text=row.get("ai_response_text"),
+            created_at=_parse_timestamp(row.get("created_at"))
+        )
+        for row in (_json_value(rows) or [])
+    ]
+
+
+def _dosha_entry(row: dict) -> dict:
+    return {
+        "dosha": row.get("dominant_imbalance") or "vata",
+        "intensity": row.get("imbalance_intensity"),
+        "updated_at": _parse_timestamp(row.get("created_at"))
+    }
+
+
+def _to_profile_context(row) -> Optional[UserProfileContext]:
+    user_row = _json_value(row["user_row"])
+    if not user_row:
+        return None
+    preferences_row = _json_value(row["preferences_row"])
+    return UserProfileContext(
+        user=CheckinUser(id=user_row["id"], full_name=user_row.get("full_name")),
+        preferences=CheckinPreferences(**preferences_row) if preferences_row else None,
+        prakriti=row["prakriti"] or "vata"  # Default
+    )
+
+
+async def get_user_profile_context(db: AsyncSession, user_id: str) -> Optional[UserProfileContext]:
+    """
+    User, preferences and prakriti, served from the per-user cache when
+    possible. Returns None if the user doesn't exist (misses aren't cached).
+    """
+    cache = get_user_context_cache()
+    profile = cache.get(str(user_id))
+    if profile is not None:
+        return profile
+
+    result = await db.execute(USER_PROFILE_CONTEXT_SQL, {"user_id": user_id})
+    profile = _to_profile_context(result.mappings().one())
+    if profile is not None:
+        cache.set(str(user_id), profile)
+    return profile
+
+
+async def load_checkin_context(
+    db: AsyncSession,
+    user_id: str,
+    session_id: str = None
+) -> CheckinContext:
+    """
+    Load user, preferences, prakriti/bikriti/dosha history, session messages
+    and the last 2 days of messages in a single round trip.
+
+    Equivalent to get_user_profile + get_user_preferences +
+    get_prakriti_bikriti_and_history + get_session_messages +
+    get_recent_messages_last_two_days, but as one CTE query. When the user's
+    profile context is cached the profile CTEs are left out of the query, and
+    session messages already in the transcript cache aren't re-read.
+    """
+    today = date.today()
+    yesterday = today - timedelta(days=1)
+    recent_since = datetime.utcnow() - timedelta(days=2)
+
+    cache = get_user_context_cache()
+    profile = cache.get(str(user_id))
+
+    # With a cached transcript only messages after its last sequence number are
+    # read (catches turns saved by other replicas). Sequence numbers are taken
+    # from the session counter inside the inserting transaction, so they commit
+    # in order, unlike created_at (transaction start time).
+    transcripts = get_session_transcript_cache()
+    cached_session = transcripts.get(session_id) if session_id else None
+    after_sequence = cached_session[-1].sequence_number if cached_session else None
+
+    result = await db.execute(
+        CHECKIN_TURN_CONTEXT_SQL if profile is not None else CHECKIN_CONTEXT_SQL,
+        {
+            "user_id": user_id,
+            "session_id": session_id,
+            "after_sequence": after_sequence,
+            "yesterday": yesterday,
+            "recent_since": recent_since
+        }
+    )
+    row = result.mappings().one()
+
+    if profile is None:
+        profile = _to_profile_context(row)
+        if profile is not None:
+            cache.set(str(user_id), profile)
+
+    bikriti_row = _json_value(row["bikriti_row"])
+    prakriti = profile.prakriti if profile else "vata"  # Default
+
+    history = {"today": None, "yesterday": None}
+    for entry in _json_value(row["history_rows"]) or []:
+        entry_date = date.fromisoformat(entry["date"])
+        if entry_date == today:
+            history["today"] = _dosha_entry(entry)
+        elif entry_date == yesterday:
+            history["yesterday"] = _dosha_entry(entry)
+
+    session_found = bool(row["session_found"])
+    session_messages = _to_messages(row["session_rows"])
+    if cached_session is not None:
+        seen = {m.message_id for m in cached_session}
+        session_messages = sorted(
+            cached_session + [m for m in session_messages if m.message_id not in seen],
+            key=lambda m: m.sequence_number
+        )
+    if session_found:
+        transcripts.put(session_id, session_messages)
+    else:
+        # Unknown session, or one owned by another user
+        session_messages = []
+
+    recent_messages = _to_messages(row["recent_rows"]) + [
+        m for m in session_messages if m.created_at and m.created_at >= recent_since
+    ]
+    recent_messages.sort(key=lambda m: m.created_at)
+
+    return CheckinContext(
+        user=profile.user if profile else None,
+        preferences=profile.preferences if profile else None,
+        dosha_type_name=prakriti,
+        dosha_context={
+            "prakriti": prakriti,
+            "bikriti": _dosha_entry(bikriti_row) if bikriti_row else None,
+            "history": history
+        },
+        session_found=session_found,
+        session_messages=session_messages,
+        recent_messages=recent_messages
+    )
+
+
 from app.models.ayurveda_knowledge import AyurvedaKnowledge
 
+async def get_knowledge_by_ids(db: AsyncSession, knowledge_ids: list[str]) -> list[AyurvedaKnowledge]:
+    """Fetch knowledge rows by id, in the order given"""
+    if not knowledge_ids:
+        return []
+    result = await db.execute(
+        select(AyurvedaKnowledge)
+        .where(AyurvedaKnowledge.knowledge_id.in_([uuid.UUID(k) for k in knowledge_ids]))
+    )
+    by_id = {str(item.knowledge_id): item for item in result.scalars().all()}
+    return [by_id[knowledge_id] for knowledge_id in knowledge_ids if knowledge_id in by_id]
+
+
+_SEARCH_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
 async def get_relevant_knowledge(
     db: AsyncSession,
     user_text: str,
     limit: int = 3
 ) -> list[AyurvedaKnowledge]:
     """
-    Fetch relevant Ayurvedic knowledge based on keywords in user text.
-    Currently using simple ILIKE search on title and description.
+    Fetch relevant Ayurvedic knowledge for the user's text with Postgres
+    full-text search, ranked by ts_rank_cd on the weighted search_vector
+    (GIN index, migrations/008).
+
+    The words are OR'd: websearch_to_tsquery would otherwise require every
+    word of a conversational sentence to match. Stopwords are dropped and
+    words stemmed by the 'english' config.
     """
-    # Extract significant words (very simple keyword extraction)
-    words = [w for w in user_text.lower().split() if len(w) > 4]
-    
+    # "or" is websearch syntax, so it can't be a search word itself
+    words = [w for w in _SEARCH_WORD_RE.findall(user_text.lower()) if w != "or"]
     if not words:
         return []
 
-    # Build OR conditions
-    conditions = []
-    for word in words:
-        term = f"%{word}%"
-        conditions.append(AyurvedaKnowledge.title.ilike(term))
-        conditions.append(AyurvedaKnowledge.description_short.ilike(term))
-        # conditions.append(AyurvedaKnowledge.helps_with_emotions.cast(Text).ilike(term)) # If needed
-
-    if not conditions:
-        return []
-
-    from sqlalchemy import or_
-    
+    query = func.websearch_to_tsquery("english", " or ".join(words))
     result = await db.execute(
         select(AyurvedaKnowledge)
-        .where(or_(*conditions))
+        .where(AyurvedaKnowledge.search_vector.op("@@")(query))
+        .order_by(desc(func.ts_rank_cd(AyurvedaKnowledge.search_vector, query)))
         .limit(limit)
     )
-    
-    return result.scalars().all()
\ No newline at end of file
+    return result.scalars().all()
@@ -0,0 +1,246 @@
+# app/services/embedding_index.py
+"""
+Semantic knowledge retrieval over precomputed sentence embeddings.
+
+build_knowledge_embeddings.py embeds every ayurveda_knowledge row offline
+with a local CPU sentence encoder and writes:
+  * <KNOWLEDGE_EMBEDDINGS_PATH>       float32 matrix (rows x dim), L2-normalised
+  * <same path with .json suffix>     manifest: model, knowledge ids and the
+                                      balances_doshas / helps_with_emotions
+                                      of each row
+
+The matrix is memory-mapped, so replicas share the page cache and startup
+doesn't copy it. A query is one normalised encoding and a NumPy mat-vec
+(cosine similarity); at the knowledge base's size that beats an ANN
+structure. Dosha/emotion filters are boolean masks precomputed per value.
+
+With KNOWLEDGE_EMBEDDING_MODEL = "bert-emotion" the encoder is the BERT
+emotion detector itself: knowledge rows are embedded with its pooled hidden
+states, and a check-in's query embedding comes out of the forward pass that
+already runs for emotion analysis, so retrieval adds no model and no pass.
+
+Rows added after the last offline build are not searchable until it is
+re-run. Needs numpy, plus sentence-transformers (the "embeddings" extra) for
+sentence-transformers models; without them the index stays unavailable and
+retrieval uses full-text search.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    _NUMPY_AVAILABLE = True
+except ImportError as _numpy_import_err:
+    logger.warning(f"Embedding retrieval not available (numpy missing): {_numpy_import_err}")
+    np = None  # type: ignore
+    _NUMPY_AVAILABLE = False
+
+
+def manifest_path(embeddings_path: str) -> Path:
+    return Path(embeddings_path).with_suffix(".json")
+
+
+def knowledge_embedding_text(item) -> str:
+    """Text embedded for one knowledge row (shared with the offline build)"""
+    parts = [item.title, item.description_short, item.description_detailed]
+    for values in (item.helps_with_emotions, item.balances_doshas):
+        if isinstance(values, (list, tuple)):
+            parts.append(", ".join(str(value) for value in values))
+    return ". ".join(part for part in parts if part)
+
+
+# KNOWLEDGE_EMBEDDING_MODEL value selecting the emotion detector's BERT encoder
+EMOTION_ENCODER_MODEL = "bert-emotion"
+
+
+class _EmotionEncoder:
+    """SentenceTransformer-style encode() over the BERT emotion detector"""
+
+    def __init__(self, detector):
+        self.detector = detector
+
+    def encode(self, texts, batch_size: int = 32, **kwargs):
+        if isinstance(texts, str):
+            return self.detector.embed([texts])[0]
+        return self.detector.embed(list(texts), batch_size=batch_size)
+
+
+def load_encoder(model_name: str):
+    """Load the local sentence encoder (CPU), or wrap the emotion detector's"""
+    if model_name == EMOTION_ENCODER_MODEL:
+        from app.services.emotion_service import get_emotion_service
+        detector = get_emotion_service().detector
+        if detector is None:
+            raise RuntimeError("BERT emotion detector is not loaded")
+        return _EmotionEncoder(detector)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device="cpu")
+
+
+def _normalise_values(values) -> List[str]:
+    if isinstance(values, str):
+        values = [values]
+    return [str(value).strip().lower() for value in values or []]
+
+
+class EmbeddingIndex:
+    """Memory-mapped embedding matrix with cosine top-k and dosha/emotion filters"""
+
+    def __init__(self, embeddings_path: str, model_name: str, min_score: float = 0.25):
+        self.embeddings_path = embeddings_path
+        self.model_name = model_name
+        self.min_score = min_score
+        self.ready = False
+        self._matrix = None
+        self._encoder = None
+        self._knowledge_ids: List[str] = []
+        self._dosha_masks: Dict[str, "np.ndarray"] = {}
+        self._emotion_masks: Dict[str, "np.ndarray"] = {}
+        self._load_task: Optional[asyncio.Task] = None
+        self.searches = 0
+        self.search_ms_total = 0.0
+        self.load_error: Optional[str] = None
+
+    # -- loading -----------------------------------------------------------
+
+    def load(self):
+        """Map the matrix, read the manifest and load the encoder (blocking)"""
+        if not _NUMPY_AVAILABLE:
+            self.load_error = "numpy not installed"
+            return
+        try:
+            manifest = json.loads(manifest_path(self.embeddings_path).read_text())
+            matrix = np.load(self.embeddings_path, mmap_mode="r")
+            if matrix.dtype != np.float32 or matrix.shape[0] != len(manifest["knowledge_ids"]):
+                raise ValueError(
+                    f"{self.embeddings_path} doesn't match its manifest "
+                    f"({matrix.shape} {matrix.dtype}, {len(manifest['knowledge_ids'])} ids)"
+                )
+            if manifest["model"] != self.model_name:
+                raise ValueError(f"Embeddings were built with {manifest['model']}, not {self.model_name}")
+
+            self._dosha_masks = self._build_masks(manifest["balances_doshas"], len(matrix))
+            self._emotion_masks = self._build_masks(manifest["helps_with_emotions"], len(matrix))
+            self._encoder = load_encoder(self.model_name)
+            self._matrix = matrix
+            self._knowledge_ids = manifest["knowledge_ids"]
+            self.ready = True
+            self.load_error = None
+            logger.info(f"Embedding index loaded: {matrix.shape[0]} rows x {matrix.shape[1]} dims ({self.model_name})")
+        except Exception as e:
+            self.load_error = str(e)
+            logger.error(f"Embedding index not loaded: {e}")
+
+    @staticmethod
+    def _build_masks(per_row_values: List[list], rows: int) -> Dict[str, "np.ndarray"]:
+        masks: Dict[str, np.ndarray] = {}
+        for row, values in enumerate(per_row_values):
+            for value in _normalise_values(values):
+                masks.setdefault(value, np.zeros(rows, dtype=bool))[row] = True
+        return masks
+
+    def start(self):
+        """Load in a worker thread; retrieval uses full-text search until ready"""
+        if self._load_task is None:
+            self._load_task = asyncio.create_task(asyncio.to_thread(self.load))
+
+    @property
+    def uses_emotion_encoder(self) -> bool:
+        """Query embeddings come from emotion analysis (see search_vector)"""
+        return self.model_name == EMOTION_ENCODER_MODEL
+
+    # -- search ------------------------------------------------------------
+
+    def encode(self, text: str) -> "np.ndarray":
+        return self._encoder.encode(text, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+    def _filter_mask(self, dosha: Optional[str], emotion: Optional[str]) -> Optional["np.ndarray"]:
+        masks = []
+        if dosha:
+            # "Vata-Pitta" matches practices balancing either dosha
+            parts = [self._dosha_masks.get(part) for part in _normalise_values(dosha.split("-"))]
+            parts = [mask for mask in parts if mask is not None]
+            if parts:
+                masks.append(np.logical_or.reduce(parts))
+        if emotion:
+            mask = self._emotion_masks.get(emotion.strip().lower())
+            if mask is not None:
+                masks.append(mask)
+        return np.logical_and.reduce(masks) if masks else None
+
+    def _top_k(self, scores: "np.ndarray", limit: int, exclude=()) -> List[int]:
+        candidates = np.flatnonzero(scores >= self.min_score)
+        if exclude:
+            candidates = np.setdiff1d(candidates, np.fromiter(exclude, dtype=np.int64), assume_unique=True)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        return sorted(candidates.tolist(), key=lambda row: -scores[row])
+
+    def search_vector(
+        self,
+        query: "np.ndarray",
+        limit: int = 3,
+        dosha: Optional[str] = None,
+        emotion: Optional[str] = None
+    ) -> List[str]:
+        """
+        Knowledge ids for the `limit` rows most similar to a normalised query
+        vector. Rows passing the dosha/emotion filters come first; the rest of
+        the page is filled from unfiltered rows so a filter never empties it.
+        """
+        start = time.perf_counter()
+        scores = self._matrix @ query
+        rows: List[int] = []
+        mask = self._filter_mask(dosha, emotion)
+        if mask is not None:
+            rows = self._top_k(np.where(mask, scores, -np.inf), limit)
+        if len(rows) < limit:
+            rows += self._top_k(scores, limit - len(rows), exclude=rows)
+        self.searches += 1
+        self.search_ms_total += (time.perf_counter() - start) * 1000
+        return [self._knowledge_ids[row] for row in rows]
+
+    def search(
+        self,
+        text: str,
+        limit: int = 3,
+        dosha: Optional[str] = None,
+        emotion: Optional[str] = None
+    ) -> List[str]:
+        """Encode text and search (blocking: run it in a worker thread)"""
+        return self.search_vector(self.encode(text), limit=limit, dosha=dosha, emotion=emotion)
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.ready,
+            "rows": len(self._knowledge_ids),
+            "model": self.model_name,
+            "load_error": self.load_error,
+            "searches": self.searches,
+            "avg_search_ms": round(self.search_ms_total / self.searches, 3) if self.searches else None
+        }
+
+
+# Global instance
+_embedding_index = None
+
+
+def get_embedding_index() -> EmbeddingIndex:
+    """Get or create the embedding index singleton"""
+    global _embedding_index
+    if _embedding_index is None:
+        _embedding_index = EmbeddingIndex(
+            embeddings_path=settings.KNOWLEDGE_EMBEDDINGS_PATH,
+            model_name=settings.KNOWLEDGE_EMBEDDING_MODEL,
+            min_score=settings.KNOWLEDGE_EMBEDDING_MIN_SCORE
+        )
+    return _embedding_index
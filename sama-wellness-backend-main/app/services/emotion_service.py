@@ -40,12 +40,14 @@ class EmotionAnalysisService:
             logger.error(f"Failed to load BERT model: {e}")
             self.detector = None
     
-    def analyze_emotion(self, text: str) -> dict:
+    def analyze_emotion(self, text: str, return_embedding: bool = False) -> dict:
         """
         Analyze emotion from text using BERT
         
         Args:
             text: User's message text
+            return_embedding: Also return the pooled BERT sentence embedding
+                from the same forward pass ('embedding'; absent on fallback)
             
         Returns:
             {
@@ -61,7 +63,7 @@ class EmotionAnalysisService:
             return self._fallback_detection(text)
         
         try:
-            result = self.detector.predict_with_dosha(text)
+            result = self.detector.predict_with_dosha(text, return_embedding=return_embedding)
             logger.info(f"Detected emotion: {result['primary_emotion']} ({result.get('emotion_confidence', 0):.2%}), Dosha: {result['dosha']}")
             return result
         except Exception as e:
@@ -0,0 +1,87 @@
+# app/services/export_service.py
+"""
+Full conversation-history export for a user, as gzip-compressed NDJSON.
+
+Sessions, messages, emotion analyses and dosha tracking are read through
+server-side cursors in chunks and compressed as they arrive, so memory use
+stays flat however long the history is and the first bytes go out as soon
+as the first chunk is read.
+"""
+
+import json
+import logging
+import uuid
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator
+
+from sqlalchemy import select
+
+from app.config import settings
+from app.database.connection import AsyncSessionLocal
+from app.models.conversation_session import ConversationSession
+from app.models.chat_message import ConversationMessage
+from app.models.emotion_analysis import EmotionAnalysis
+from app.models.dosha_tracking import DoshaTracking
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMAT_VERSION = 1
+GZIP_WBITS = 16 + zlib.MAX_WBITS  # zlib window with a gzip header/trailer
+
+# (record type, model, ordering column) in export order
+EXPORT_TABLES = (
+    ("session", ConversationSession, ConversationSession.start_time),
+    ("message", ConversationMessage, ConversationMessage.created_at),
+    ("emotion_analysis", EmotionAnalysis, EmotionAnalysis.analysis_timestamp),
+    ("dosha_tracking", DoshaTracking, DoshaTracking.date),
+)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, Decimal)):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _ndjson_line(record: dict) -> bytes:
+    return (json.dumps(record, default=_json_default, ensure_ascii=False) + "\n").encode()
+
+
+async def _iter_export_lines(user_id: str, chunk_rows: int) -> AsyncIterator[bytes]:
+    """Yield one chunk of NDJSON lines at a time"""
+    yield _ndjson_line({
+        "type": "export",
+        "format_version": EXPORT_FORMAT_VERSION,
+        "user_id": user_id,
+        "generated_at": datetime.utcnow()
+    })
+
+    # A dedicated session: the response body is produced after the request's
+    # get_db session has been closed
+    async with AsyncSessionLocal() as db:
+        for record_type, model, order_column in EXPORT_TABLES:
+            table = model.__table__
+            result = await db.stream(
+                select(*table.columns)
+                .where(table.c.user_id == user_id)
+                .order_by(order_column, *table.primary_key.columns)
+                .execution_options(yield_per=chunk_rows)
+            )
+            count = 0
+            async for partition in result.mappings().partitions():
+                count += len(partition)
+                yield b"".join(_ndjson_line({"type": record_type, **row}) for row in partition)
+            logger.info(f"Exported {count} {record_type} rows for user {user_id}")
+
+
+async def stream_user_export(user_id: str, chunk_rows: int = None) -> AsyncIterator[bytes]:
+    """Gzip-compressed NDJSON of everything stored for the user's conversations"""
+    compressor = zlib.compressobj(settings.EXPORT_GZIP_LEVEL, zlib.DEFLATED, GZIP_WBITS)
+    async for chunk in _iter_export_lines(user_id, chunk_rows or settings.EXPORT_CHUNK_ROWS):
+        # Sync-flush each chunk so the client receives data while we keep reading
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
@@ -0,0 +1,133 @@
+# app/services/fast_path.py
+"""
+LLM bypass for trivial check-in turns.
+
+Greetings ("hi"), acknowledgements ("thanks", "ok") and closings ("ok bye")
+are answered from personalized templates instead of the full
+emotion → knowledge → LLM pipeline.
+"""
+
+import random
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from app.config import settings
+
+
+GREETING = "greeting"
+ACKNOWLEDGEMENT = "acknowledgement"
+CLOSING = "closing"
+
+# Phrases that make up a trivial turn, by kind
+_PHRASES = {
+    GREETING: [
+        "good morning", "good afternoon", "good evening", "hi", "hii", "hiii",
+        "hello", "helloo", "hey", "heyy", "heya", "hiya", "namaste"
+    ],
+    ACKNOWLEDGEMENT: [
+        "thank you", "thank u", "thanks", "thanx", "thx", "ty", "ok", "okay",
+        "okk", "okie", "got it", "cool", "alright", "noted", "great", "nice"
+    ],
+    CLOSING: [
+        "good night", "goodnight", "gn", "bye bye", "goodbye", "bye", "byee",
+        "see you", "see ya", "cya", "talk to you later", "talk later", "ttyl"
+    ],
+}
+
+# Words that may surround a trivial phrase without changing its meaning
+_FILLERS = {"sama", "so", "much", "a", "lot", "dear", "buddy", "friend", "there", "again", "then", "oh", "and", "for", "now", "tomorrow"}
+
+# Longest phrases first so "good night" wins over "good"
+_PHRASE_INDEX = sorted(
+    ((tuple(phrase.split()), kind) for kind, phrases in _PHRASES.items() for phrase in phrases),
+    key=lambda item: len(item[0]),
+    reverse=True
+)
+
+_MAX_TRIVIAL_LENGTH = 40
+_NON_WORD = re.compile(r"[^a-z' ]+")
+
+_TEMPLATES = {
+    GREETING: [
+        "Good {time_of_day}, {nickname}! It's lovely to hear from you. How are you feeling today?",
+        "Hey {nickname}, good {time_of_day}! I'm here for you — what's on your mind?",
+        "Hi {nickname}! Good {time_of_day}. How's your {time_of_day} going so far?",
+    ],
+    ACKNOWLEDGEMENT: [
+        "Anytime, {nickname}. I'm right here if you want to share more.",
+        "Glad I could be here for you, {nickname}. Anything else on your mind?",
+        "Of course, {nickname}. Take it one gentle step at a time.",
+    ],
+    CLOSING: [
+        "Take care, {nickname}! {dosha_tip} Talk soon.",
+        "Bye for now, {nickname}. {dosha_tip} I'm here whenever you need me.",
+        "It was good talking to you, {nickname}. {dosha_tip} See you soon!",
+    ],
+}
+
+# A small parting suggestion matched to the user's prakriti
+_DOSHA_TIPS = {
+    "vata": "Stay warm and give yourself a calm, cozy {time_of_day}.",
+    "pitta": "Keep cool and go easy on yourself this {time_of_day}.",
+    "kapha": "A little movement and fresh air can lift your {time_of_day}.",
+}
+_DEFAULT_DOSHA_TIP = "Be gentle with yourself this {time_of_day}."
+
+
+def classify_trivial_turn(text: str) -> Optional[str]:
+    """
+    Return GREETING, ACKNOWLEDGEMENT or CLOSING when the whole message is a
+    trivial phrase, else None. Closings win over acknowledgements, which win
+    over greetings ("thanks, bye" is a closing).
+    """
+    if not text or len(text) > _MAX_TRIVIAL_LENGTH:
+        return None
+
+    words = _NON_WORD.sub(" ", text.lower()).split()
+    kinds = set()
+    i = 0
+    while i < len(words):
+        for phrase, kind in _PHRASE_INDEX:
+            if tuple(words[i:i + len(phrase)]) == phrase:
+                kinds.add(kind)
+                i += len(phrase)
+                break
+        else:
+            if words[i] not in _FILLERS:
+                return None
+            i += 1
+
+    for kind in (CLOSING, ACKNOWLEDGEMENT, GREETING):
+        if kind in kinds:
+            return kind
+    return None
+
+
+def user_local_now() -> datetime:
+    """Current time in the users' timezone (FAST_PATH_UTC_OFFSET_MINUTES)"""
+    return datetime.now(timezone(timedelta(minutes=settings.FAST_PATH_UTC_OFFSET_MINUTES)))
+
+
+def _time_of_day(now: datetime) -> str:
+    if 5 <= now.hour < 12:
+        return "morning"
+    if 12 <= now.hour < 17:
+        return "afternoon"
+    if 17 <= now.hour < 21:
+        return "evening"
+    return "night"
+
+
+def build_fast_reply(kind: str, nickname: str = None, dosha: str = None, now: datetime = None) -> str:
+    """Render a personalized template reply for a trivial turn"""
+    if now is None:
+        now = user_local_now()
+    time_of_day = _time_of_day(now)
+    if kind == GREETING and time_of_day == "night":
+        # "Good night" reads as a goodbye
+        time_of_day = "evening"
+
+    dosha_tip = _DOSHA_TIPS.get((dosha or "").lower(), _DEFAULT_DOSHA_TIP).format(time_of_day=time_of_day)
+    template = random.choice(_TEMPLATES[kind])
+    return template.format(nickname=nickname or "friend", time_of_day=time_of_day, dosha_tip=dosha_tip)
@@ -0,0 +1,306 @@
+# app/services/idempotency.py
+"""
+Idempotency-Key support for endpoints that must not run twice.
+
+Keys live in the idempotency_keys table (migration 011), so a retry is
+recognised on any replica. The first request with a given key inserts the
+key's row as 'pending' with a lease and runs the work in a detached task;
+check-in turns mark the row 'completed' with their response in the turn's
+own transaction (KeyCompletion), so a stored turn always has its stored
+reply. A retry that finds the row waits for it to complete
+(IDEMPOTENCY_WAIT_SECONDS, then 409) or replays the stored response.
+
+Retries on the same replica as the running request join its in-process
+future instead of polling. Failures are not stored: the row is deleted and
+the next retry runs the work again. If a replica dies mid-request the key
+is taken over once its lease expires.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database.connection import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+CHECKIN_SCOPE = "checkin"
+
+# Inserts the key, or takes over an expired row or a pending row whose lease
+# ran out (same request only); no row back means someone else holds the key
+CLAIM_KEY_SQL = text("""
+INSERT INTO idempotency_keys
+    (scope, user_id, idempotency_key, request_fingerprint, status, locked_until, expires_at)
+VALUES
+    (:scope, :user_id, :key, :fingerprint, 'pending',
+     now() + make_interval(secs => :lease_seconds), now() + make_interval(secs => :ttl_seconds))
+ON CONFLICT (scope, user_id, idempotency_key) DO UPDATE
+SET request_fingerprint = EXCLUDED.request_fingerprint,
+    status = 'pending',
+    response = NULL,
+    locked_until = EXCLUDED.locked_until,
+    created_at = now(),
+    expires_at = EXCLUDED.expires_at
+WHERE idempotency_keys.expires_at < now()
+   OR (idempotency_keys.status = 'pending'
+       AND idempotency_keys.locked_until < now()
+       AND idempotency_keys.request_fingerprint = EXCLUDED.request_fingerprint)
+RETURNING idempotency_key
+""")
+
+GET_KEY_SQL = text("""
+SELECT request_fingerprint, status, response
+FROM idempotency_keys
+WHERE scope = :scope AND user_id = :user_id AND idempotency_key = :key
+  AND expires_at >= now()
+""")
+
+COMPLETE_KEY_SQL = text("""
+UPDATE idempotency_keys
+SET status = 'completed', response = CAST(:response AS jsonb), locked_until = NULL
+WHERE scope = :scope AND user_id = :user_id AND idempotency_key = :key
+  AND status = 'pending'
+""")
+
+# Failures aren't stored; a completed row is never released
+RELEASE_KEY_SQL = text("""
+DELETE FROM idempotency_keys
+WHERE scope = :scope AND user_id = :user_id AND idempotency_key = :key
+  AND status = 'pending'
+""")
+
+PURGE_KEYS_SQL = text("DELETE FROM idempotency_keys WHERE expires_at < now()")
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a request with a different body"""
+
+
+class IdempotencyInProgress(Exception):
+    """The key's request is still running elsewhere after the wait limit"""
+
+
+def request_fingerprint(payload: dict) -> str:
+    """Stable hash of a request body, to detect key reuse with other data"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+@dataclass
+class KeyCompletion:
+    """A key to mark completed with its response, in the caller's transaction"""
+    scope: str
+    user_id: str
+    key: str
+    response: dict
+
+
+async def complete_key(db: AsyncSession, completion: KeyCompletion):
+    """Store the response of a keyed request (no commit)"""
+    await db.execute(COMPLETE_KEY_SQL, {
+        "scope": completion.scope,
+        "user_id": str(completion.user_id),
+        "key": completion.key,
+        "response": json.dumps(completion.response, default=str)
+    })
+
+
+class _InFlight:
+    __slots__ = ("fingerprint", "future")
+
+    def __init__(self, fingerprint: str, future: asyncio.Future):
+        self.fingerprint = fingerprint
+        self.future = future
+
+
+class IdempotencyStore:
+    """Durable key records plus in-process futures of the requests this replica runs"""
+
+    def __init__(
+        self,
+        scope: str,
+        ttl_seconds: float = 86400,
+        lease_seconds: float = 60,
+        wait_seconds: float = 35,
+        poll_seconds: float = 0.25,
+        purge_interval_seconds: float = 300
+    ):
+        self.scope = scope
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self.wait_seconds = wait_seconds
+        self.poll_seconds = poll_seconds
+        self.purge_interval_seconds = purge_interval_seconds
+        self._in_flight: Dict[Tuple[str, str], _InFlight] = {}
+        self._tasks: set = set()
+        self._next_purge = 0.0
+        self.executed = 0
+        self.joined = 0
+        self.waited = 0
+        self.replayed = 0
+        self.conflicts = 0
+        self.timed_out = 0
+
+    async def run(
+        self,
+        user_id: str,
+        key: str,
+        fingerprint: str,
+        work: Callable[[], Awaitable[Any]],
+        encode: Callable[[Any], dict] = lambda result: result,
+        decode: Callable[[dict], Any] = lambda response: response
+    ) -> tuple:
+        """
+        Run work() once per (user_id, key) across replicas. Returns (result,
+        replayed) where replayed is True if the result came from an earlier
+        or concurrent request. encode/decode convert the result to and from
+        the JSON response stored with the key.
+        """
+        local_key = (str(user_id), key)
+        entry = self._in_flight.get(local_key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                self.conflicts += 1
+                raise IdempotencyConflict()
+            self.joined += 1
+            result, _ = await asyncio.shield(entry.future)
+            return result, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[local_key] = _InFlight(fingerprint, future)
+        # Detached so the work survives the first caller going away; a retry can pick it up
+        task = asyncio.create_task(self._execute(local_key, fingerprint, work, encode, decode, future))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return await asyncio.shield(future)
+
+    async def _execute(self, local_key, fingerprint, work, encode, decode, future: asyncio.Future):
+        try:
+            outcome = await self._run_once(local_key, fingerprint, work, encode, decode)
+        except asyncio.CancelledError:
+            # A pending row is taken over once its lease expires
+            self._in_flight.pop(local_key, None)
+            future.cancel()
+            raise
+        except Exception as e:
+            self._in_flight.pop(local_key, None)
+            future.set_exception(e)
+            future.exception()  # Mark retrieved when nobody is waiting any more
+            return
+        self._in_flight.pop(local_key, None)
+        future.set_result(outcome)
+
+    async def _run_once(self, local_key, fingerprint, work, encode, decode) -> tuple:
+        user_id, key = local_key
+        deadline = time.monotonic() + self.wait_seconds
+        waited = False
+        while not await self._claim(user_id, key, fingerprint):
+            row = await self._load(user_id, key)
+            if row is not None:
+                if row["request_fingerprint"] != fingerprint:
+                    self.conflicts += 1
+                    raise IdempotencyConflict()
+                if row["status"] == "completed":
+                    self.replayed += 1
+                    return decode(row["response"]), True
+            # Running on another replica (or released/expired just now: claim again)
+            if not waited:
+                self.waited += 1
+                waited = True
+            if time.monotonic() >= deadline:
+                self.timed_out += 1
+                raise IdempotencyInProgress()
+            await asyncio.sleep(self.poll_seconds)
+
+        self.executed += 1
+        try:
+            result = await work()
+        except Exception:
+            await self._release(user_id, key)
+            raise
+        # No-op when the work already completed the key in its own transaction
+        await self._write(COMPLETE_KEY_SQL, {
+            "user_id": user_id,
+            "key": key,
+            "response": json.dumps(encode(result), default=str)
+        })
+        return result, False
+
+    async def _claim(self, user_id: str, key: str, fingerprint: str) -> bool:
+        async with AsyncSessionLocal() as db:
+            if time.monotonic() >= self._next_purge:
+                self._next_purge = time.monotonic() + self.purge_interval_seconds
+                await db.execute(PURGE_KEYS_SQL)
+            claimed = (await db.execute(CLAIM_KEY_SQL, {
+                "scope": self.scope,
+                "user_id": user_id,
+                "key": key,
+                "fingerprint": fingerprint,
+                "lease_seconds": self.lease_seconds,
+                "ttl_seconds": self.ttl_seconds
+            })).first()
+            await db.commit()
+        return claimed is not None
+
+    async def _load(self, user_id: str, key: str) -> Optional[dict]:
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(GET_KEY_SQL, {
+                "scope": self.scope, "user_id": user_id, "key": key
+            })).mappings().first()
+        if row is None:
+            return None
+        row = dict(row)
+        if isinstance(row["response"], str):
+            row["response"] = json.loads(row["response"])
+        return row
+
+    async def _release(self, user_id: str, key: str):
+        try:
+            await self._write(RELEASE_KEY_SQL, {"user_id": user_id, "key": key})
+        except Exception as e:
+            # The lease runs out and the next retry takes the key over
+            logger.error(f"Failed to release idempotency key {key} for user {user_id}: {e}")
+
+    async def _write(self, statement, params: dict):
+        async with AsyncSessionLocal() as db:
+            await db.execute(statement, {"scope": self.scope, **params})
+            await db.commit()
+
+    def snapshot(self) -> dict:
+        return {
+            "in_flight": len(self._in_flight),
+            "executed": self.executed,
+            "joined": self.joined,
+            "waited": self.waited,
+            "replayed": self.replayed,
+            "conflicts": self.conflicts,
+            "timed_out": self.timed_out
+        }
+
+
+# Global instance
+_idempotency_store = None
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Get or create the check-in idempotency store singleton"""
+    global _idempotency_store
+    if _idempotency_store is None:
+        _idempotency_store = IdempotencyStore(
+            scope=CHECKIN_SCOPE,
+            ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+            lease_seconds=settings.IDEMPOTENCY_LEASE_SECONDS,
+            wait_seconds=settings.IDEMPOTENCY_WAIT_SECONDS,
+            poll_seconds=settings.IDEMPOTENCY_POLL_SECONDS
+        )
+    return _idempotency_store
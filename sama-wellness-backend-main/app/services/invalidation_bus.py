@@ -0,0 +1,164 @@
+# app/services/invalidation_bus.py
+"""
+Cross-replica cache invalidation over Postgres LISTEN/NOTIFY.
+
+Triggers (migrations/004_cache_invalidation_notify.sql) and application
+writers publish {"table", "op", "key"} payloads on the cache_invalidation
+channel. Each replica holds one dedicated asyncpg connection that LISTENs
+and calls the handlers subscribed for that table.
+
+LISTEN needs a session-level connection: Supabase's transaction pooler
+won't deliver notifications, so INVALIDATION_LISTEN_DATABASE_URL should
+point at the direct or session-mode URL when DATABASE_URL uses the pooler.
+"""
+
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Callable, Optional
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache_invalidation"
+
+
+async def publish_change(db: AsyncSession, table: str, key: str, op: str = "UPDATE"):
+    """
+    Publish an invalidation from application code. NOTIFY is transactional,
+    so listeners only see it once the caller commits.
+    """
+    payload = json.dumps({"table": table, "op": op, "key": str(key)})
+    await db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+
+
+class InvalidationBus:
+    """One LISTEN connection per replica, dispatching to per-table handlers"""
+
+    def __init__(self, dsn: str, reconnect_seconds: float = 5, keepalive_seconds: float = 30):
+        self.dsn = dsn
+        self.reconnect_seconds = reconnect_seconds
+        self.keepalive_seconds = keepalive_seconds
+        self._handlers = defaultdict(list)
+        self._reset_handlers = []
+        self._task: Optional[asyncio.Task] = None
+        self.connected = False
+        self.received = 0
+        self.dispatched = 0
+        self.reconnects = 0
+        self.errors = 0
+
+    def subscribe(self, table: str, handler: Callable[[str], None], on_reset: Callable[[], None] = None):
+        """
+        Call handler(key) for every change to table. on_reset is called
+        whenever the listener (re)connects, since notifications sent while
+        disconnected are lost and the cache must be assumed stale.
+        """
+        self._handlers[table].append(handler)
+        if on_reset is not None and on_reset not in self._reset_handlers:
+            self._reset_handlers.append(on_reset)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self.received += 1
+        try:
+            message = json.loads(payload)
+            table, key = message["table"], message.get("key")
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Ignoring malformed invalidation payload: {payload!r}")
+            return
+
+        for handler in self._handlers.get(table, []):
+            try:
+                handler(key)
+                self.dispatched += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Invalidation handler for {table} failed: {e}")
+
+    def _reset_all(self):
+        for on_reset in self._reset_handlers:
+            try:
+                on_reset()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Invalidation reset handler failed: {e}")
+
+    async def _run(self):
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn, statement_cache_size=0)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(CHANNEL, self._on_notify)
+                self.connected = True
+                self._reset_all()
+                logger.info(f"Listening for cache invalidations on '{CHANNEL}'")
+
+                while not closed.is_set():
+                    try:
+                        await asyncio.wait_for(closed.wait(), timeout=self.keepalive_seconds)
+                    except asyncio.TimeoutError:
+                        # Surfaces half-open TCP connections that would otherwise
+                        # silently stop delivering notifications
+                        await connection.execute("SELECT 1")
+                logger.warning("Invalidation listener connection closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Invalidation listener error: {e}")
+            finally:
+                self.connected = False
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+            self.reconnects += 1
+            await asyncio.sleep(self.reconnect_seconds)
+
+    def snapshot(self) -> dict:
+        return {
+            "connected": self.connected,
+            "tables": sorted(self._handlers),
+            "received": self.received,
+            "dispatched": self.dispatched,
+            "reconnects": self.reconnects,
+            "errors": self.errors
+        }
+
+
+# Global instance
+_invalidation_bus = None
+
+
+def get_invalidation_bus() -> InvalidationBus:
+    """Get or create the invalidation bus singleton"""
+    global _invalidation_bus
+    if _invalidation_bus is None:
+        dsn = settings.INVALIDATION_LISTEN_DATABASE_URL or settings.DATABASE_URL
+        # asyncpg wants a plain libpq URL
+        dsn = dsn.replace("postgresql+asyncpg://", "postgresql://")
+        _invalidation_bus = InvalidationBus(
+            dsn,
+            reconnect_seconds=settings.INVALIDATION_RECONNECT_SECONDS
+        )
+    return _invalidation_bus
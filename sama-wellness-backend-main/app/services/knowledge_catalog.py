@@ -0,0 +1,335 @@
+# app/services/knowledge_catalog.py
+"""
+Versioned in-memory catalog of the Ayurveda knowledge base.
+
+Every ayurveda_knowledge row is loaded once into an immutable KnowledgeEntry:
+steps and precautions parsed from their JSON columns, and the item's line in
+the check-in prompt rendered. Retrieval returns entries and the prompt
+builder concatenates their snippets, so a turn does no JSON parsing or
+formatting per item.
+
+The entries live in a CatalogSnapshot that is replaced, never mutated: a
+refresh builds the new snapshot completely and swaps it in with one
+assignment, so readers always see one consistent version.
+
+A refresh first fingerprints the table with count(*) and max(updated_at)
+(kept current by a trigger, migrations/009) and only reloads when that
+changed. Single rows are reloaded copy-on-write from invalidation bus
+notifications. With the memory retrieval backend the knowledge index drives
+both (it builds from catalog entries); otherwise the catalog subscribes to
+the bus itself or checks its fingerprint periodically.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import MappingProxyType
+from typing import Iterable, List, Mapping, Optional, Tuple
+
+from sqlalchemy import select, func
+
+from app.database.connection import AsyncSessionLocal
+from app.models.ayurveda_knowledge import AyurvedaKnowledge
+
+logger = logging.getLogger(__name__)
+
+# (row count, max updated_at)
+Fingerprint = Tuple[int, Optional[datetime]]
+
+
+def parse_instructions(value) -> Tuple[str, ...]:
+    """
+    Steps/precautions column -> tuple of instruction strings. Accepts a JSON
+    string (rows written by the old SQLite schema), a list of strings, or a
+    list of {"step": n, "instruction": "..."} objects (ordered by step).
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            value = [value]
+    if isinstance(value, dict):
+        value = [value]
+    if not isinstance(value, (list, tuple)):
+        return ()
+    if all(isinstance(item, dict) and isinstance(item.get("step"), int) for item in value):
+        value = sorted(value, key=lambda item: item["step"])
+    instructions = []
+    for item in value:
+        if isinstance(item, dict):
+            item = item.get("instruction") or item.get("text") or item.get("description")
+        if item and str(item).strip():
+            instructions.append(str(item).strip())
+    return tuple(instructions)
+
+
+def _as_tuple(value) -> tuple:
+    if isinstance(value, (list, tuple)):
+        return tuple(value)
+    return (value,) if value else ()
+
+
+def render_prompt_snippet(
+    title: str,
+    description_short: Optional[str],
+    steps: Tuple[str, ...],
+    precautions: Tuple[str, ...]
+) -> str:
+    """The item's lines in the prompt's "Relevant Ayurveda Knowledge" section"""
+    snippet = f"- {title}: {description_short or ''}\n"
+    if steps:
+        snippet += "  Steps: " + " ".join(f"{n}. {step}" for n, step in enumerate(steps, 1)) + "\n"
+    if precautions:
+        snippet += "  Precautions: " + "; ".join(precautions) + "\n"
+    return snippet
+
+
+@dataclass(frozen=True)
+class KnowledgeEntry:
+    """One knowledge row as retrieval and prompt building use it"""
+    knowledge_id: str
+    content_type: str
+    title: str
+    description_short: Optional[str]
+    description_detailed: Optional[str]
+    balances_doshas: tuple
+    helps_with_emotions: tuple
+    not_recommended_for: tuple
+    best_for_season: Optional[str]
+    best_time_of_day: Optional[str]
+    difficulty: Optional[str]
+    duration_minutes: Optional[int]
+    steps: Tuple[str, ...]
+    precautions: Tuple[str, ...]
+    updated_at: Optional[datetime]
+    prompt_snippet: str = field(repr=False)
+
+    @classmethod
+    def from_row(cls, item: AyurvedaKnowledge) -> "KnowledgeEntry":
+        steps = parse_instructions(item.steps)
+        precautions = parse_instructions(item.precautions)
+        return cls(
+            knowledge_id=str(item.knowledge_id),
+            content_type=item.content_type,
+            title=item.title,
+            description_short=item.description_short,
+            description_detailed=item.description_detailed,
+            balances_doshas=_as_tuple(item.balances_doshas),
+            helps_with_emotions=_as_tuple(item.helps_with_emotions),
+            not_recommended_for=_as_tuple(item.not_recommended_for),
+            best_for_season=item.best_for_season,
+            best_time_of_day=item.best_time_of_day,
+            difficulty=item.difficulty,
+            duration_minutes=item.duration_minutes,
+            steps=steps,
+            precautions=precautions,
+            updated_at=item.updated_at if isinstance(item.updated_at, datetime) else None,
+            prompt_snippet=render_prompt_snippet(item.title, item.description_short, steps, precautions)
+        )
+
+
+def _fingerprint(entries: Iterable[KnowledgeEntry]) -> Fingerprint:
+    count, latest = 0, None
+    for entry in entries:
+        count += 1
+        if entry.updated_at is not None and (latest is None or entry.updated_at > latest):
+            latest = entry.updated_at
+    return count, latest
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """One immutable version of the catalog"""
+    version: int
+    entries: Mapping[str, KnowledgeEntry]
+    fingerprint: Optional[Fingerprint]
+    loaded_at: Optional[datetime]
+
+
+_EMPTY_SNAPSHOT = CatalogSnapshot(version=0, entries=MappingProxyType({}), fingerprint=None, loaded_at=None)
+
+
+class KnowledgeCatalog:
+    """Holds the current CatalogSnapshot and refreshes it"""
+
+    def __init__(self):
+        self._current = _EMPTY_SNAPSHOT
+        self._lock = asyncio.Lock()
+        self._changed_during_load: set = set()
+        self._tasks: set = set()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.loads = 0
+        self.checks = 0
+        self.row_updates = 0
+        self.errors = 0
+        self.last_load_ms = 0.0
+
+    @property
+    def current(self) -> CatalogSnapshot:
+        return self._current
+
+    @property
+    def ready(self) -> bool:
+        return self._current.version > 0
+
+    def get(self, knowledge_id: str) -> Optional[KnowledgeEntry]:
+        return self._current.entries.get(str(knowledge_id))
+
+    def get_many(self, knowledge_ids: Iterable[str]) -> Tuple[List[KnowledgeEntry], List[str]]:
+        """Entries for the ids in order, and the ids the catalog doesn't have"""
+        entries = self._current.entries
+        found, missing = [], []
+        for knowledge_id in knowledge_ids:
+            entry = entries.get(str(knowledge_id))
+            if entry is None:
+                missing.append(str(knowledge_id))
+            else:
+                found.append(entry)
+        return found, missing
+
+    def resolve(self, items: Iterable[AyurvedaKnowledge]) -> List[KnowledgeEntry]:
+        """Catalog entries for rows fetched from the DB (parsed on a miss)"""
+        entries = self._current.entries
+        resolved = []
+        for item in items:
+            entry = entries.get(str(item.knowledge_id))
+            if entry is None or entry.updated_at != item.updated_at:
+                entry = KnowledgeEntry.from_row(item)
+            resolved.append(entry)
+        return resolved
+
+    def _publish(self, entries: dict):
+        self._current = CatalogSnapshot(
+            version=self._current.version + 1,
+            entries=MappingProxyType(entries),
+            fingerprint=_fingerprint(entries.values()),
+            loaded_at=datetime.utcnow()
+        )
+
+    # -- loading -----------------------------------------------------------
+
+    async def refresh(self, force: bool = False) -> CatalogSnapshot:
+        """
+        Reload every row if the table's fingerprint changed (or force), and
+        return the current snapshot. Concurrent calls share one load.
+        """
+        if self._lock.locked():
+            # A load is already running; wait for it rather than repeat it
+            async with self._lock:
+                return self._current
+        async with self._lock:
+            self._changed_during_load.clear()
+            try:
+                async with AsyncSessionLocal() as db:
+                    self.checks += 1
+                    if not force and self.ready:
+                        count, latest = (await db.execute(
+                            select(func.count(), func.max(AyurvedaKnowledge.updated_at))
+                        )).one()
+                        if (count, latest) == self._current.fingerprint:
+                            return self._current
+                    start = time.perf_counter()
+                    items = (await db.execute(select(AyurvedaKnowledge))).scalars().all()
+                entries = {str(item.knowledge_id): KnowledgeEntry.from_row(item) for item in items}
+                self._publish(entries)
+                self.loads += 1
+                self.last_load_ms = (time.perf_counter() - start) * 1000
+                logger.info(
+                    f"Knowledge catalog v{self._current.version} loaded: "
+                    f"{len(entries)} items in {self.last_load_ms:.0f}ms"
+                )
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Knowledge catalog load failed: {e}")
+
+        # Rows changed while we were reading may have been loaded stale
+        changed, self._changed_during_load = self._changed_during_load, set()
+        for doc_id in changed:
+            self.schedule_refresh_entry(doc_id)
+        return self._current
+
+    async def refresh_entry(self, doc_id: str) -> Optional[KnowledgeEntry]:
+        """Reload one row into a new snapshot; returns its entry (None if deleted)"""
+        if self._lock.locked():
+            self._changed_during_load.add(doc_id)
+        async with AsyncSessionLocal() as db:
+            item = await db.get(AyurvedaKnowledge, uuid.UUID(doc_id))
+        entries = dict(self._current.entries)
+        entry = KnowledgeEntry.from_row(item) if item is not None else None
+        if entry is None:
+            entries.pop(doc_id, None)
+        else:
+            entries[doc_id] = entry
+        self._publish(entries)
+        self.row_updates += 1
+        return entry
+
+    async def _refresh_entry_logged(self, doc_id: str):
+        try:
+            await self.refresh_entry(doc_id)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Knowledge catalog refresh for {doc_id} failed: {e}")
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def schedule_refresh_entry(self, doc_id: Optional[str]):
+        """Invalidation bus handler for ayurveda_knowledge"""
+        if doc_id:
+            self._spawn(self._refresh_entry_logged(doc_id))
+
+    def schedule_reload(self):
+        """Startup and invalidation bus reset handler"""
+        self._spawn(self.refresh(force=True))
+
+    def start_periodic_refresh(self, interval_seconds: float):
+        """Fingerprint check loop for when the invalidation bus is disabled"""
+        if self._refresh_task is None and interval_seconds > 0:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(interval_seconds))
+
+    async def _refresh_loop(self, interval_seconds: float):
+        while True:
+            await asyncio.sleep(interval_seconds)
+            await self.refresh()
+
+    async def stop(self):
+        tasks = list(self._tasks)
+        if self._refresh_task is not None:
+            tasks.append(self._refresh_task)
+            self._refresh_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> dict:
+        current = self._current
+        return {
+            "ready": self.ready,
+            "version": current.version,
+            "items": len(current.entries),
+            "loaded_at": current.loaded_at.isoformat() if current.loaded_at else None,
+            "loads": self.loads,
+            "checks": self.checks,
+            "row_updates": self.row_updates,
+            "errors": self.errors,
+            "last_load_ms": round(self.last_load_ms, 1)
+        }
+
+
+# Global instance
+_knowledge_catalog = None
+
+
+def get_knowledge_catalog() -> KnowledgeCatalog:
+    """Get or create the knowledge catalog singleton"""
+    global _knowledge_catalog
+    if _knowledge_catalog is None:
+        _knowledge_catalog = KnowledgeCatalog()
+    return _knowledge_catalog
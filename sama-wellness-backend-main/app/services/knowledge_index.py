@@ -0,0 +1,527 @@
+# app/services/knowledge_index.py
+"""
+In-process BM25 index over the Ayurveda knowledge base.
+
+Each replica keeps an inverted index of every ayurveda_knowledge row (title,
+short/detailed descriptions, helps_with_emotions and knowledge_tags values)
+and ranks check-in text against it without a DB round trip.
+
+Alongside it, every tag of a row (dosha, emotion, duration, difficulty,
+season from knowledge_tags and the row's own columns, plus content_type,
+best_time_of_day and not_recommended_for) is a bit in a per-tag bitset: a
+Python int with one bit per row. Ranking for a check-in intersects those
+with the user's prakriti, bikriti and detected emotion in a few big-int
+operations and adds the tag score to the text relevance.
+
+Rows come from the knowledge catalog (app/services/knowledge_catalog.py), so
+search returns its pre-parsed KnowledgeEntry objects; only knowledge_tags
+are read here. The index is built once at startup and then kept current row
+by row from invalidation bus notifications on ayurveda_knowledge and
+knowledge_tags, refreshing the catalog entry first. A full rebuild (and
+catalog reload) runs whenever the listener (re)connects, since changes made
+while disconnected were missed. Without the bus it is rebuilt periodically,
+reloading the catalog only if its updated_at fingerprint changed.
+"""
+
+import asyncio
+import heapq
+import logging
+import math
+import re
+import time
+from collections import Counter
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.database.connection import AsyncSessionLocal
+from app.models.knowledge_tags import KnowledgeTag
+from app.services.knowledge_catalog import KnowledgeEntry, get_knowledge_catalog
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_TABLES = ("ayurveda_knowledge", "knowledge_tags")
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Field weights: a title or tag hit says more than a word deep in the description
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "description_short": 2.0,
+    "description_detailed": 1.0,
+    "helps_with_emotions": 2.5,
+    "tags": 2.0,
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Tag score added to the normalised (0-1) text score. A tag match only
+# reorders text matches, or fills the page when too few rows match the text.
+TAG_WEIGHTS = {
+    "bikriti": 0.4,   # balances the user's current imbalance
+    "emotion": 0.4,   # helps with the detected emotion
+    "prakriti": 0.2,  # balances the user's constitution
+    "season": 0.1,    # suits the current season
+}
+
+# best_time_of_day values that don't restrict when a practice fits
+ANY_TIME_OF_DAY = frozenset({"any", "anytime", "any time", "all", "all day"})
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because
+been before being below between both but by can could did do does doing down
+during each even feel feeling felt few for from further get getting got had has
+have having he her here hers herself him himself his how i if in into is it its
+itself just like lot me more most much my myself no nor not now of off on once
+only or other our ours ourselves out over own really same she should so some
+still such than that the their theirs them themselves then there these they
+this those through to today too under until up very was we were what when
+where which while who whom why will with would you your yours yourself
+yourselves
+""".split())
+
+# Longest suffix first; (suffix, replacement)
+_SUFFIXES = (
+    ("ational", "ate"), ("fulness", "ful"), ("iveness", "ive"), ("ousness", "ous"),
+    ("ization", "ize"), ("ation", "ate"), ("iness", "y"), ("ness", ""), ("ment", ""),
+    ("ities", "ity"), ("ingly", ""), ("edly", ""), ("ies", "y"), ("ied", "y"), ("ing", ""),
+    ("ful", ""), ("ous", ""), ("ly", ""), ("ed", ""), ("es", ""), ("s", ""),
+)
+
+
+def stem(word: str) -> str:
+    """Light suffix-stripping stemmer, enough to fold plurals and -ing/-ed/-ness forms"""
+    if len(word) <= 3:
+        return word
+    for suffix, replacement in _SUFFIXES:
+        if suffix == "s" and word.endswith("ss"):
+            break
+        if word.endswith(suffix) and len(word) - len(suffix) + len(replacement) >= 3:
+            word = word[: -len(suffix)] + replacement
+            break
+    # Undouble a final consonant left behind by -ing/-ed ("stopping" -> "stop")
+    if len(word) > 3 and word[-1] == word[-2] and word[-1] not in "aeiouls":
+        word = word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, split on non-alphanumerics, drop stopwords, stem"""
+    if not text:
+        return []
+    return [stem(token) for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+def _json_list_text(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(item) for item in value)
+    return str(value) if value else ""
+
+
+def _values(value) -> List[str]:
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip().lower() for item in value if item]
+    return [str(value).strip().lower()] if value else []
+
+
+def duration_bucket(minutes: Optional[int]) -> Optional[str]:
+    if minutes is None:
+        return None
+    if minutes <= 5:
+        return "short"
+    return "medium" if minutes <= 20 else "long"
+
+
+def current_season(day: date) -> str:
+    return ("winter", "winter", "spring", "spring", "spring", "summer",
+            "summer", "summer", "autumn", "autumn", "autumn", "winter")[day.month - 1]
+
+
+def current_time_of_day(now: datetime) -> str:
+    if 5 <= now.hour < 11:
+        return "morning"
+    if 11 <= now.hour < 17:
+        return "afternoon"
+    return "evening" if 17 <= now.hour < 21 else "night"
+
+
+def document_tags(item: KnowledgeEntry, tags: Iterable[Tuple[str, str]] = ()) -> set:
+    """(tag_type, value) pairs for one knowledge row, from its columns and knowledge_tags"""
+    pairs = {(tag_type, value) for tag_type, tag_value in tags for value in _values(tag_value)}
+    pairs.update(("dosha", value) for value in _values(item.balances_doshas))
+    pairs.update(("emotion", value) for value in _values(item.helps_with_emotions))
+    pairs.update(("difficulty", value) for value in _values(item.difficulty))
+    pairs.update(("season", value) for value in _values(item.best_for_season))
+    pairs.update(("content_type", value) for value in _values(item.content_type))
+    pairs.update(("time_of_day", value) for value in _values(item.best_time_of_day))
+    pairs.update(("not_recommended", value) for value in _values(item.not_recommended_for))
+    bucket = duration_bucket(item.duration_minutes)
+    if bucket:
+        pairs.add(("duration", bucket))
+    return pairs
+
+
+def document_terms(item: KnowledgeEntry, tags: Iterable[Tuple[str, str]] = ()) -> Counter:
+    """Field-weighted term frequencies for one knowledge row"""
+    fields = {
+        "title": item.title,
+        "description_short": item.description_short,
+        "description_detailed": item.description_detailed,
+        "helps_with_emotions": _json_list_text(item.helps_with_emotions),
+        "tags": " ".join(tag_value for _, tag_value in tags),
+    }
+    terms = Counter()
+    for name, text in fields.items():
+        weight = FIELD_WEIGHTS[name]
+        for token in tokenize(text):
+            terms[token] += weight
+    return terms
+
+
+class KnowledgeIndex:
+    """
+    Inverted index (term -> {knowledge_id: weighted tf}) with BM25 ranking,
+    and per-tag bitsets ((tag_type, value) -> int, bit n = row in slot n)
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._doc_terms: Dict[str, Counter] = {}
+        self._doc_lengths: Dict[str, float] = {}
+        self._docs: Dict[str, KnowledgeEntry] = {}
+        self._total_length = 0.0
+        self._reset_tags()
+        self.ready = False
+        self._building = False
+        self._rebuild_requested = False
+        self._changed_during_build: set = set()
+        self._tasks: set = set()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.builds = 0
+        self.updates = 0
+        self.errors = 0
+        self.last_build_ms = 0.0
+        self.searches = 0
+        self.search_ms_total = 0.0
+        self.searches_with_emotion = 0
+
+    # -- mutation ----------------------------------------------------------
+
+    def _reset_tags(self):
+        self._tag_bits: Dict[Tuple[str, str], int] = {}
+        self._doc_tags: Dict[str, set] = {}
+        self._slots: Dict[str, int] = {}
+        self._slot_ids: List[Optional[str]] = []
+        self._free_slots: List[int] = []
+        self._all_bits = 0
+        self._timed_bits = 0  # rows restricted to a specific time of day
+
+    def _add_tags(self, doc_id: str, tags: set):
+        slot = self._free_slots.pop() if self._free_slots else len(self._slot_ids)
+        if slot == len(self._slot_ids):
+            self._slot_ids.append(doc_id)
+        else:
+            self._slot_ids[slot] = doc_id
+        self._slots[doc_id] = slot
+        self._doc_tags[doc_id] = tags
+        bit = 1 << slot
+        self._all_bits |= bit
+        for key in tags:
+            self._tag_bits[key] = self._tag_bits.get(key, 0) | bit
+            if key[0] == "time_of_day" and key[1] not in ANY_TIME_OF_DAY:
+                self._timed_bits |= bit
+
+    def _remove_tags(self, doc_id: str):
+        slot = self._slots.pop(doc_id, None)
+        if slot is None:
+            return
+        keep = ~(1 << slot)
+        self._all_bits &= keep
+        self._timed_bits &= keep
+        for key in self._doc_tags.pop(doc_id, ()):
+            bits = self._tag_bits.get(key, 0) & keep
+            if bits:
+                self._tag_bits[key] = bits
+            else:
+                self._tag_bits.pop(key, None)
+        self._slot_ids[slot] = None
+        self._free_slots.append(slot)
+
+    def _add(self, doc_id: str, item: KnowledgeEntry, terms: Counter, tags: set):
+        self._add_tags(doc_id, tags)
+        self._docs[doc_id] = item
+        self._doc_terms[doc_id] = terms
+        length = sum(terms.values())
+        self._doc_lengths[doc_id] = length
+        self._total_length += length
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+
+    def remove(self, doc_id: str):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._remove_tags(doc_id)
+        self._docs.pop(doc_id, None)
+        self._total_length -= self._doc_lengths.pop(doc_id, 0.0)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def upsert(self, item: KnowledgeEntry, tags: Iterable[Tuple[str, str]] = ()):
+        """Add or replace a row; tags are its knowledge_tags (tag_type, tag_value) pairs"""
+        doc_id = str(item.knowledge_id)
+        tags = list(tags)
+        self.remove(doc_id)
+        self._add(doc_id, item, document_terms(item, tags), document_tags(item, tags))
+
+    def build(self, items: Iterable[KnowledgeEntry], tags_by_id: Dict[str, List[Tuple[str, str]]]):
+        """Replace the whole index (no awaits, so searches never see it half-built)"""
+        self._postings, self._doc_terms, self._doc_lengths, self._docs = {}, {}, {}, {}
+        self._total_length = 0.0
+        self._reset_tags()
+        for item in items:
+            doc_id = str(item.knowledge_id)
+            tags = tags_by_id.get(doc_id, ())
+            self._add(doc_id, item, document_terms(item, tags), document_tags(item, tags))
+        self.ready = True
+
+    # -- search ------------------------------------------------------------
+
+    def _text_scores(self, text: str) -> Dict[str, float]:
+        query_terms = set(tokenize(text))
+        doc_count = len(self._docs)
+        scores: Dict[str, float] = {}
+        if query_terms and doc_count:
+            avg_length = self._total_length / doc_count
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def _bits(self, tag_type: str, value: Optional[str]) -> int:
+        if not value:
+            return 0
+        bits = 0
+        # "Vata-Pitta" matches rows tagged with either dosha
+        for part in value.lower().split("-") if tag_type == "dosha" else [value.lower()]:
+            bits |= self._tag_bits.get((tag_type, part.strip()), 0)
+        return bits
+
+    def _candidates(self, bikriti, emotion, now: datetime, content_types) -> int:
+        """Fast filters: not_recommended_for, best_time_of_day and content_type"""
+        candidates = self._all_bits
+        for value in (emotion, bikriti):
+            candidates &= ~self._bits("not_recommended", value)
+        # Rows for another time of day are out; untimed rows always fit
+        candidates &= ~(self._timed_bits & ~self._bits("time_of_day", current_time_of_day(now)))
+        if content_types:
+            allowed = 0
+            for content_type in content_types:
+                allowed |= self._bits("content_type", content_type)
+            candidates &= allowed
+        return candidates
+
+    def _tag_scores(self, candidates: int, prakriti, bikriti, emotion, now: datetime) -> Dict[int, float]:
+        """slot -> summed TAG_WEIGHTS of the tags it matches, for candidate slots"""
+        scores: Dict[int, float] = {}
+        signals = (
+            ("bikriti", self._bits("dosha", bikriti)),
+            ("emotion", self._bits("emotion", emotion)),
+            ("prakriti", self._bits("dosha", prakriti)),
+            ("season", self._bits("season", current_season(now.date()))),
+        )
+        for name, bits in signals:
+            bits &= candidates
+            weight = TAG_WEIGHTS[name]
+            while bits:
+                low = bits & -bits
+                slot = low.bit_length() - 1
+                scores[slot] = scores.get(slot, 0.0) + weight
+                bits ^= low
+        return scores
+
+    def search(
+        self,
+        text: str,
+        limit: int = 3,
+        prakriti: Optional[str] = None,
+        bikriti: Optional[str] = None,
+        emotion: Optional[str] = None,
+        content_types: Iterable[str] = (),
+        now: Optional[datetime] = None
+    ) -> List[KnowledgeEntry]:
+        """
+        Top `limit` knowledge rows for the text. Rows are filtered by the
+        fast filters, then ranked by normalised BM25 plus tag score; if
+        fewer than `limit` rows match the text, the best tag-only matches
+        fill the page. [] if nothing matches either way. `now` is the
+        user's local time (season and time-of-day tags); server time if None.
+        """
+        start = time.perf_counter()
+        now = now or datetime.now()
+        candidates = self._candidates(bikriti, emotion, now, content_types)
+        tag_scores = self._tag_scores(candidates, prakriti, bikriti, emotion, now)
+
+        text_scores = self._text_scores(text)
+        best_text = max(text_scores.values(), default=0.0) or 1.0
+        ranked = [
+            (score / best_text + tag_scores.get(self._slots[doc_id], 0.0), doc_id)
+            for doc_id, score in text_scores.items()
+            if candidates >> self._slots[doc_id] & 1
+        ]
+        top = [doc_id for _, doc_id in heapq.nlargest(limit, ranked)]
+        if len(top) < limit and tag_scores:
+            tag_only = (
+                (score, self._slot_ids[slot]) for slot, score in tag_scores.items()
+                if self._slot_ids[slot] not in text_scores
+            )
+            top += [doc_id for _, doc_id in heapq.nlargest(limit - len(top), tag_only)]
+
+        self.searches += 1
+        if emotion:
+            self.searches_with_emotion += 1
+        self.search_ms_total += (time.perf_counter() - start) * 1000
+        return [self._docs[doc_id] for doc_id in top]
+
+    # -- loading -----------------------------------------------------------
+
+    async def rebuild(self, reload_catalog: bool = False):
+        """
+        Refresh the catalog (reloading it regardless of its fingerprint if
+        reload_catalog), load every row's tags, then swap in a fresh index
+        """
+        if self._building:
+            self._rebuild_requested = True
+            return
+        self._building = True
+        self._changed_during_build.clear()
+        try:
+            while True:
+                self._rebuild_requested = False
+                start = time.perf_counter()
+                catalog = await get_knowledge_catalog().refresh(force=reload_catalog)
+                if not catalog.version:
+                    raise RuntimeError("knowledge catalog not loaded")
+                async with AsyncSessionLocal() as db:
+                    tag_rows = (await db.execute(
+                        select(KnowledgeTag.knowledge_id, KnowledgeTag.tag_type, KnowledgeTag.tag_value)
+                    )).all()
+                tags_by_id: Dict[str, List[Tuple[str, str]]] = {}
+                for knowledge_id, tag_type, tag_value in tag_rows:
+                    tags_by_id.setdefault(str(knowledge_id), []).append((tag_type, tag_value))
+                self.build(catalog.entries.values(), tags_by_id)
+                self.builds += 1
+                self.last_build_ms = (time.perf_counter() - start) * 1000
+                logger.info(
+                    f"Knowledge index built: {len(self._docs)} documents, "
+                    f"{len(self._postings)} terms in {self.last_build_ms:.0f}ms "
+                    f"(catalog v{catalog.version})"
+                )
+                if not self._rebuild_requested:
+                    break
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Knowledge index build failed: {e}")
+        finally:
+            self._building = False
+
+        # Rows changed while we were reading may have been loaded stale
+        changed, self._changed_during_build = self._changed_during_build, set()
+        for doc_id in changed:
+            self.schedule_refresh(doc_id)
+
+    async def refresh_document(self, doc_id: str):
+        """Reload one knowledge row's catalog entry (and its tags) after it changed"""
+        if self._building:
+            self._changed_during_build.add(doc_id)
+        try:
+            item = await get_knowledge_catalog().refresh_entry(doc_id)
+            tags = []
+            if item is not None:
+                async with AsyncSessionLocal() as db:
+                    tags = (await db.execute(
+                        select(KnowledgeTag.tag_type, KnowledgeTag.tag_value)
+                        .where(KnowledgeTag.knowledge_id == doc_id)
+                    )).all()
+            if item is None:
+                self.remove(doc_id)
+            else:
+                self.upsert(item, tags)
+            self.updates += 1
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Knowledge index refresh for {doc_id} failed: {e}")
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def schedule_refresh(self, doc_id: Optional[str]):
+        """Invalidation bus handler: the key is a knowledge_id for both tables"""
+        if doc_id:
+            self._spawn(self.refresh_document(doc_id))
+
+    def schedule_rebuild(self):
+        """Startup and invalidation bus reset handler"""
+        self._spawn(self.rebuild(reload_catalog=True))
+
+    def start_periodic_refresh(self, interval_seconds: float):
+        """Fallback when the invalidation bus is disabled"""
+        if self._refresh_task is None and interval_seconds > 0:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(interval_seconds))
+
+    async def _refresh_loop(self, interval_seconds: float):
+        while True:
+            await asyncio.sleep(interval_seconds)
+            await self.rebuild()
+
+    async def stop(self):
+        tasks = list(self._tasks)
+        if self._refresh_task is not None:
+            tasks.append(self._refresh_task)
+            self._refresh_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.ready,
+            "documents": len(self._docs),
+            "terms": len(self._postings),
+            "tags": len(self._tag_bits),
+            "builds": self.builds,
+            "updates": self.updates,
+            "errors": self.errors,
+            "last_build_ms": round(self.last_build_ms, 1),
+            "searches": self.searches,
+            "avg_search_ms": round(self.search_ms_total / self.searches, 3) if self.searches else None,
+            "searches_with_emotion": self.searches_with_emotion,
+            "emotion_rate": round(self.searches_with_emotion / self.searches, 3) if self.searches else None
+        }
+
+
+# Global instance
+_knowledge_index = None
+
+
+def get_knowledge_index() -> KnowledgeIndex:
+    """Get or create the knowledge index singleton"""
+    global _knowledge_index
+    if _knowledge_index is None:
+        _knowledge_index = KnowledgeIndex()
+    return _knowledge_index
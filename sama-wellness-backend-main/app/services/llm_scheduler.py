@@ -0,0 +1,255 @@
+# app/services/llm_scheduler.py
+"""
+Admission control for LLM calls.
+
+All LLM calls share one concurrency limit and one token-bucket rate limit.
+Waiting calls are queued in priority lanes so a user in crisis is never
+stuck behind routine check-ins, and background work is shed first under load.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LLMPriority:
+    """Admission lanes, highest priority first"""
+    CRISIS = "crisis"            # Turns answered in PSYCHOLOGIST MODE
+    INTERACTIVE = "interactive"  # Regular check-in turns
+    BACKGROUND = "background"    # Summaries, insight generation (none in this service yet)
+
+    ORDER = (CRISIS, INTERACTIVE, BACKGROUND)
+
+
+class AdmissionRejected(Exception):
+    """Raised when an LLM call is shed or waits too long for a slot"""
+
+
+class _Lane:
+    """Queue and wait-time statistics for one priority lane"""
+
+    def __init__(self, name: str, max_queue: int):
+        self.name = name
+        self.max_queue = max_queue
+        self.waiters = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+        self.wait_ms = deque(maxlen=500)
+
+    def pending(self) -> int:
+        return sum(1 for fut in self.waiters if not fut.done())
+
+    def snapshot(self) -> dict:
+        waits = sorted(self.wait_ms)
+
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 1) if waits else 0.0
+
+        return {
+            "queued": self.pending(),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "wait_ms_p50": pct(0.5),
+            "wait_ms_p95": pct(0.95),
+            "wait_ms_max": round(waits[-1], 1) if waits else 0.0
+        }
+
+
+class LLMAdmissionScheduler:
+    """Priority-lane scheduler with a global concurrency and rate limit"""
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        rate_per_second: float = 5.0,
+        burst: int = 10,
+        crisis_reserved_slots: int = 2,
+        max_queue: int = 50,
+        background_max_queue: int = 10
+    ):
+        self.max_concurrency = max_concurrency
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.crisis_reserved_slots = crisis_reserved_slots
+        self.max_queue = max_queue
+
+        self._lanes: Dict[str, _Lane] = {
+            LLMPriority.CRISIS: _Lane(LLMPriority.CRISIS, max_queue=0),  # 0 = unbounded
+            LLMPriority.INTERACTIVE: _Lane(LLMPriority.INTERACTIVE, max_queue=max_queue),
+            LLMPriority.BACKGROUND: _Lane(LLMPriority.BACKGROUND, max_queue=background_max_queue),
+        }
+        self._in_flight = 0
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._timer = None
+
+    @asynccontextmanager
+    async def admit(self, priority: str = LLMPriority.INTERACTIVE, timeout: float = None):
+        """Hold an LLM slot for the duration of the block"""
+        await self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: str = LLMPriority.INTERACTIVE, timeout: float = None):
+        """Wait for an LLM slot in the given lane"""
+        lane = self._lanes[priority]
+        enqueued_at = time.perf_counter()
+
+        if not self._has_waiters_at_or_above(priority) and self._try_take(priority):
+            self._record_admit(lane, enqueued_at)
+            return
+
+        if lane.max_queue and lane.pending() >= lane.max_queue:
+            lane.rejected += 1
+            raise AdmissionRejected(f"{priority} lane is full")
+
+        if self._total_pending() >= self.max_queue and not self._shed_lower_than(priority):
+            lane.rejected += 1
+            raise AdmissionRejected("LLM admission queue is full")
+
+        fut = asyncio.get_running_loop().create_future()
+        lane.waiters.append(fut)
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            lane.rejected += 1
+            raise AdmissionRejected(f"Timed out waiting in {priority} lane")
+        except BaseException:
+            # Cancelled after the slot was granted — hand it back
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                self.release()
+            raise
+
+        self._record_admit(lane, enqueued_at)
+
+    def try_acquire(self, priority: str = LLMPriority.INTERACTIVE) -> bool:
+        """Take a slot only if one is free now and nobody is queued ahead (no waiting)"""
+        if self._has_waiters_at_or_above(priority) or not self._try_take(priority):
+            return False
+        self._record_admit(self._lanes[priority], time.perf_counter())
+        return True
+
+    def release(self):
+        """Return a slot and admit the next waiter"""
+        self._in_flight -= 1
+        self._dispatch()
+
+    def snapshot(self) -> dict:
+        """Current load and per-lane wait statistics"""
+        self._refill()
+        return {
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "rate_tokens": round(self._tokens, 2),
+            "lanes": {name: lane.snapshot() for name, lane in self._lanes.items()}
+        }
+
+    def _record_admit(self, lane: _Lane, enqueued_at: float):
+        lane.admitted += 1
+        lane.wait_ms.append((time.perf_counter() - enqueued_at) * 1000)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate_per_second > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate_per_second)
+        self._last_refill = now
+
+    def _try_take(self, priority: str) -> bool:
+        """Take a concurrency slot (and a rate token) if one is available"""
+        if priority == LLMPriority.CRISIS:
+            # Crisis turns may use the reserved headroom and skip the rate limit
+            if self._in_flight >= self.max_concurrency + self.crisis_reserved_slots:
+                return False
+            self._in_flight += 1
+            return True
+
+        if self._in_flight >= self.max_concurrency:
+            return False
+        if self.rate_per_second > 0:
+            self._refill()
+            if self._tokens < 1:
+                self._schedule_refill()
+                return False
+            self._tokens -= 1
+        self._in_flight += 1
+        return True
+
+    def _schedule_refill(self):
+        if self._timer is not None:
+            return
+        delay = (1 - self._tokens) / self.rate_per_second
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_later(delay, self._on_refill_timer)
+
+    def _on_refill_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grant free slots to waiters, highest lane first"""
+        for priority in LLMPriority.ORDER:
+            lane = self._lanes[priority]
+            while lane.waiters:
+                fut = lane.waiters[0]
+                if fut.done():
+                    lane.waiters.popleft()
+                    continue
+                if not self._try_take(priority):
+                    # Lower lanes never have more headroom than this one
+                    return
+                lane.waiters.popleft()
+                fut.set_result(True)
+
+    def _has_waiters_at_or_above(self, priority: str) -> bool:
+        for name in LLMPriority.ORDER:
+            if self._lanes[name].pending():
+                return True
+            if name == priority:
+                return False
+        return False
+
+    def _total_pending(self) -> int:
+        return sum(lane.pending() for lane in self._lanes.values())
+
+    def _shed_lower_than(self, priority: str) -> bool:
+        """Drop the newest waiter from the lowest lane below priority"""
+        below = LLMPriority.ORDER[LLMPriority.ORDER.index(priority) + 1:]
+        for name in reversed(below):
+            lane = self._lanes[name]
+            for fut in reversed(lane.waiters):
+                if not fut.done():
+                    fut.set_exception(AdmissionRejected(f"Shed from {name} lane for {priority} work"))
+                    lane.shed += 1
+                    logger.warning(f"Shed queued {name} LLM call to admit {priority} work")
+                    return True
+        return False
+
+
+# Global instance
+_scheduler = None
+
+
+def get_llm_scheduler() -> LLMAdmissionScheduler:
+    """Get or create the LLM admission scheduler singleton"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMAdmissionScheduler(
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            rate_per_second=settings.LLM_RATE_LIMIT_PER_SECOND,
+            burst=settings.LLM_RATE_LIMIT_BURST,
+            crisis_reserved_slots=settings.LLM_CRISIS_RESERVED_SLOTS,
+            max_queue=settings.LLM_ADMISSION_MAX_QUEUE,
+            background_max_queue=settings.LLM_BACKGROUND_MAX_QUEUE
+        )
+    return _scheduler
@@ -0,0 +1,340 @@
+# app/services/post_response.py
+"""
+Durable post-response jobs (transactional outbox).
+
+Writes the client doesn't need to wait for (emotion analysis, dosha
+tracking, streaks, daily progress) are recorded as rows in
+post_response_jobs inside the turn's own transaction (stage_jobs), so a
+committed turn always has its jobs. They are leased to the replica that
+wrote them and handed straight to its workers after the commit; each job's
+writes and the deletion of its row commit together, so a job takes effect
+exactly once.
+
+A job that fails is released with exponential backoff and may be claimed
+by any replica (FOR UPDATE SKIP LOCKED); after max_attempts it is kept as
+'failed'. Jobs whose replica died mid-lease are claimed again once the
+lease expires. In-process state handed to a job (the running emotion task)
+is only an optimisation: handlers must work from the payload alone.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database.connection import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# handler(db, payload, context): writes on db without committing
+JobHandler = Callable[[AsyncSession, dict, Any], Awaitable[Any]]
+
+STAGE_JOB_SQL = text("""
+INSERT INTO post_response_jobs (job_type, payload, attempts, locked_until)
+VALUES (:job_type, CAST(:payload AS jsonb), 1, now() + make_interval(secs => :lease_seconds))
+RETURNING job_id
+""")
+
+CLAIM_JOBS_SQL = text("""
+UPDATE post_response_jobs
+SET attempts = attempts + 1,
+    locked_until = now() + make_interval(secs => :lease_seconds)
+WHERE job_id IN (
+    SELECT job_id FROM post_response_jobs
+    WHERE status = 'pending'
+      AND available_at <= now()
+      AND (locked_until IS NULL OR locked_until < now())
+    ORDER BY job_id
+    LIMIT :limit
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING job_id, job_type, payload, attempts, created_at
+""")
+
+# Runs in the job's own transaction; no row means another worker finished it
+COMPLETE_JOB_SQL = text("DELETE FROM post_response_jobs WHERE job_id = :job_id RETURNING job_id")
+
+RELEASE_JOB_SQL = text("""
+UPDATE post_response_jobs
+SET status = CASE WHEN attempts >= :max_attempts THEN 'failed' ELSE 'pending' END,
+    locked_until = NULL,
+    available_at = now() + make_interval(secs => :delay_seconds),
+    last_error = :error
+WHERE job_id = :job_id
+RETURNING status
+""")
+
+
+@dataclass(eq=False)
+class OutboxJob:
+    """A job to stage in the caller's transaction; context stays in-process"""
+    job_type: str
+    payload: dict
+    context: Any = None
+
+
+@dataclass(eq=False)
+class ClaimedJob:
+    """A job row this replica holds the lease on"""
+    job_id: int
+    job_type: str
+    payload: dict
+    attempts: int = 1
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    context: Any = field(default=None, repr=False)
+
+
+async def stage_jobs(db: AsyncSession, jobs: List[OutboxJob], lease_seconds: float = None) -> List[ClaimedJob]:
+    """
+    Insert jobs in the caller's transaction, leased to this replica (the
+    caller commits, then passes the result to PostResponseQueue.dispatch)
+    """
+    lease = lease_seconds if lease_seconds is not None else settings.POST_RESPONSE_LEASE_SECONDS
+    staged = []
+    for job in jobs:
+        result = await db.execute(STAGE_JOB_SQL, {
+            "job_type": job.job_type,
+            "payload": json.dumps(job.payload),
+            "lease_seconds": lease
+        })
+        staged.append(ClaimedJob(
+            job_id=result.scalar_one(),
+            job_type=job.job_type,
+            payload=job.payload,
+            context=job.context
+        ))
+    return staged
+
+
+class PostResponseQueue:
+    """Workers for the post_response_jobs outbox, with a bounded local hand-off queue"""
+
+    def __init__(
+        self,
+        max_size: int = 1000,
+        workers: int = 2,
+        max_attempts: int = 5,
+        retry_base_seconds: float = 0.5,
+        lease_seconds: float = 60,
+        poll_seconds: float = 5
+    ):
+        self.max_size = max_size
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self._handlers: Dict[str, JobHandler] = {}
+        self._jobs: deque = deque()
+        # job_id -> in-process context (e.g. the turn's emotion task), bounded
+        self._contexts: "OrderedDict[int, Any]" = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._tasks: list = []
+        self._stopping = False
+        self.in_flight = 0
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+        self.claimed = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def register(self, job_type: str, handler: JobHandler):
+        self._handlers[job_type] = handler
+
+    def retry_delay(self, attempts: int) -> float:
+        """Backoff before the next attempt, after `attempts` failed ones"""
+        return self.retry_base_seconds * (2 ** (attempts - 1))
+
+    def dispatch(self, jobs: List[ClaimedJob]):
+        """
+        Hand jobs staged by this replica to its workers. Beyond max_size they
+        aren't queued locally (their contexts are dropped) and are claimed
+        from the table once their lease expires.
+        """
+        for job in jobs:
+            if len(self._jobs) >= self.max_size:
+                self.dropped += 1
+                self._drop_context(job.context)
+                logger.warning(f"Post-response queue full ({self.max_size}); job {job.job_id} left for its lease to expire")
+                continue
+            if job.context is not None:
+                self._contexts[job.job_id] = job.context
+                while len(self._contexts) > self.max_size:
+                    _, oldest = self._contexts.popitem(last=False)
+                    self._drop_context(oldest)
+            self._push(job)
+
+    @staticmethod
+    def _drop_context(context):
+        task = getattr(context, "task", None)
+        if task is not None and not task.done():
+            task.cancel()
+
+    def _push(self, job: ClaimedJob):
+        self._jobs.append(job)
+        self._wakeup.set()
+
+    def start(self):
+        if not self._tasks:
+            self._stopping = False
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10):
+        """Drain locally queued jobs (up to timeout) and stop the workers"""
+        self._stopping = True
+        self._wakeup.set()
+        deadline = time.monotonic() + timeout
+        while (self._jobs or self.in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._jobs:
+            logger.warning(
+                f"Post-response queue stopped with {len(self._jobs)} jobs queued; "
+                f"they will be claimed after their lease expires"
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            if not self._jobs and not self._stopping:
+                await self._claim()
+            if not self._jobs:
+                if self._stopping:
+                    return
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job = self._jobs.popleft()
+
+            lag_ms = (datetime.now(timezone.utc) - job.created_at).total_seconds() * 1000
+            self.last_lag_ms = lag_ms
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+
+            self.in_flight += 1
+            try:
+                await self._run(job)
+            finally:
+                self.in_flight -= 1
+
+    async def _claim(self):
+        """Lease one ready job from the table (retries, other replicas' leftovers)"""
+        try:
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(
+                    CLAIM_JOBS_SQL, {"lease_seconds": self.lease_seconds, "limit": 1}
+                )).mappings().all()
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to claim post-response jobs: {e}")
+            return
+        for row in rows:
+            payload = row["payload"]
+            if isinstance(payload, str):
+                payload = json.loads(payload)
+            self.claimed += 1
+            self._jobs.append(ClaimedJob(
+                job_id=row["job_id"],
+                job_type=row["job_type"],
+                payload=payload,
+                attempts=row["attempts"],
+                created_at=row["created_at"]
+            ))
+
+    async def _run(self, job: ClaimedJob):
+        handler = self._handlers.get(job.job_type)
+        try:
+            if handler is None:
+                raise LookupError(f"no handler registered for {job.job_type}")
+            async with AsyncSessionLocal() as db:
+                await handler(db, job.payload, self._contexts.get(job.job_id))
+                completed = (await db.execute(COMPLETE_JOB_SQL, {"job_id": job.job_id})).first()
+                if completed is None:
+                    # Our lease expired and another worker already applied it
+                    await db.rollback()
+                else:
+                    await db.commit()
+            self.processed += 1
+            self._contexts.pop(job.job_id, None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self._release(job, e)
+
+    async def _release(self, job: ClaimedJob, error: Exception):
+        """Record a failed attempt: back off for a retry, or keep the row as failed"""
+        delay = self.retry_delay(job.attempts)
+        try:
+            async with AsyncSessionLocal() as db:
+                status = (await db.execute(RELEASE_JOB_SQL, {
+                    "job_id": job.job_id,
+                    "max_attempts": self.max_attempts,
+                    "delay_seconds": delay,
+                    "error": str(error)[:1000]
+                })).scalar_one_or_none()
+                await db.commit()
+        except Exception as e:
+            # The lease runs out and the job is claimed again
+            logger.error(f"Failed to release post-response job {job.job_id}: {e}")
+            status = None
+
+        if status == "failed":
+            self.failed += 1
+            self._drop_context(self._contexts.pop(job.job_id, None))
+            logger.error(f"Post-response job {job.job_type} ({job.job_id}) failed after {job.attempts} attempts: {error}")
+        else:
+            self.retried += 1
+            logger.warning(
+                f"Post-response job {job.job_type} ({job.job_id}) failed (attempt {job.attempts}), "
+                f"retrying in {delay:.1f}s: {error}"
+            )
+
+    def snapshot(self) -> dict:
+        return {
+            "depth": len(self._jobs),
+            "max_size": self.max_size,
+            "contexts": len(self._contexts),
+            "in_flight": self.in_flight,
+            "claimed": self.claimed,
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "lag_ms": {
+                "last": round(self.last_lag_ms, 1),
+                "max": round(self.max_lag_ms, 1)
+            }
+        }
+
+
+# Global instance
+_post_response_queue: Optional[PostResponseQueue] = None
+
+
+def get_post_response_queue() -> PostResponseQueue:
+    """Get or create the post-response queue singleton"""
+    global _post_response_queue
+    if _post_response_queue is None:
+        _post_response_queue = PostResponseQueue(
+            max_size=settings.POST_RESPONSE_QUEUE_MAX_SIZE,
+            workers=settings.POST_RESPONSE_WORKERS,
+            max_attempts=settings.POST_RESPONSE_MAX_ATTEMPTS,
+            retry_base_seconds=settings.POST_RESPONSE_RETRY_BASE_SECONDS,
+            lease_seconds=settings.POST_RESPONSE_LEASE_SECONDS,
+            poll_seconds=settings.POST_RESPONSE_POLL_SECONDS
+        )
+    return _post_response_queue
@@ -59,6 +59,19 @@ Switch to a more serious professional tone ONLY if the user shows signs of crisi
 
 """
 
+# Keywords that switch SAMA into PSYCHOLOGIST MODE
+CRISIS_KEYWORDS = [
+    "panic", "hopeless", "depressed", "suicide", "self harm",
+    "kill myself", "can't go on", "worthless", "hate myself",
+    "no reason to live", "overwhelmed", "breakdown"
+]
+
+
+def is_crisis_message(user_text: str) -> bool:
+    """True when the message shows signs of crisis and needs PSYCHOLOGIST MODE"""
+    text = user_text.lower()
+    return any(word in text for word in CRISIS_KEYWORDS)
+
 
 def build_checkin_prompt(
     user: User,
@@ -103,13 +116,7 @@ def build_checkin_prompt(
         empathy_level = "calm and gentle"
 
     # Improved serious mode detection
-    serious_keywords = [
-        "panic", "hopeless", "depressed", "suicide", "self harm",
-        "kill myself", "can't go on", "worthless", "hate myself",
-        "no reason to live", "overwhelmed", "breakdown"
-    ]
-
-    if any(word in user_text.lower() for word in serious_keywords):
+    if is_crisis_message(user_text):
         mode = "PSYCHOLOGIST MODE"
     else:
         mode = "FRIEND MODE"
@@ -154,16 +161,8 @@ def build_checkin_prompt(
     knowledge_section = ""
     if knowledge_context:
         knowledge_section = "\nRelevant Ayurveda Knowledge (USE THESE IF RELEVANT):\n"
-        for item in knowledge_context:
-            knowledge_section += f"- {item.title}: {item.description_short}\n"
-            if item.steps:
-                import json
-                try:
-                    steps = json.loads(item.steps) if isinstance(item.steps, str) else item.steps
-                    if steps:
-                        knowledge_section += f"  Steps: {steps}\n"
-                except:
-                    pass
+        # KnowledgeEntry snippets are rendered when the knowledge catalog loads
+        knowledge_section += "".join(item.prompt_snippet for item in knowledge_context)
         knowledge_section += "\n"
 
     prompt = f"""
@@ -0,0 +1,21 @@
+# app/services/session_locks.py
+"""
+Per-session locks so turns in the same conversation session run one at a
+time on this replica (the second turn sees the first one's messages).
+Across replicas, sequence allocation is serialized by the counter row lock.
+"""
+
+import asyncio
+import weakref
+
+# Locks disappear once no turn holds or waits on them
+_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def session_lock(session_id: str) -> asyncio.Lock:
+    """The lock for one conversation session"""
+    lock = _locks.get(str(session_id))
+    if lock is None:
+        lock = asyncio.Lock()
+        _locks[str(session_id)] = lock
+    return lock
@@ -0,0 +1,160 @@
+# app/services/timing.py
+"""
+Per-stage wall-clock timings for a single request, plus in-process latency
+histograms and a ring buffer of recent per-turn timing records.
+"""
+
+import bisect
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Awaitable, Dict, Optional, TypeVar
+
+from app.config import settings
+
+T = TypeVar("T")
+
+# Histogram bucket upper bounds (ms); the last bucket is open-ended
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class StageTimer:
+    """Records how long each named stage of a request took (ms)"""
+
+    def __init__(self, route: str = "default"):
+        self.route = route
+        self.started_at = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self._observed = set()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a synchronous block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = (time.perf_counter() - start) * 1000
+
+    async def run(self, name: str, awaitable: Awaitable[T]) -> T:
+        """Await something and record how long it took"""
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.stages[name] = (time.perf_counter() - start) * 1000
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started_at) * 1000
+
+    def summary(self) -> str:
+        parts = [f"{name}={ms:.1f}ms" for name, ms in self.stages.items()]
+        parts.append(f"total={self.total_ms():.1f}ms")
+        return " ".join(parts)
+
+    def server_timing(self) -> str:
+        """Value for a Server-Timing response header"""
+        parts = [f"{name};dur={ms:.1f}" for name, ms in self.stages.items()]
+        parts.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(parts)
+
+    def take_unobserved(self) -> Dict[str, float]:
+        """Stages not yet fed to the histograms (stages can finish after the response)"""
+        new = {name: ms for name, ms in self.stages.items() if name not in self._observed}
+        self._observed.update(new)
+        return new
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with approximate percentiles"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Upper bound of the bucket holding the p-th percentile (max for the open bucket)"""
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return float(self.buckets[i]) if i < len(self.buckets) else round(self.max_ms, 1)
+        return round(self.max_ms, 1)
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.sum_ms / self.count, 1) if self.count else None,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max_ms, 1),
+            "buckets": {
+                **{f"le_{bound}": n for bound, n in zip(self.buckets, self.counts)},
+                "inf": self.counts[-1]
+            }
+        }
+
+
+class LatencyRecorder:
+    """Per-route, per-stage histograms and the most recent per-turn timing records"""
+
+    def __init__(self, max_records: int = 200):
+        self._histograms: Dict[str, Dict[str, LatencyHistogram]] = {}
+        self._records = deque(maxlen=max_records)
+
+    def _histogram(self, route: str, stage: str) -> LatencyHistogram:
+        return self._histograms.setdefault(route, {}).setdefault(stage, LatencyHistogram())
+
+    def observe(self, timer: StageTimer, **tags):
+        """Record a finished request: its stages so far, total time and a timing record"""
+        total_ms = timer.total_ms()
+        for stage, ms in timer.take_unobserved().items():
+            self._histogram(timer.route, stage).observe(ms)
+        self._histogram(timer.route, "total").observe(total_ms)
+        self._records.append({
+            "route": timer.route,
+            "at": datetime.utcnow().isoformat(),
+            "total_ms": round(total_ms, 1),
+            "stages": {name: round(ms, 1) for name, ms in timer.stages.items()},
+            **tags
+        })
+
+    def observe_late(self, timer: StageTimer):
+        """Feed stages that finished after the request was observed (e.g. post-response work)"""
+        for stage, ms in timer.take_unobserved().items():
+            self._histogram(timer.route, stage).observe(ms)
+
+    def snapshot(self, records: int = 20) -> dict:
+        return {
+            "histograms": {
+                route: {stage: histogram.snapshot() for stage, histogram in stages.items()}
+                for route, stages in self._histograms.items()
+            },
+            "recent_turns": list(self._records)[-records:]
+        }
+
+
+# Global instance
+_latency_recorder = None
+
+
+def get_latency_recorder() -> LatencyRecorder:
+    """Get or create the latency recorder singleton"""
+    global _latency_recorder
+    if _latency_recorder is None:
+        _latency_recorder = LatencyRecorder(max_records=settings.LATENCY_RECENT_TURNS)
+    return _latency_recorder
@@ -0,0 +1,195 @@
+# app/services/usage_metrics.py
+"""
+Token and cost accounting for external AI providers.
+
+Calls record usage into an in-memory buffer; a background task flushes the
+buffer to api_usage_metrics with bulk inserts, so accounting adds no DB
+round trip to the request path.
+
+A batch the DB rejects (constraint or type error) is bisected until the bad
+rows are isolated and dropped, so one bad record never holds up the rest. A
+batch that fails for any other reason (DB unreachable) is retried on later
+ticks behind fresh records, and dropped after USAGE_METRICS_MAX_RETRIES.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError, ProgrammingError
+
+from app.config import settings
+from app.database.connection import AsyncSessionLocal
+from app.models.api_usage_metrics import ApiUsageMetric
+
+logger = logging.getLogger(__name__)
+
+# Errors caused by the rows themselves: retrying the same batch can't succeed
+ROW_ERRORS = (IntegrityError, DataError, ProgrammingError)
+
+
+def estimate_llm_cost(input_tokens: int, output_tokens: int) -> float:
+    """Estimated LLM cost (USD) from configured per-1K-token prices"""
+    return round(
+        (input_tokens or 0) / 1000 * settings.LLM_COST_PER_1K_INPUT_TOKENS
+        + (output_tokens or 0) / 1000 * settings.LLM_COST_PER_1K_OUTPUT_TOKENS,
+        4
+    )
+
+
+class UsageMetricsWriter:
+    """Bounded in-memory buffer of usage records with a periodic bulk flush"""
+
+    def __init__(
+        self,
+        max_buffer: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 5.0,
+        max_retries: int = 5
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._buffer = deque(maxlen=max_buffer)
+        # (failed attempts, batch) waiting to be retried
+        self._retry = deque()
+        self._retry_rows = 0
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def record(
+        self,
+        api_provider: str,
+        endpoint_used: str = None,
+        user_id: str = None,
+        tokens_used: int = None,
+        characters_processed: int = None,
+        cost_incurred: float = None
+    ):
+        """Queue one usage record (never blocks, never touches the DB)"""
+        if len(self._buffer) == self._buffer.maxlen:
+            # deque drops the oldest record when full
+            self.dropped += 1
+        self._buffer.append({
+            "api_provider": api_provider,
+            "endpoint_used": endpoint_used,
+            "user_id": user_id,
+            "tokens_used": tokens_used,
+            "characters_processed": characters_processed,
+            "cost_incurred": cost_incurred,
+            "timestamp": datetime.utcnow()
+        })
+        self.recorded += 1
+
+    async def flush(self) -> int:
+        """
+        Write everything buffered so far in bulk inserts, then retry earlier
+        failed batches; returns rows written
+        """
+        retries = [self._retry.popleft() for _ in range(len(self._retry))]
+        self._retry_rows = 0
+        total = 0
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            total += await self._write(batch, attempts=0)
+        for attempts, batch in retries:
+            total += await self._write(batch, attempts)
+        self.written += total
+        return total
+
+    async def _insert(self, batch: list):
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(ApiUsageMetric), batch)
+            await db.commit()
+
+    async def _write(self, batch: list, attempts: int) -> int:
+        """Insert one batch, bisecting on row errors; returns rows written"""
+        try:
+            await self._insert(batch)
+            return len(batch)
+        except ROW_ERRORS as e:
+            if len(batch) == 1:
+                self.rejected += 1
+                logger.error(f"Dropped usage metric rejected by the DB ({batch[0]['api_provider']}): {e}")
+                return 0
+            middle = len(batch) // 2
+            return await self._write(batch[:middle], attempts) + await self._write(batch[middle:], attempts)
+        except Exception as e:
+            attempts += 1
+            if attempts >= self.max_retries:
+                self.dropped += len(batch)
+                logger.error(f"Dropped {len(batch)} usage metrics after {attempts} failed flushes: {e}")
+            else:
+                self._requeue(batch, attempts)
+                logger.error(f"Failed to flush {len(batch)} usage metrics (attempt {attempts}): {e}")
+            return 0
+
+    def _requeue(self, batch: list, attempts: int):
+        """Keep a failed batch for the next tick, within the buffer's row bound"""
+        self._retry.append((attempts, batch))
+        self._retry_rows += len(batch)
+        while self._retry_rows > self._buffer.maxlen:
+            _, oldest = self._retry.popleft()
+            self._retry_rows -= len(oldest)
+            self.dropped += len(oldest)
+            logger.error(f"Dropped {len(oldest)} usage metrics: retry backlog full")
+
+    def start(self):
+        """Start the background flush loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Usage metrics writer started (flush every {self.flush_interval}s)")
+
+    async def stop(self):
+        """Stop the flush loop and write whatever is left"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def snapshot(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "retrying": self._retry_rows,
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "rejected": self.rejected
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+# Global instance
+_usage_writer = None
+
+
+def get_usage_writer() -> UsageMetricsWriter:
+    """Get or create the usage metrics writer singleton"""
+    global _usage_writer
+    if _usage_writer is None:
+        _usage_writer = UsageMetricsWriter(
+            max_buffer=settings.USAGE_METRICS_MAX_BUFFER,
+            batch_size=settings.USAGE_METRICS_BATCH_SIZE,
+            flush_interval=settings.USAGE_METRICS_FLUSH_INTERVAL_SECONDS,
+            max_retries=settings.USAGE_METRICS_MAX_RETRIES
+        )
+    return _usage_writer
+
+
+def record_usage(api_provider: str, **fields):
+    """Convenience function for recording a provider call"""
+    get_usage_writer().record(api_provider, **fields)
@@ -0,0 +1,159 @@
+"""
+Recall and latency benchmark for the knowledge retrieval backends
+
+Compares the legacy ILIKE query, Postgres full-text search, the in-process
+BM25 index and the embedding index on a set of labelled queries against the
+configured database.
+
+Queries file (JSONL), one per line:
+  {"query": "I can't switch off at night", "relevant_ids": ["<knowledge_id>", ...]}
+  {"query": "...", "emotions": ["insomnia", "anxiety"]}
+"emotions" marks every row whose helps_with_emotions contains one of them as
+relevant. Without --queries a small built-in set of emotion-labelled queries
+is used.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+from sqlalchemy import select, or_
+
+DEFAULT_QUERIES = [
+    {"query": "I can't switch off at night, my mind keeps racing", "emotions": ["insomnia", "anxiety", "restlessness"]},
+    {"query": "Work has me so wound up I snap at everyone", "emotions": ["anger", "irritability", "frustration", "stress"]},
+    {"query": "I feel heavy and can't get out of bed in the morning", "emotions": ["lethargy", "sadness", "depression"]},
+    {"query": "My chest feels tight before every presentation", "emotions": ["anxiety", "fear", "nervousness", "stress"]},
+    {"query": "Everything feels pointless lately and I cry a lot", "emotions": ["sadness", "grief", "depression"]},
+    {"query": "I'm scattered, can't focus on anything for long", "emotions": ["restlessness", "anxiety", "overwhelm"]},
+]
+
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def _legacy_ilike(db, text, limit):
+    """The pre-full-text query: OR'd ILIKE on words over four characters, unranked"""
+    from app.models.ayurveda_knowledge import AyurvedaKnowledge
+
+    words = [w for w in text.lower().split() if len(w) > 4]
+    if not words:
+        return []
+    conditions = []
+    for word in words:
+        conditions.append(AyurvedaKnowledge.title.ilike(f"%{word}%"))
+        conditions.append(AyurvedaKnowledge.description_short.ilike(f"%{word}%"))
+    result = await db.execute(select(AyurvedaKnowledge.knowledge_id).where(or_(*conditions)).limit(limit))
+    return [str(knowledge_id) for knowledge_id in result.scalars().all()]
+
+
+async def benchmark(queries, k: int, repeats: int) -> bool:
+    from app.database.connection import AsyncSessionLocal, engine
+    from app.models.ayurveda_knowledge import AyurvedaKnowledge
+    from app.services.database_service import get_relevant_knowledge
+    from app.services.knowledge_index import get_knowledge_index
+    from app.services.embedding_index import get_embedding_index
+
+    try:
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(AyurvedaKnowledge.knowledge_id, AyurvedaKnowledge.helps_with_emotions)
+            )).all()
+
+        # Resolve emotion labels to relevant ids
+        for query in queries:
+            relevant = set(query.get("relevant_ids", []))
+            labels = {label.lower() for label in query.get("emotions", [])}
+            for knowledge_id, emotions in rows:
+                if labels & {str(e).lower() for e in (emotions or [])}:
+                    relevant.add(str(knowledge_id))
+            query["relevant"] = relevant
+        queries = [q for q in queries if q["relevant"]]
+        if not queries:
+            print("❌ No query has a relevant row in this database")
+            return False
+
+        knowledge_index = get_knowledge_index()
+        await knowledge_index.rebuild()
+        embedding_index = get_embedding_index()
+        await asyncio.to_thread(embedding_index.load)
+
+        def with_session(search):
+            async def run(text):
+                async with AsyncSessionLocal() as db:
+                    return await search(db, text)
+            return run
+
+        backends = {
+            "ilike (legacy)": with_session(lambda db, text: _legacy_ilike(db, text, k)),
+            "postgres fts": with_session(
+                lambda db, text: _ids(get_relevant_knowledge(db, text, limit=k))
+            ),
+        }
+        if knowledge_index.ready:
+            backends["memory bm25"] = lambda text: _done(
+                [str(item.knowledge_id) for item in knowledge_index.search(text, limit=k)]
+            )
+        if embedding_index.ready:
+            backends["embedding"] = lambda text: asyncio.to_thread(embedding_index.search, text, k)
+        else:
+            print(f"⚠️  Embedding index skipped: {embedding_index.load_error}")
+
+        print(f"\n{len(queries)} queries, k={k}, {repeats} runs each\n")
+        print(f"{'backend':<18}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, search in backends.items():
+            recalls, latencies = [], []
+            for query in queries:
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    found = await search(query["query"])
+                    latencies.append((time.perf_counter() - start) * 1000)
+                hits = len(set(found) & query["relevant"])
+                recalls.append(hits / min(k, len(query["relevant"])))
+            print(
+                f"{name:<18}{statistics.mean(recalls):>10.2f}"
+                f"{_percentile(latencies, 50):>10.2f}{_percentile(latencies, 95):>10.2f}"
+            )
+        return True
+
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        return False
+
+    finally:
+        await engine.dispose()
+
+
+async def _ids(items_coro):
+    return [str(item.knowledge_id) for item in await items_coro]
+
+
+async def _done(value):
+    return value
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queries", help="JSONL file of labelled queries")
+    parser.add_argument("-k", type=int, default=3, help="results per query (check-ins use 3)")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per query")
+    args = parser.parse_args()
+
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [json.loads(line) for line in f if line.strip()]
+    else:
+        queries = [dict(q) for q in DEFAULT_QUERIES]
+
+    success = asyncio.run(benchmark(queries, args.k, args.repeats))
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
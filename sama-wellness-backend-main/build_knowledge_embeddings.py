@@ -0,0 +1,98 @@
+"""
+Offline build of the knowledge embedding index (KNOWLEDGE_RETRIEVAL_BACKEND=embedding)
+
+Embeds every ayurveda_knowledge row with the local sentence encoder and
+writes the float32 matrix and its manifest next to KNOWLEDGE_EMBEDDINGS_PATH.
+Re-run after knowledge content changes, then restart (or redeploy) the API.
+
+Requires the "embeddings" extra:  pip install numpy sentence-transformers
+With --model bert-emotion the rows are embedded with the BERT emotion
+detector instead (needs torch/transformers and the fine-tuned model).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import select
+
+
+async def build(output_path: str, model_name: str, batch_size: int) -> bool:
+    import numpy as np
+    from app.database.connection import AsyncSessionLocal, engine
+    from app.models.ayurveda_knowledge import AyurvedaKnowledge
+    from app.services.embedding_index import knowledge_embedding_text, load_encoder, manifest_path
+
+    try:
+        print("1️⃣ Loading knowledge rows...")
+        async with AsyncSessionLocal() as db:
+            items = (await db.execute(
+                select(AyurvedaKnowledge).order_by(AyurvedaKnowledge.knowledge_id)
+            )).scalars().all()
+        if not items:
+            print("   ❌ ayurveda_knowledge is empty")
+            return False
+        print(f"   ✅ {len(items)} rows")
+
+        print(f"\n2️⃣ Encoding with {model_name} (CPU)...")
+        encoder = load_encoder(model_name)
+        matrix = encoder.encode(
+            [knowledge_embedding_text(item) for item in items],
+            batch_size=batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=True
+        ).astype(np.float32)
+        matrix = np.ascontiguousarray(matrix)
+        print(f"   ✅ {matrix.shape[0]} x {matrix.shape[1]} float32")
+
+        print("\n3️⃣ Writing index...")
+        output = Path(output_path)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        manifest = {
+            "model": model_name,
+            "dim": int(matrix.shape[1]),
+            "built_at": datetime.utcnow().isoformat(),
+            "knowledge_ids": [str(item.knowledge_id) for item in items],
+            "balances_doshas": [item.balances_doshas or [] for item in items],
+            "helps_with_emotions": [item.helps_with_emotions or [] for item in items],
+        }
+        # Write to temp files and rename, so a running replica never maps a partial file
+        tmp_matrix = output.with_name(output.name + ".tmp")
+        with open(tmp_matrix, "wb") as f:
+            np.save(f, matrix)
+        tmp_manifest = manifest_path(output_path).with_name(manifest_path(output_path).name + ".tmp")
+        tmp_manifest.write_text(json.dumps(manifest))
+        os.replace(tmp_matrix, output)
+        os.replace(tmp_manifest, manifest_path(output_path))
+        print(f"   ✅ {output} and {manifest_path(output_path)}")
+        return True
+
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        return False
+
+    finally:
+        await engine.dispose()
+
+
+def main():
+    """Main entry point"""
+    from app.config import settings
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default=settings.KNOWLEDGE_EMBEDDINGS_PATH)
+    parser.add_argument("--model", default=settings.KNOWLEDGE_EMBEDDING_MODEL)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    success = asyncio.run(build(args.output, args.model, args.batch_size))
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+-- Migration Script: Cache invalidation notifications
+-- Date: 2026-10-19
+-- Description: Publish a NOTIFY on the cache_invalidation channel whenever a row
+-- that feeds an in-process cache changes, so every FastAPI replica (and writes
+-- made by the Node backend) evict the matching cache keys.
+--
+-- Payload: {"table": "<table>", "op": "INSERT|UPDATE|DELETE", "key": "<id>"}
+-- The key column is passed as the trigger argument.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION notify_cache_invalidation() RETURNS trigger AS $$
+DECLARE
+    row_data JSONB;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+
+    PERFORM pg_notify(
+        'cache_invalidation',
+        json_build_object(
+            'table', TG_TABLE_NAME,
+            'op', TG_OP,
+            'key', row_data ->> TG_ARGV[0]
+        )::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_cache_invalidation ON users;
+CREATE TRIGGER users_cache_invalidation
+AFTER INSERT OR UPDATE OR DELETE ON users
+FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation('id');
+
+DROP TRIGGER IF EXISTS user_preferences_cache_invalidation ON user_preferences;
+CREATE TRIGGER user_preferences_cache_invalidation
+AFTER INSERT OR UPDATE OR DELETE ON user_preferences
+FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation('user_id');
+
+DROP TRIGGER IF EXISTS dosha_assessment_cache_invalidation ON dosha_assessment;
+CREATE TRIGGER dosha_assessment_cache_invalidation
+AFTER INSERT OR UPDATE OR DELETE ON dosha_assessment
+FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation('user_id');
+
+DROP TRIGGER IF EXISTS ayurveda_knowledge_cache_invalidation ON ayurveda_knowledge;
+CREATE TRIGGER ayurveda_knowledge_cache_invalidation
+AFTER INSERT OR UPDATE OR DELETE ON ayurveda_knowledge
+FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation('knowledge_id');
+
+COMMIT;
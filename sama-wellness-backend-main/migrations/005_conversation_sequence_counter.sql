@@ -0,0 +1,49 @@
+-- Migration Script: Atomic message sequence allocation
+-- Date: 2026-10-19
+-- Description: Add a per-session sequence counter to conversation_sessions and
+-- enforce unique (session_id, sequence_number) on conversation_messages.
+-- Sequence numbers are allocated with
+--   UPDATE conversation_sessions SET last_sequence_number = last_sequence_number + n ... RETURNING
+-- instead of counting the session's messages.
+
+BEGIN;
+
+-- 1) Counter column
+ALTER TABLE conversation_sessions
+ADD COLUMN IF NOT EXISTS last_sequence_number INTEGER NOT NULL DEFAULT 0;
+
+-- 2) Overlapping turns and cancelled turns could reuse a sequence number;
+--    renumber each session in (sequence_number, created_at) order so the
+--    constraint below can be created
+WITH numbered AS (
+    SELECT
+        message_id,
+        ROW_NUMBER() OVER (
+            PARTITION BY session_id
+            ORDER BY sequence_number, created_at, message_id
+        ) AS new_sequence
+    FROM conversation_messages
+)
+UPDATE conversation_messages m
+SET sequence_number = numbered.new_sequence
+FROM numbered
+WHERE m.message_id = numbered.message_id
+  AND m.sequence_number <> numbered.new_sequence;
+
+-- 3) Backfill counters
+UPDATE conversation_sessions s
+SET last_sequence_number = counts.max_sequence
+FROM (
+    SELECT session_id, MAX(sequence_number) AS max_sequence
+    FROM conversation_messages
+    GROUP BY session_id
+) counts
+WHERE s.session_id = counts.session_id;
+
+-- 4) One message per sequence number per session
+ALTER TABLE conversation_messages
+DROP CONSTRAINT IF EXISTS uq_conversation_messages_session_sequence;
+ALTER TABLE conversation_messages
+ADD CONSTRAINT uq_conversation_messages_session_sequence UNIQUE (session_id, sequence_number);
+
+COMMIT;
@@ -0,0 +1,34 @@
+-- Migration Script: Covering indexes for the session list
+-- Date: 2026-10-19
+-- Description: Support GET /api/daily_checkin/sessions/{user_id}, which pages
+-- a user's sessions on (start_time, session_id) and aggregates message counts,
+-- the last message and the dominant emotion per session in one query.
+--   * sessions page: index-only keyset scan per user
+--   * per-session stats: index-only scan of the session's messages
+--   * dominant emotion: message -> primary_emotion without heap fetches
+
+BEGIN;
+
+-- 1) Keyset page of a user's sessions (replaces idx_conv_sessions_user)
+CREATE INDEX IF NOT EXISTS idx_conv_sessions_user_start_id
+ON conversation_sessions(user_id, start_time DESC, session_id DESC)
+INCLUDE (session_type, end_time);
+
+DROP INDEX IF EXISTS idx_conv_sessions_user;
+
+-- 2) Message count, last sequence number and message ids per session
+--    (replaces idx_conv_messages_session)
+CREATE INDEX IF NOT EXISTS idx_conv_messages_session_covering
+ON conversation_messages(session_id, sequence_number DESC)
+INCLUDE (message_id, created_at);
+
+DROP INDEX IF EXISTS idx_conv_messages_session;
+
+-- 3) Emotion per message (replaces idx_emotion_message)
+CREATE INDEX IF NOT EXISTS idx_emotion_message_covering
+ON emotion_analysis(message_id)
+INCLUDE (primary_emotion, analysis_timestamp);
+
+DROP INDEX IF EXISTS idx_emotion_message;
+
+COMMIT;
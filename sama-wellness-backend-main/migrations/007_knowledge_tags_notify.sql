@@ -0,0 +1,15 @@
+-- Migration Script: Knowledge tag change notifications
+-- Date: 2026-10-19
+-- Description: The in-process knowledge index (app/services/knowledge_index.py)
+-- indexes knowledge_tags values with their knowledge row, so tag changes must
+-- reach it too. Reuses notify_cache_invalidation() from migration 004 with the
+-- knowledge_id as key.
+
+BEGIN;
+
+DROP TRIGGER IF EXISTS knowledge_tags_cache_invalidation ON knowledge_tags;
+CREATE TRIGGER knowledge_tags_cache_invalidation
+AFTER INSERT OR UPDATE OR DELETE ON knowledge_tags
+FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation('knowledge_id');
+
+COMMIT;
@@ -0,0 +1,97 @@
+-- Migration Script: Full-text search for Ayurveda knowledge
+-- Date: 2026-10-19
+-- Description: Add a weighted tsvector to ayurveda_knowledge with a GIN index,
+-- kept current by triggers on ayurveda_knowledge and knowledge_tags. Used by
+-- get_relevant_knowledge (websearch_to_tsquery + ts_rank_cd) instead of
+-- unindexed ILIKE scans.
+--
+-- Weights: A = title, B = short description, C = detailed description,
+--          D = helps_with_emotions and knowledge_tags values
+
+BEGIN;
+
+-- 1) Column
+ALTER TABLE ayurveda_knowledge
+ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+-- 2) Vector for one row (tags are read from knowledge_tags)
+CREATE OR REPLACE FUNCTION knowledge_search_vector(
+    p_knowledge_id UUID,
+    p_title TEXT,
+    p_description_short TEXT,
+    p_description_detailed TEXT,
+    p_helps_with_emotions TEXT
+) RETURNS tsvector AS $$
+    SELECT
+        setweight(to_tsvector('english', coalesce(p_title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(p_description_short, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(p_description_detailed, '')), 'C') ||
+        setweight(to_tsvector('english',
+            coalesce(p_helps_with_emotions, '') || ' ' ||
+            coalesce((
+                SELECT string_agg(tag_value, ' ')
+                FROM knowledge_tags
+                WHERE knowledge_id = p_knowledge_id
+            ), '')
+        ), 'D');
+$$ LANGUAGE sql STABLE;
+
+-- 3) Maintain on knowledge changes
+CREATE OR REPLACE FUNCTION ayurveda_knowledge_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := knowledge_search_vector(
+        NEW.knowledge_id,
+        NEW.title,
+        NEW.description_short,
+        NEW.description_detailed,
+        NEW.helps_with_emotions::text
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ayurveda_knowledge_search_vector ON ayurveda_knowledge;
+CREATE TRIGGER ayurveda_knowledge_search_vector
+BEFORE INSERT OR UPDATE OF title, description_short, description_detailed, helps_with_emotions
+ON ayurveda_knowledge
+FOR EACH ROW EXECUTE FUNCTION ayurveda_knowledge_search_vector_update();
+
+-- 4) Maintain on tag changes
+CREATE OR REPLACE FUNCTION knowledge_tags_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    UPDATE ayurveda_knowledge ak
+    SET search_vector = knowledge_search_vector(
+        ak.knowledge_id,
+        ak.title,
+        ak.description_short,
+        ak.description_detailed,
+        ak.helps_with_emotions::text
+    )
+    WHERE ak.knowledge_id IN (
+        CASE WHEN TG_OP <> 'INSERT' THEN OLD.knowledge_id END,
+        CASE WHEN TG_OP <> 'DELETE' THEN NEW.knowledge_id END
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS knowledge_tags_search_vector ON knowledge_tags;
+CREATE TRIGGER knowledge_tags_search_vector
+AFTER INSERT OR UPDATE OR DELETE ON knowledge_tags
+FOR EACH ROW EXECUTE FUNCTION knowledge_tags_search_vector_update();
+
+-- 5) Backfill
+UPDATE ayurveda_knowledge
+SET search_vector = knowledge_search_vector(
+    knowledge_id,
+    title,
+    description_short,
+    description_detailed,
+    helps_with_emotions::text
+);
+
+-- 6) Index
+CREATE INDEX IF NOT EXISTS idx_ayurveda_knowledge_search
+ON ayurveda_knowledge USING GIN (search_vector);
+
+COMMIT;
@@ -0,0 +1,33 @@
+-- Migration Script: Keep ayurveda_knowledge.updated_at current
+-- Date: 2026-10-19
+-- Description: Stamp updated_at on every ayurveda_knowledge update and index
+-- it. The in-process knowledge catalog fingerprints the table with
+-- count(*) and max(updated_at) and only reloads when that changes, so an
+-- edit that left updated_at alone would never be picked up.
+
+BEGIN;
+
+-- 1) Backfill rows that never had it set
+UPDATE ayurveda_knowledge
+SET updated_at = coalesce(created_at, now())
+WHERE updated_at IS NULL;
+
+-- 2) Stamp on update (also covers search_vector refreshes from tag changes,
+-- migrations/008)
+CREATE OR REPLACE FUNCTION ayurveda_knowledge_touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ayurveda_knowledge_touch_updated_at ON ayurveda_knowledge;
+CREATE TRIGGER ayurveda_knowledge_touch_updated_at
+BEFORE UPDATE ON ayurveda_knowledge
+FOR EACH ROW EXECUTE FUNCTION ayurveda_knowledge_touch_updated_at();
+
+-- 3) Index for the max(updated_at) fingerprint
+CREATE INDEX IF NOT EXISTS idx_ayurveda_knowledge_updated_at
+ON ayurveda_knowledge(updated_at);
+
+COMMIT;
@@ -0,0 +1,29 @@
+-- Migration Script: Durable post-response job outbox
+-- Date: 2026-10-19
+-- Description: Jobs for the writes that follow a check-in turn (emotion
+-- analysis, dosha tracking, streak, daily progress) are inserted in the
+-- turn's own transaction and claimed by workers with FOR UPDATE SKIP LOCKED,
+-- so they survive deploys and crashes. A job's effects and its deletion
+-- commit together; jobs that exhaust their attempts stay as status 'failed'.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS post_response_jobs (
+    job_id BIGSERIAL PRIMARY KEY,
+    job_type VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    locked_until TIMESTAMPTZ,
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    CONSTRAINT chk_post_response_job_status CHECK (status IN ('pending', 'failed'))
+);
+
+-- Claim scan: pending jobs in id order
+CREATE INDEX IF NOT EXISTS idx_post_response_jobs_pending
+ON post_response_jobs (job_id)
+WHERE status = 'pending';
+
+COMMIT;
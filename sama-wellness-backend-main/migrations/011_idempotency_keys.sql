@@ -0,0 +1,30 @@
+-- Migration Script: Durable Idempotency-Key records
+-- Date: 2026-10-19
+-- Description: One row per (scope, user, Idempotency-Key). The replica that
+-- inserts the row runs the request while holding a lease; a retry on any
+-- replica finds the row and waits for it, or replays the stored response.
+-- Check-in turns mark their key completed in the turn's own transaction.
+-- scope keeps keys of different services apart (checkin-voice forwards
+-- its key to the check-in service). Expired rows are purged lazily.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    scope VARCHAR(20) NOT NULL,
+    user_id VARCHAR(255) NOT NULL,
+    idempotency_key VARCHAR(255) NOT NULL,
+    request_fingerprint VARCHAR(64) NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending',
+    response JSONB,
+    locked_until TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (scope, user_id, idempotency_key),
+    CONSTRAINT chk_idempotency_key_status CHECK (status IN ('pending', 'completed'))
+);
+
+-- Purge scan
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at
+ON idempotency_keys (expires_at);
+
+COMMIT;
@@ -0,0 +1,195 @@
+# test_cache.py
+"""
+Tests for the in-process caches: TTL/LRU behaviour and invalidation of the
+per-user context cache, the profile CTEs being skipped on a cache hit, and
+session transcripts that stay a gap-free prefix of the session
+"""
+
+import asyncio
+
+import pytest
+
+import app.services.cache as cache
+import app.services.database_service as database_service
+from app.services.cache import SessionTranscriptCache, TTLCache, invalidate_user_context
+from app.services.database_service import (
+    CHECKIN_CONTEXT_SQL,
+    CHECKIN_TURN_CONTEXT_SQL,
+    USER_PROFILE_CONTEXT_SQL,
+    CheckinMessage,
+    CheckinUser,
+    UserProfileContext,
+    get_user_profile_context,
+    load_checkin_context,
+)
+
+USER_ID = "7b0c8a4e-0d7f-4f8e-9d8c-3f0c1f7e2a11"
+
+
+def test_ttl_cache_expires_entries():
+    ttl_cache = TTLCache("test", ttl_seconds=60)
+    ttl_cache.set("fresh", 1)
+    ttl_cache.set("stale", 2, ttl_seconds=-1)
+    assert ttl_cache.get("fresh") == 1
+    assert ttl_cache.get("stale") is None
+    assert ttl_cache.snapshot()["hits"] == 1
+    assert ttl_cache.snapshot()["misses"] == 1
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    ttl_cache = TTLCache("test", max_entries=2)
+    ttl_cache.set("a", 1)
+    ttl_cache.set("b", 2)
+    ttl_cache.get("a")
+    ttl_cache.set("c", 3)
+    assert ttl_cache.get("b") is None
+    assert ttl_cache.get("a") == 1
+    assert ttl_cache.snapshot()["evictions"] == 1
+
+
+def test_ttl_cache_invalidate():
+    ttl_cache = TTLCache("test")
+    ttl_cache.set("a", 1)
+    assert ttl_cache.invalidate("a")
+    assert not ttl_cache.invalidate("a")
+    assert ttl_cache.get("a") is None
+    assert ttl_cache.snapshot()["invalidations"] == 1
+
+
+class _Result:
+    def __init__(self, row):
+        self.row = row
+
+    def mappings(self):
+        return self
+
+    def one(self):
+        return self.row
+
+
+class _Db:
+    def __init__(self, row: dict):
+        self.row = row
+        self.statements = []
+        self.params = []
+
+    async def execute(self, statement, params=None):
+        self.statements.append(statement)
+        self.params.append(params)
+        return _Result(self.row)
+
+
+PROFILE_ROW = {
+    "user_row": {"id": USER_ID, "full_name": "Asha Rao"},
+    "preferences_row": {"nickname": "Asha"},
+    "prakriti": "kapha"
+}
+
+TURN_ROW = {
+    "bikriti_row": None,
+    "history_rows": None,
+    "session_found": False,
+    "session_rows": None,
+    "recent_rows": None
+}
+
+
+@pytest.fixture
+def transcripts(monkeypatch) -> SessionTranscriptCache:
+    transcripts = SessionTranscriptCache()
+    monkeypatch.setattr(database_service, "get_session_transcript_cache", lambda: transcripts)
+    return transcripts
+
+
+@pytest.fixture
+def user_context(monkeypatch, transcripts) -> TTLCache:
+    user_context = TTLCache("user_context")
+    for module in (cache, database_service):
+        monkeypatch.setattr(module, "get_user_context_cache", lambda: user_context)
+    return user_context
+
+
+def test_profile_is_read_once_then_served_from_cache(user_context):
+    db = _Db(PROFILE_ROW)
+    first = asyncio.run(get_user_profile_context(db, USER_ID))
+    second = asyncio.run(get_user_profile_context(db, USER_ID))
+    assert db.statements == [USER_PROFILE_CONTEXT_SQL]
+    assert first is second
+    assert second.preferences.nickname == "Asha"
+
+
+def test_unknown_user_is_not_cached(user_context):
+    db = _Db({"user_row": None, "preferences_row": None, "prakriti": None})
+    assert asyncio.run(get_user_profile_context(db, USER_ID)) is None
+    assert asyncio.run(get_user_profile_context(db, USER_ID)) is None
+    assert len(db.statements) == 2
+
+
+def test_context_load_skips_profile_ctes_when_cached(user_context):
+    db = _Db({**PROFILE_ROW, **TURN_ROW})
+    asyncio.run(load_checkin_context(db, USER_ID))
+    turn_db = _Db(TURN_ROW)
+    context = asyncio.run(load_checkin_context(turn_db, USER_ID))
+    assert db.statements == [CHECKIN_CONTEXT_SQL]
+    assert turn_db.statements == [CHECKIN_TURN_CONTEXT_SQL]
+    assert context.dosha_type_name == "kapha"
+    assert context.user.full_name == "Asha Rao"
+
+
+def test_invalidated_user_is_read_again(user_context):
+    user_context.set(USER_ID, UserProfileContext(user=CheckinUser(id=USER_ID), preferences=None, prakriti="vata"))
+    invalidate_user_context(USER_ID)
+    db = _Db({**PROFILE_ROW, **TURN_ROW})
+    context = asyncio.run(load_checkin_context(db, USER_ID))
+    assert db.statements == [CHECKIN_CONTEXT_SQL]
+    assert context.dosha_type_name == "kapha"
+
+
+def _messages(*sequence_numbers, text="hello"):
+    return [CheckinMessage(message_id=f"m{n}", sequence_number=n, transcript_text=text) for n in sequence_numbers]
+
+
+def test_transcript_append_extends_a_gap_free_prefix():
+    transcripts = SessionTranscriptCache()
+    transcripts.put("s1", _messages(1, 2))
+    transcripts.append("s1", _messages(4, 3))
+    transcripts.append("s1", _messages(2))  # Already cached
+    assert [m.sequence_number for m in transcripts.get("s1")] == [1, 2, 3, 4]
+
+
+def test_transcript_gap_drops_the_session():
+    transcripts = SessionTranscriptCache()
+    transcripts.put("s1", _messages(1, 2))
+    # Messages 3-4 were saved by another replica; appending 5-6 would hide them
+    transcripts.append("s1", _messages(5, 6))
+    assert transcripts.get("s1") is None
+    assert transcripts.snapshot()["gap_invalidations"] == 1
+    assert transcripts.snapshot()["bytes"] == 0
+
+
+def test_transcript_append_ignores_uncached_sessions():
+    transcripts = SessionTranscriptCache()
+    transcripts.append("s1", _messages(1))
+    assert transcripts.get("s1") is None
+
+
+def test_transcript_cache_is_bounded_by_bytes():
+    transcripts = SessionTranscriptCache(max_bytes=3 * (SessionTranscriptCache.MESSAGE_OVERHEAD_BYTES + 5))
+    transcripts.put("s1", _messages(1, 2))
+    transcripts.put("s2", _messages(1))
+    transcripts.append("s2", _messages(2))
+    assert transcripts.get("s1") is None
+    assert len(transcripts.get("s2")) == 2
+    assert transcripts.snapshot()["evictions"] == 1
+
+
+def test_cached_transcript_only_reads_new_messages(transcripts, monkeypatch):
+    monkeypatch.setattr(database_service, "get_user_context_cache", lambda: TTLCache("user_context"))
+    transcripts.put("s1", _messages(1, 2))
+    db = _Db({**PROFILE_ROW, **TURN_ROW, "session_found": True, "session_rows": [
+        {"message_id": "m3", "sequence_number": 3, "transcript_text": "from another replica", "created_at": None}
+    ]})
+    context = asyncio.run(load_checkin_context(db, USER_ID, "s1"))
+    assert db.params[0]["after_sequence"] == 2
+    assert [m.sequence_number for m in context.session_messages] == [1, 2, 3]
+    assert [m.sequence_number for m in transcripts.get("s1")] == [1, 2, 3]
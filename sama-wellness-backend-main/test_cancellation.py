@@ -0,0 +1,86 @@
+# test_cancellation.py
+"""
+Tests for cancelling in-flight work when the client disconnects
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import app.services.cancellation as cancellation
+from app.services.cancellation import ClientDisconnected, run_until_disconnected
+
+
+class _Request:
+    """A request whose client disconnects after the given number of polls (never if None)"""
+
+    url = SimpleNamespace(path="/api/checkin/chat")
+
+    def __init__(self, disconnect_after=None):
+        self.disconnect_after = disconnect_after
+        self.polls = 0
+
+    async def is_disconnected(self):
+        self.polls += 1
+        return self.disconnect_after is not None and self.polls > self.disconnect_after
+
+
+@pytest.fixture(autouse=True)
+def fast_poll(monkeypatch):
+    monkeypatch.setattr(cancellation.settings, "DISCONNECT_POLL_INTERVAL_SECONDS", 0.01)
+
+
+def _work(events: list, seconds: float):
+    async def work():
+        try:
+            await asyncio.sleep(seconds)
+            return "reply"
+        except asyncio.CancelledError:
+            events.append("cancelled")
+            raise
+    return work()
+
+
+def test_returns_result_while_client_connected():
+    events = []
+    request = _Request()
+    result = asyncio.run(run_until_disconnected(request, _work(events, 0.05)))
+    assert result == "reply"
+    assert events == []
+    assert request.polls >= 1
+
+
+def test_disconnect_cancels_work():
+    events = []
+
+    async def scenario():
+        with pytest.raises(ClientDisconnected):
+            await run_until_disconnected(_Request(disconnect_after=1), _work(events, 10))
+        await asyncio.sleep(0)  # Let the cancelled work run its handler
+
+    asyncio.run(scenario())
+    assert events == ["cancelled"]
+
+
+def test_work_error_is_raised():
+    async def failing():
+        raise RuntimeError("provider down")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run_until_disconnected(_Request(), failing()))
+
+
+def test_cancelling_the_handler_cancels_work():
+    events = []
+
+    async def scenario():
+        handler = asyncio.create_task(run_until_disconnected(_Request(), _work(events, 10)))
+        await asyncio.sleep(0.02)
+        handler.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await handler
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert events == ["cancelled"]
@@ -0,0 +1,142 @@
+# test_checkin_context.py
+"""
+Tests for load_checkin_context: decoding the single CTE row into user,
+preferences, dosha context, session messages and the 2-day window
+"""
+
+import asyncio
+import json
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import app.services.database_service as database_service
+from app.services.cache import SessionTranscriptCache, TTLCache
+from app.services.database_service import (
+    CHECKIN_CONTEXT_SQL,
+    CheckinPreferences,
+    load_checkin_context,
+)
+
+USER_ID = "7b0c8a4e-0d7f-4f8e-9d8c-3f0c1f7e2a11"
+SESSION_ID = "1d6f3c2a-5b4e-4a3d-8c2b-9e1f0a7d6c55"
+
+
+class _Result:
+    def __init__(self, row):
+        self.row = row
+
+    def mappings(self):
+        return self
+
+    def one(self):
+        return self.row
+
+
+class _Db:
+    """Answers every statement with the given row and remembers what was asked"""
+
+    def __init__(self, row: dict):
+        self.row = row
+        self.calls = []
+
+    async def execute(self, statement, params=None):
+        self.calls.append((statement, params))
+        return _Result(self.row)
+
+
+@pytest.fixture(autouse=True)
+def caches(monkeypatch):
+    user_context = TTLCache("user_context")
+    transcripts = SessionTranscriptCache()
+    monkeypatch.setattr(database_service, "get_user_context_cache", lambda: user_context)
+    monkeypatch.setattr(database_service, "get_session_transcript_cache", lambda: transcripts)
+    return user_context, transcripts
+
+
+def _iso(value) -> str:
+    return value.isoformat()
+
+
+def _message(message_id, sequence_number, created_at, text="hello"):
+    return {
+        "message_id": message_id,
+        "sequence_number": sequence_number,
+        "transcript_text": text,
+        "ai_response_text": None,
+        "created_at": _iso(created_at)
+    }
+
+
+def _row(**overrides) -> dict:
+    now = datetime.utcnow()
+    today = date.today()
+    row = {
+        "user_row": {"id": USER_ID, "full_name": "Asha Rao"},
+        "preferences_row": {"nickname": "Asha", "preferred_language": "en", "emotional_attachment": 3},
+        "prakriti": "pitta",
+        "bikriti_row": {"dominant_imbalance": "vata", "imbalance_intensity": 6, "created_at": _iso(now)},
+        "history_rows": [
+            {"date": _iso(today - timedelta(days=1)), "dominant_imbalance": "kapha",
+             "imbalance_intensity": 4, "created_at": _iso(now - timedelta(days=1))},
+            {"date": _iso(today), "dominant_imbalance": "vata",
+             "imbalance_intensity": 6, "created_at": _iso(now)},
+        ],
+        "session_found": True,
+        "session_rows": [
+            _message("m1", 1, now - timedelta(days=5), "from last week"),
+            _message("m2", 2, now - timedelta(minutes=5), "just now"),
+        ],
+        "recent_rows": [_message("r1", 7, now - timedelta(hours=3), "other session")],
+    }
+    row.update(overrides)
+    return row
+
+
+def test_decodes_profile_dosha_and_messages():
+    db = _Db(_row())
+    context = asyncio.run(load_checkin_context(db, USER_ID, SESSION_ID))
+
+    assert db.calls[0][0] is CHECKIN_CONTEXT_SQL
+    assert db.calls[0][1]["after_sequence"] is None
+    assert context.user.full_name == "Asha Rao"
+    assert context.preferences == CheckinPreferences(nickname="Asha", preferred_language="en", emotional_attachment=3)
+    assert context.dosha_type_name == "pitta"
+    assert context.dosha_context["bikriti"]["dosha"] == "vata"
+    assert context.dosha_context["history"]["today"]["intensity"] == 6
+    assert context.dosha_context["history"]["yesterday"]["dosha"] == "kapha"
+    assert [m.message_id for m in context.session_messages] == ["m1", "m2"]
+    assert isinstance(context.session_messages[0].created_at, datetime)
+
+
+def test_recent_window_merges_current_session_messages():
+    context = asyncio.run(load_checkin_context(_Db(_row()), USER_ID, SESSION_ID))
+    # m1 is older than two days; the rest are ordered by created_at
+    assert [m.message_id for m in context.recent_messages] == ["r1", "m2"]
+
+
+def test_json_columns_sent_as_text_are_decoded():
+    row = _row()
+    for column in ("user_row", "preferences_row", "bikriti_row", "history_rows", "session_rows", "recent_rows"):
+        row[column] = json.dumps(row[column])
+    context = asyncio.run(load_checkin_context(_Db(row), USER_ID, SESSION_ID))
+    assert context.preferences.nickname == "Asha"
+    assert len(context.session_messages) == 2
+
+
+def test_foreign_session_has_no_messages(caches):
+    _, transcripts = caches
+    row = _row(session_found=False, session_rows=None)
+    context = asyncio.run(load_checkin_context(_Db(row), USER_ID, SESSION_ID))
+    assert not context.session_found
+    assert context.session_messages == []
+    assert transcripts.get(SESSION_ID) is None
+
+
+def test_unknown_user_gets_defaults():
+    row = _row(user_row=None, preferences_row=None, prakriti=None, bikriti_row=None, history_rows=None)
+    context = asyncio.run(load_checkin_context(_Db(row), USER_ID, SESSION_ID))
+    assert context.user is None
+    assert context.dosha_type_name == "vata"
+    assert context.dosha_context["bikriti"] is None
+    assert context.dosha_context["history"] == {"today": None, "yesterday": None}
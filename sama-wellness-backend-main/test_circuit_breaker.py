@@ -0,0 +1,110 @@
+# test_circuit_breaker.py
+"""
+Tests for the per-provider LLM circuit breaker state machine
+"""
+
+from app.services.circuit_breaker import CircuitBreaker
+
+
+def _breaker(**overrides) -> CircuitBreaker:
+    options = dict(
+        window_size=10,
+        min_calls=4,
+        error_rate_threshold=0.5,
+        slow_call_ms=1000,
+        slow_call_rate_threshold=0.8,
+        cooldown_seconds=0
+    )
+    options.update(overrides)
+    return CircuitBreaker("test", **options)
+
+
+def _open(breaker: CircuitBreaker):
+    for _ in range(breaker.min_calls):
+        breaker.record_failure(10)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_stays_closed_below_min_calls():
+    breaker = _breaker()
+    for _ in range(breaker.min_calls - 1):
+        breaker.record_failure(10)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_opens_on_error_rate():
+    breaker = _breaker()
+    breaker.record_success(10)
+    breaker.record_success(10)
+    breaker.record_failure(10)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure(10)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_opens_on_slow_call_rate():
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.record_success(5000)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_open_rejects_until_cooldown():
+    breaker = _breaker(cooldown_seconds=3600)
+    _open(breaker)
+    assert not breaker.allow_request()
+    assert not breaker.allow_request()
+    assert breaker.rejected_calls == 2
+
+
+def test_half_open_allows_one_probe():
+    breaker = _breaker()
+    _open(breaker)
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()
+
+
+def test_probe_success_closes():
+    breaker = _breaker()
+    _open(breaker)
+    assert breaker.allow_request()
+    breaker.record_success(10)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.snapshot()["window_calls"] == 0
+
+
+def test_probe_failure_reopens():
+    breaker = _breaker()
+    _open(breaker)
+    assert breaker.allow_request()
+    breaker.cooldown_seconds = 3600
+    breaker.record_failure(10)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+
+def test_release_probe_lets_another_probe_through():
+    breaker = _breaker()
+    _open(breaker)
+    assert breaker.allow_request()
+    breaker.release_probe()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_release_probe_is_a_no_op_when_closed():
+    breaker = _breaker()
+    breaker.release_probe()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_latency_percentile():
+    breaker = _breaker()
+    assert breaker.latency_percentile(0.5) is None
+    for latency in range(1, 11):
+        breaker.record_success(latency * 10)
+    assert breaker.latency_percentile(0.5) == 50
+    assert breaker.latency_percentile(0.95) == 100
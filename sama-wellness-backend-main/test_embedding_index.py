@@ -0,0 +1,79 @@
+# test_embedding_index.py
+"""
+Tests for EmbeddingIndex.search_vector: cosine top-k, dosha/emotion filters
+and filling the page from unfiltered rows
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.services.embedding_index import EmbeddingIndex  # noqa: E402
+
+
+def _index(rows: list, doshas: list, emotions: list, min_score: float = 0.25) -> EmbeddingIndex:
+    """Index over the given row vectors (normalised here), without loading a file or encoder"""
+    matrix = np.array(rows, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    index = EmbeddingIndex("unused.npy", "test-model", min_score=min_score)
+    index._matrix = matrix
+    index._knowledge_ids = [f"k{row}" for row in range(len(rows))]
+    index._dosha_masks = EmbeddingIndex._build_masks(doshas, len(rows))
+    index._emotion_masks = EmbeddingIndex._build_masks(emotions, len(rows))
+    index.ready = True
+    return index
+
+
+def _query(*values) -> "np.ndarray":
+    query = np.array(values, dtype=np.float32)
+    return query / np.linalg.norm(query)
+
+
+ROWS = [
+    [1.0, 0.0, 0.0],   # k0: closest to the query
+    [0.9, 0.1, 0.0],   # k1
+    [0.7, 0.7, 0.0],   # k2
+    [0.0, 1.0, 0.0],   # k3: orthogonal, below min_score
+    [0.5, 0.0, 0.9],   # k4
+]
+DOSHAS = [["Vata"], ["Pitta"], ["Kapha"], ["Pitta"], ["Kapha", "Pitta"]]
+EMOTIONS = [["anxiety"], [], ["anxiety"], ["sadness"], ["Sadness"]]
+
+
+def test_unfiltered_top_k_by_cosine():
+    index = _index(ROWS, DOSHAS, EMOTIONS)
+    assert index.search_vector(_query(1, 0, 0), limit=3) == ["k0", "k1", "k2"]
+
+
+def test_rows_below_min_score_are_never_returned():
+    index = _index(ROWS, DOSHAS, EMOTIONS)
+    assert "k3" not in index.search_vector(_query(1, 0, 0), limit=5)
+
+
+def test_filtered_rows_come_first_then_fill():
+    index = _index(ROWS, DOSHAS, EMOTIONS)
+    # Kapha rows (k2, k4) first by score, then the best remaining rows
+    assert index.search_vector(_query(1, 0, 0), limit=3, dosha="Kapha") == ["k2", "k4", "k0"]
+
+
+def test_combined_dosha_matches_either():
+    index = _index(ROWS, DOSHAS, EMOTIONS)
+    assert index.search_vector(_query(1, 0, 0), limit=2, dosha="Vata-Kapha") == ["k0", "k2"]
+
+
+def test_dosha_and_emotion_filters_intersect():
+    index = _index(ROWS, DOSHAS, EMOTIONS)
+    assert index.search_vector(_query(1, 0, 0), limit=1, dosha="pitta", emotion=" SADNESS ") == ["k4"]
+
+
+def test_unknown_filter_values_are_ignored():
+    index = _index(ROWS, DOSHAS, EMOTIONS)
+    assert index.search_vector(_query(1, 0, 0), limit=2, dosha="Unknown", emotion="joy") == ["k0", "k1"]
+
+
+def test_filtered_rows_below_min_score_are_skipped_before_fill():
+    index = _index(ROWS, DOSHAS, EMOTIONS)
+    # Both sadness rows match the filter, but k3 is below min_score
+    results = index.search_vector(_query(1, 0, 0), limit=2, emotion="sadness")
+    assert results == ["k4", "k0"]
+    assert index.snapshot()["searches"] == 1
@@ -0,0 +1,162 @@
+# test_emotion_embedding.py
+"""
+Tests for reusing the emotion detector's BERT pass as the knowledge encoder:
+the encoder wrapper, analysis returning the embedding, and a check-in turn
+searching with that embedding instead of encoding the text again
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import app.api.daily_checkin as daily_checkin  # noqa: E402
+import app.services.emotion_service as emotion_service  # noqa: E402
+from app.services.embedding_index import EMOTION_ENCODER_MODEL, EmbeddingIndex, load_encoder  # noqa: E402
+from app.services.emotion_service import EmotionAnalysisService  # noqa: E402
+from app.services.timing import StageTimer  # noqa: E402
+
+EMBEDDING = np.array([0.6, 0.8], dtype=np.float32)
+
+
+class _Detector:
+    """Stands in for BERTEmotionDetector: remembers what it was asked"""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed(self, texts, batch_size=32):
+        self.calls.append(("embed", list(texts), batch_size))
+        return np.tile(EMBEDDING, (len(texts), 1))
+
+    def predict_with_dosha(self, text, return_embedding=False):
+        self.calls.append(("predict", text, return_embedding))
+        result = {"text": text, "primary_emotion": "anxiety", "emotion_confidence": 0.9, "dosha": "Vata"}
+        if return_embedding:
+            result["embedding"] = EMBEDDING
+        return result
+
+
+def test_encoder_wraps_the_detector(monkeypatch):
+    detector = _Detector()
+    monkeypatch.setattr(emotion_service, "get_emotion_service", lambda: SimpleNamespace(detector=detector))
+    encoder = load_encoder(EMOTION_ENCODER_MODEL)
+
+    assert encoder.encode("one text").tolist() == EMBEDDING.tolist()
+    assert encoder.encode(["a", "b", "c"], batch_size=2).shape == (3, 2)
+    assert detector.calls == [("embed", ["one text"], 32), ("embed", ["a", "b", "c"], 2)]
+
+
+def test_encoder_needs_a_loaded_detector(monkeypatch):
+    monkeypatch.setattr(emotion_service, "get_emotion_service", lambda: SimpleNamespace(detector=None))
+    with pytest.raises(RuntimeError):
+        load_encoder(EMOTION_ENCODER_MODEL)
+
+
+def test_index_knows_its_encoder():
+    assert EmbeddingIndex("unused.npy", EMOTION_ENCODER_MODEL).uses_emotion_encoder
+    assert not EmbeddingIndex("unused.npy", "all-MiniLM-L6-v2").uses_emotion_encoder
+
+
+@pytest.mark.parametrize("return_embedding", [True, False])
+def test_analysis_asks_for_the_embedding(return_embedding):
+    service = EmotionAnalysisService.__new__(EmotionAnalysisService)
+    service.detector = _Detector()
+
+    result = service.analyze_emotion("I feel restless", return_embedding=return_embedding)
+    assert service.detector.calls == [("predict", "I feel restless", return_embedding)]
+    assert ("embedding" in result) is return_embedding
+
+
+class _EmbeddingIndex:
+    ready = True
+    uses_emotion_encoder = True
+
+    def __init__(self):
+        self.searches = []
+
+    def search_vector(self, query, dosha=None, emotion=None):
+        self.searches.append((query, dosha, emotion))
+        return ["k1"]
+
+    def search(self, *args, **kwargs):
+        raise AssertionError("the text must not be encoded again")
+
+
+@pytest.fixture
+def turn(monkeypatch):
+    """Embedding backend with the emotion encoder; returns (index, analysis calls)"""
+    index = _EmbeddingIndex()
+    calls = []
+
+    def analyze_emotion(text, return_embedding=False):
+        calls.append(return_embedding)
+        return _Detector().predict_with_dosha(text, return_embedding)
+
+    async def entries(knowledge_ids):
+        return [f"entry {knowledge_id}" for knowledge_id in knowledge_ids]
+
+    monkeypatch.setattr(daily_checkin.settings, "KNOWLEDGE_RETRIEVAL_BACKEND", "embedding")
+    monkeypatch.setattr(daily_checkin, "get_embedding_index", lambda: index)
+    monkeypatch.setattr(daily_checkin, "get_emotion_service", lambda: SimpleNamespace(analyze_emotion=analyze_emotion))
+    monkeypatch.setattr(daily_checkin, "_knowledge_entries", entries)
+    monkeypatch.setattr(daily_checkin, "_cached_prakriti", lambda user_id: "Vata")
+    return index, calls
+
+
+def test_turn_searches_with_the_analysis_embedding(turn):
+    index, calls = turn
+
+    async def scenario():
+        emotion_task, knowledge_task = daily_checkin._start_turn_analysis("I feel restless", "u1", StageTimer())
+        return await emotion_task, await knowledge_task
+
+    emotion, knowledge = asyncio.run(scenario())
+    assert calls == [True]
+    assert knowledge == ["entry k1"]
+    query, dosha, detected = index.searches[0]
+    assert query is EMBEDDING
+    assert (dosha, detected) == ("Vata", "anxiety")
+    # The array doesn't travel on with the emotion result
+    assert "embedding" not in emotion
+
+
+def test_fallback_detection_uses_full_text_search(turn, monkeypatch):
+    index, _ = turn
+
+    async def emotion_without_embedding():
+        return {"primary_emotion": "neutral"}
+
+    async def relevant_knowledge(text, user_id=None):
+        return ["fts"]
+
+    monkeypatch.setattr(daily_checkin, "_fetch_relevant_knowledge", relevant_knowledge)
+
+    async def scenario():
+        emotion_task = asyncio.create_task(emotion_without_embedding())
+        return await daily_checkin._knowledge_from_emotion_embedding("hi", "u1", emotion_task)
+
+    assert asyncio.run(scenario()) == ["fts"]
+    assert index.searches == []
+
+
+def test_cancelling_retrieval_keeps_the_analysis(turn):
+    async def scenario():
+        analysis = asyncio.Event()
+
+        async def slow_emotion():
+            await analysis.wait()
+            return {"primary_emotion": "anxiety", "embedding": EMBEDDING}
+
+        emotion_task = asyncio.create_task(slow_emotion())
+        knowledge_task = asyncio.create_task(
+            daily_checkin._knowledge_from_emotion_embedding("hi", "u1", emotion_task)
+        )
+        await asyncio.sleep(0)
+        knowledge_task.cancel()
+        analysis.set()
+        return await emotion_task
+
+    assert asyncio.run(scenario())["primary_emotion"] == "anxiety"
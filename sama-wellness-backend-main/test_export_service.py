@@ -0,0 +1,155 @@
+# test_export_service.py
+"""
+Tests for the gzip NDJSON history export: record order and encoding,
+chunked server-side reads, and every chunk decodable as soon as it is sent
+"""
+
+import asyncio
+import gzip
+import json
+import uuid
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+import app.services.export_service as export_service
+from app.services.export_service import EXPORT_FORMAT_VERSION, stream_user_export
+
+USER_ID = "7b0c8a4e-0d7f-4f8e-9d8c-3f0c1f7e2a11"
+
+
+class _Query:
+    """Stands in for select(...): records the yield_per option"""
+
+    def __init__(self, queries: list):
+        self.options = {}
+        queries.append(self)
+
+    def where(self, *criteria):
+        return self
+
+    def order_by(self, *columns):
+        return self
+
+    def execution_options(self, **options):
+        self.options.update(options)
+        return self
+
+
+def _model(name: str):
+    table = SimpleNamespace(
+        name=name,
+        columns=[],
+        c=SimpleNamespace(user_id=SimpleNamespace(__eq__=lambda self, other: True)),
+        primary_key=SimpleNamespace(columns=[])
+    )
+    return SimpleNamespace(__table__=table)
+
+
+class _Stream:
+    def __init__(self, rows: list, chunk_rows: int):
+        self.rows = rows
+        self.chunk_rows = chunk_rows
+
+    def mappings(self):
+        return self
+
+    async def partitions(self):
+        for start in range(0, len(self.rows), self.chunk_rows):
+            yield self.rows[start:start + self.chunk_rows]
+
+
+class _Session:
+    def __init__(self, rows_by_query: list, queries: list):
+        self.rows_by_query = rows_by_query
+        self.queries = queries
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def stream(self, query):
+        rows = self.rows_by_query[len(self.queries) - 1]
+        return _Stream(rows, query.options["yield_per"])
+
+
+SESSION_ID = uuid.UUID("1d6f3c2a-5b4e-4a3d-8c2b-9e1f0a7d6c55")
+
+ROWS = [
+    [{"session_id": SESSION_ID, "start_time": datetime(2026, 10, 18, 9, 0)}],
+    [
+        {"message_id": f"m{n}", "session_id": SESSION_ID, "transcript_text": f"message {n} — ok"}
+        for n in range(1, 6)
+    ],
+    [{"message_id": "m1", "emotion_confidence": Decimal("0.87")}],
+    [{"date": date(2026, 10, 18), "dominant_imbalance": "vata"}],
+]
+
+
+@pytest.fixture
+def queries(monkeypatch) -> list:
+    queries = []
+    monkeypatch.setattr(export_service, "EXPORT_TABLES", tuple(
+        (record_type, _model(record_type), None)
+        for record_type in ("session", "message", "emotion_analysis", "dosha_tracking")
+    ))
+    monkeypatch.setattr(export_service, "select", lambda *columns: _Query(queries))
+    monkeypatch.setattr(export_service, "AsyncSessionLocal", lambda: _Session(ROWS, queries))
+    return queries
+
+
+async def _collect(stream) -> list:
+    return [chunk async for chunk in stream]
+
+
+def test_export_is_gzip_ndjson_in_table_order(queries):
+    chunks = asyncio.run(_collect(stream_user_export(USER_ID, chunk_rows=2)))
+    lines = [json.loads(line) for line in gzip.decompress(b"".join(chunks)).decode().splitlines()]
+
+    header = lines[0]
+    assert header["type"] == "export"
+    assert header["format_version"] == EXPORT_FORMAT_VERSION
+    assert header["user_id"] == USER_ID
+    assert [line["type"] for line in lines[1:]] == (
+        ["session"] + ["message"] * 5 + ["emotion_analysis", "dosha_tracking"]
+    )
+    assert lines[1]["session_id"] == str(SESSION_ID)
+    assert lines[1]["start_time"] == "2026-10-18T09:00:00"
+    assert lines[2]["transcript_text"] == "message 1 — ok"
+    assert lines[7]["emotion_confidence"] == "0.87"
+    assert lines[8]["date"] == "2026-10-18"
+
+
+def test_rows_are_read_in_chunks(queries):
+    chunks = asyncio.run(_collect(stream_user_export(USER_ID, chunk_rows=2)))
+    assert [query.options["yield_per"] for query in queries] == [2, 2, 2, 2]
+    # Header, 1 session chunk, 3 message chunks, 1 + 1 chunks, then the gzip trailer
+    assert len(chunks) == 8
+
+
+def test_each_chunk_decodes_as_it_arrives(queries):
+    decompressor = zlib.decompressobj(export_service.GZIP_WBITS)
+
+    async def scenario():
+        received = []
+        async for chunk in stream_user_export(USER_ID, chunk_rows=2):
+            text = decompressor.decompress(chunk).decode()
+            if text:
+                # Sync-flushed: every chunk ends on a complete line
+                assert text.endswith("\n")
+                received.append(text)
+        return received
+
+    received = asyncio.run(scenario())
+    assert json.loads(received[0])["type"] == "export"
+    assert decompressor.eof
+
+
+def test_unknown_values_are_not_serialized():
+    with pytest.raises(TypeError):
+        export_service._json_default(object())
@@ -0,0 +1,158 @@
+# test_fast_path.py
+"""
+Tests for the trivial-turn classifier, template replies and the crisis
+guard that keeps trivial turns in a crisis session on the full pipeline
+"""
+
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import app.api.daily_checkin as daily_checkin
+from app.api.daily_checkin import _WebSocketCheckin, _crisis_in_session
+from app.services.fast_path import (
+    ACKNOWLEDGEMENT,
+    CLOSING,
+    GREETING,
+    build_fast_reply,
+    classify_trivial_turn,
+)
+
+
+@pytest.mark.parametrize("text, kind", [
+    ("hi", GREETING),
+    ("Hello Sama!", GREETING),
+    ("good morning", GREETING),
+    ("hey there", GREETING),
+    ("thanks", ACKNOWLEDGEMENT),
+    ("Thank you so much!!", ACKNOWLEDGEMENT),
+    ("ok", ACKNOWLEDGEMENT),
+    ("got it, thanks", ACKNOWLEDGEMENT),
+    ("bye", CLOSING),
+    ("good night sama", CLOSING),
+    ("thanks, bye", CLOSING),
+    ("ok bye then", CLOSING),
+    ("hi and thanks", ACKNOWLEDGEMENT),
+])
+def test_classifies_trivial_turns(text, kind):
+    assert classify_trivial_turn(text) == kind
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "hi, I feel really anxious today",
+    "ok but I can't sleep",
+    "not ok",
+    "good",
+    "sama",
+    "thanks " * 10,
+])
+def test_leaves_real_turns_to_the_pipeline(text):
+    assert classify_trivial_turn(text) is None
+
+
+def test_greeting_reply_uses_time_of_day_and_nickname():
+    reply = build_fast_reply(GREETING, nickname="Asha", now=datetime(2026, 10, 19, 8, 0))
+    assert "Asha" in reply
+    assert "morning" in reply
+
+
+def test_night_greeting_does_not_say_good_night():
+    reply = build_fast_reply(GREETING, nickname="Asha", now=datetime(2026, 10, 19, 23, 0))
+    assert "night" not in reply
+    assert "evening" in reply
+
+
+def test_closing_reply_includes_dosha_tip():
+    reply = build_fast_reply(CLOSING, dosha="Pitta", now=datetime(2026, 10, 19, 14, 0))
+    assert "friend" in reply
+    assert "Keep cool and go easy on yourself this afternoon." in reply
+
+
+def test_closing_reply_without_dosha_uses_default_tip():
+    reply = build_fast_reply(CLOSING, now=datetime(2026, 10, 19, 19, 0))
+    assert "Be gentle with yourself this evening." in reply
+
+
+def _message(text):
+    return SimpleNamespace(transcript_text=text, ai_response_text="reply")
+
+
+def test_crisis_in_session_checks_recent_user_messages():
+    assert _crisis_in_session([_message("I feel hopeless"), _message("hi")])
+    assert not _crisis_in_session([_message("slept well"), _message(None)])
+    assert not _crisis_in_session([])
+
+
+def test_crisis_outside_lookback_is_ignored(monkeypatch):
+    monkeypatch.setattr(daily_checkin.settings, "FAST_PATH_CRISIS_LOOKBACK_MESSAGES", 2)
+    messages = [_message("I feel worthless"), _message("went for a walk"), _message("ok")]
+    assert not _crisis_in_session(messages)
+
+
+class _WebSocket:
+    url = SimpleNamespace(path="/api/checkin/ws")
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, payload):
+        self.sent.append(payload)
+
+
+class _Session:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def _ws_turn(monkeypatch, history, text):
+    """Run one WebSocket turn; returns the prompts sent to the LLM and the reply"""
+    prompts = []
+
+    async def stream_llm_response(messages, **kwargs):
+        prompts.append(messages[0]["content"])
+        yield "I'm here with you."
+
+    async def await_knowledge(*args):
+        return []
+
+    async def save_checkin_turn(**kwargs):
+        return []
+
+    def start_turn_analysis(*args):
+        done = asyncio.get_running_loop().create_future()
+        done.set_result(None)
+        return done, None
+
+    monkeypatch.setattr(daily_checkin, "stream_llm_response", stream_llm_response)
+    monkeypatch.setattr(daily_checkin, "_await_knowledge", await_knowledge)
+    monkeypatch.setattr(daily_checkin, "_start_turn_analysis", start_turn_analysis)
+    monkeypatch.setattr(daily_checkin, "build_checkin_prompt", lambda **kwargs: kwargs["user_text"])
+    monkeypatch.setattr(daily_checkin, "save_checkin_turn", save_checkin_turn)
+    monkeypatch.setattr(daily_checkin, "_turn_jobs", lambda *args: [])
+    monkeypatch.setattr(daily_checkin, "AsyncSessionLocal", _Session)
+
+    state = _WebSocketCheckin(
+        user_id="u1", session_id="s1", user=None, preferences=None,
+        dosha_type_name="Vata", dosha_context={}, history=history
+    )
+    websocket = _WebSocket()
+    asyncio.run(daily_checkin._ws_turn(websocket, state, text))
+    return prompts, websocket.sent[-1]["message"]
+
+
+def test_trivial_ws_turn_takes_fast_path(monkeypatch):
+    prompts, reply = _ws_turn(monkeypatch, [_message("slept well")], "ok")
+    assert prompts == []
+    assert "friend" in reply
+
+
+def test_trivial_ws_turn_after_crisis_message_reaches_llm(monkeypatch):
+    prompts, reply = _ws_turn(monkeypatch, [_message("I can't go on like this")], "ok")
+    assert prompts == ["ok"]
+    assert reply == "I'm here with you."
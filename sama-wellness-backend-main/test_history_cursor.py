@@ -0,0 +1,39 @@
+# test_history_cursor.py
+"""
+Tests for the opaque (created_at, id) keyset cursor used by /history
+"""
+
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.daily_checkin import _decode_keyset_cursor, _encode_keyset_cursor
+
+
+def test_cursor_round_trips():
+    timestamp = datetime(2026, 10, 19, 8, 30, 15, 123456, tzinfo=timezone.utc)
+    row_id = uuid.uuid4()
+    cursor = _encode_keyset_cursor(timestamp, row_id)
+    assert "=" not in cursor
+    assert _decode_keyset_cursor(cursor) == (timestamp, row_id)
+
+
+def test_cursor_round_trips_naive_timestamp():
+    timestamp = datetime(2026, 1, 2, 3, 4, 5)
+    row_id = uuid.uuid4()
+    assert _decode_keyset_cursor(_encode_keyset_cursor(timestamp, row_id)) == (timestamp, row_id)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not a cursor",
+    "bm90LWEtZGF0ZXxub3QtYS11dWlk",  # "not-a-date|not-a-uuid"
+    "MjAyNi0xMC0xOQ",                # "2026-10-19" (no id)
+    "__8",                           # not UTF-8
+])
+def test_foreign_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        _decode_keyset_cursor(cursor)
+    assert error.value.status_code == 400
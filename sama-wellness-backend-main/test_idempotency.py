@@ -0,0 +1,329 @@
+# test_idempotency.py
+"""
+Tests for Idempotency-Key handling: joins on one replica, waits and replays
+across replicas (two stores sharing one key table), conflicts, failures and
+lease takeover. The idempotency_keys table is replaced by an in-memory one
+that applies the store's statements, so no database is needed.
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+import app.services.idempotency as idempotency
+from app.services.idempotency import (
+    CLAIM_KEY_SQL,
+    COMPLETE_KEY_SQL,
+    GET_KEY_SQL,
+    PURGE_KEYS_SQL,
+    RELEASE_KEY_SQL,
+    IdempotencyConflict,
+    IdempotencyInProgress,
+    IdempotencyStore,
+    KeyCompletion,
+    complete_key,
+    request_fingerprint,
+)
+
+
+class _Result:
+    def __init__(self, row=None):
+        self.row = row
+
+    def first(self):
+        return self.row
+
+    def mappings(self):
+        return self
+
+
+class _KeyTable:
+    """idempotency_keys rows; time is time.monotonic() seconds"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def execute(self, statement, params):
+        now = time.monotonic()
+        if statement is PURGE_KEYS_SQL:
+            self.rows = {k: row for k, row in self.rows.items() if row["expires_at"] >= now}
+            return _Result()
+        row_key = (params["scope"], params["user_id"], params["key"])
+        row = self.rows.get(row_key)
+        if statement is CLAIM_KEY_SQL:
+            free = (
+                row is None
+                or row["expires_at"] < now
+                or (row["status"] == "pending" and row["locked_until"] < now
+                    and row["request_fingerprint"] == params["fingerprint"])
+            )
+            if not free:
+                return _Result()
+            self.rows[row_key] = {
+                "request_fingerprint": params["fingerprint"],
+                "status": "pending",
+                "response": None,
+                "locked_until": now + params["lease_seconds"],
+                "expires_at": now + params["ttl_seconds"]
+            }
+            return _Result((params["key"],))
+        if statement is GET_KEY_SQL:
+            if row is None or row["expires_at"] < now:
+                return _Result()
+            return _Result({name: row[name] for name in ("request_fingerprint", "status", "response")})
+        if statement is COMPLETE_KEY_SQL:
+            if row is not None and row["status"] == "pending":
+                row.update(status="completed", response=params["response"], locked_until=None)
+            return _Result()
+        if statement is RELEASE_KEY_SQL:
+            if row is not None and row["status"] == "pending":
+                del self.rows[row_key]
+            return _Result()
+        raise AssertionError(f"unexpected statement {statement}")
+
+
+class _Session:
+    def __init__(self, table: _KeyTable):
+        self.table = table
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, params=None):
+        return self.table.execute(statement, params or {})
+
+    async def commit(self):
+        pass
+
+
+@pytest.fixture
+def table(monkeypatch) -> _KeyTable:
+    table = _KeyTable()
+    monkeypatch.setattr(idempotency, "AsyncSessionLocal", lambda: _Session(table))
+    return table
+
+
+def _store(**overrides) -> IdempotencyStore:
+    options = dict(scope="checkin", lease_seconds=60, wait_seconds=1, poll_seconds=0.01)
+    options.update(overrides)
+    return IdempotencyStore(**options)
+
+
+def test_fingerprint_ignores_key_order():
+    assert request_fingerprint({"a": 1, "b": 2}) == request_fingerprint({"b": 2, "a": 1})
+    assert request_fingerprint({"a": 1}) != request_fingerprint({"a": 2})
+
+
+def test_concurrent_retry_on_same_replica_joins(table):
+    async def scenario():
+        store = _store()
+        release = asyncio.Event()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await release.wait()
+            return {"reply": "hello"}
+
+        first = asyncio.create_task(store.run("u1", "key", "fp", work))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(store.run("u1", "key", "fp", work))
+        await asyncio.sleep(0.01)
+        release.set()
+        return await first, await second, calls, store.snapshot()
+
+    first, second, calls, snapshot = asyncio.run(scenario())
+    assert first == ({"reply": "hello"}, False)
+    assert second == ({"reply": "hello"}, True)
+    assert calls == [1]
+    assert snapshot["executed"] == 1
+    assert snapshot["joined"] == 1
+    assert table.rows[("checkin", "u1", "key")]["status"] == "completed"
+
+
+def test_retry_on_other_replica_waits_then_replays(table):
+    async def scenario():
+        replica_a, replica_b = _store(), _store()
+        release = asyncio.Event()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await release.wait()
+            return {"reply": "hello"}
+
+        first = asyncio.create_task(replica_a.run("u1", "key", "fp", work))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(replica_b.run("u1", "key", "fp", work))
+        await asyncio.sleep(0.05)
+        assert not second.done()
+        release.set()
+        return await first, await second, calls, replica_b.snapshot()
+
+    first, second, calls, snapshot = asyncio.run(scenario())
+    assert first == ({"reply": "hello"}, False)
+    assert second == ({"reply": "hello"}, True)
+    assert calls == [1]
+    assert snapshot["waited"] == 1
+    assert snapshot["replayed"] == 1
+    assert snapshot["executed"] == 0
+
+
+def test_later_retry_replays_stored_response(table):
+    async def scenario():
+        calls = []
+
+        async def work():
+            calls.append(1)
+            return {"reply": "hello"}
+
+        first = await _store().run("u1", "key", "fp", work)
+        second = await _store().run("u1", "key", "fp", work, decode=lambda response: response["reply"])
+        return first, second, calls
+
+    first, second, calls = asyncio.run(scenario())
+    assert first == ({"reply": "hello"}, False)
+    assert second == ("hello", True)
+    assert calls == [1]
+
+
+def test_response_completed_in_the_work_transaction_is_kept(table):
+    async def scenario():
+        async def work():
+            # What save_checkin_turn does in the turn's transaction
+            async with idempotency.AsyncSessionLocal() as db:
+                await complete_key(db, KeyCompletion("checkin", "u1", "key", {"reply": "stored"}))
+            return {"reply": "returned"}
+
+        await _store().run("u1", "key", "fp", work)
+        return await _store().run("u1", "key", "fp", work)
+
+    assert asyncio.run(scenario()) == ({"reply": "stored"}, True)
+
+
+def test_key_reused_with_other_body_conflicts(table):
+    async def scenario():
+        async def work():
+            return "reply"
+
+        await _store().run("u1", "key", "fp-1", work)
+        store = _store()
+        with pytest.raises(IdempotencyConflict):
+            await store.run("u1", "key", "fp-2", work)
+        return store.snapshot()
+
+    assert asyncio.run(scenario())["conflicts"] == 1
+
+
+def test_keys_are_per_user_and_scope(table):
+    async def scenario():
+        calls = []
+
+        async def work():
+            calls.append(1)
+            return len(calls)
+
+        results = [
+            await _store().run("u1", "key", "fp", work),
+            await _store().run("u2", "key", "fp", work),
+            await _store(scope="voice").run("u1", "key", "fp", work),
+        ]
+        return results
+
+    assert asyncio.run(scenario()) == [(1, False), (2, False), (3, False)]
+
+
+def test_failure_is_not_stored(table):
+    async def scenario():
+        store = _store()
+        attempts = []
+
+        async def work():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError("provider down")
+            return "reply"
+
+        with pytest.raises(RuntimeError):
+            await store.run("u1", "key", "fp", work)
+        assert table.rows == {}
+        return await store.run("u1", "key", "fp", work), attempts
+
+    result, attempts = asyncio.run(scenario())
+    assert result == ("reply", False)
+    assert len(attempts) == 2
+
+
+def test_retry_gives_up_while_original_still_running(table):
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return "reply"
+
+        first = asyncio.create_task(_store().run("u1", "key", "fp", slow))
+        await asyncio.sleep(0.01)
+        store = _store(wait_seconds=0.05)
+        with pytest.raises(IdempotencyInProgress):
+            await store.run("u1", "key", "fp", slow)
+        release.set()
+        await first
+        return store.snapshot()
+
+    assert asyncio.run(scenario())["timed_out"] == 1
+
+
+def test_expired_lease_is_taken_over(table):
+    async def scenario():
+        async def never():
+            await asyncio.Event().wait()
+
+        # Replica A claims the key with an already expired lease, then "dies"
+        crashed = asyncio.create_task(_store(lease_seconds=-1).run("u1", "key", "fp", never))
+        await asyncio.sleep(0.01)
+
+        async def work():
+            return "reply"
+
+        result = await _store().run("u1", "key", "fp", work)
+        crashed.cancel()
+        await asyncio.gather(crashed, return_exceptions=True)
+        return result
+
+    assert asyncio.run(scenario()) == ("reply", False)
+
+
+def test_work_survives_first_caller_cancelling(table):
+    async def scenario():
+        store = _store()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "reply"
+
+        first = asyncio.create_task(store.run("u1", "key", "fp", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        release.set()
+        return await store.run("u1", "key", "fp", work)
+
+    assert asyncio.run(scenario()) == ("reply", True)
+
+
+def test_stored_response_is_json(table):
+    async def scenario():
+        async def work():
+            return {"reply": "hello", "count": 2}
+
+        await _store().run("u1", "key", "fp", work)
+
+    asyncio.run(scenario())
+    assert json.loads(table.rows[("checkin", "u1", "key")]["response"]) == {"reply": "hello", "count": 2}
@@ -0,0 +1,124 @@
+# test_invalidation_bus.py
+"""
+Tests for cross-replica cache invalidation: NOTIFY payloads dispatched to
+per-table handlers, and caches reset whenever the listener (re)connects
+"""
+
+import asyncio
+import json
+
+import app.services.invalidation_bus as invalidation_bus
+from app.services.invalidation_bus import CHANNEL, InvalidationBus, publish_change
+
+
+def _notify(bus: InvalidationBus, payload):
+    bus._on_notify(None, 4242, CHANNEL, payload if isinstance(payload, str) else json.dumps(payload))
+
+
+def test_dispatches_to_handlers_of_the_changed_table():
+    bus = InvalidationBus("postgresql://test")
+    calls = []
+    bus.subscribe("users", lambda key: calls.append(("users", key)))
+    bus.subscribe("users", lambda key: calls.append(("users-2", key)))
+    bus.subscribe("user_preferences", lambda key: calls.append(("user_preferences", key)))
+
+    _notify(bus, {"table": "users", "op": "UPDATE", "key": "u1"})
+    assert calls == [("users", "u1"), ("users-2", "u1")]
+    assert bus.snapshot()["dispatched"] == 2
+
+
+def test_malformed_and_unknown_payloads_are_ignored():
+    bus = InvalidationBus("postgresql://test")
+    calls = []
+    bus.subscribe("users", calls.append)
+
+    _notify(bus, "not json")
+    _notify(bus, {"op": "UPDATE", "key": "u1"})
+    _notify(bus, {"table": "dosha_tracking", "key": "u1"})
+    assert calls == []
+    assert bus.snapshot()["received"] == 3
+
+
+def test_failing_handler_does_not_stop_the_others():
+    bus = InvalidationBus("postgresql://test")
+    calls = []
+
+    def broken(key):
+        raise RuntimeError("boom")
+
+    bus.subscribe("users", broken)
+    bus.subscribe("users", calls.append)
+    _notify(bus, {"table": "users", "key": "u1"})
+    assert calls == ["u1"]
+    assert bus.snapshot()["errors"] == 1
+
+
+class _Connection:
+    def __init__(self):
+        self.listeners = {}
+        self.termination_listeners = []
+        self.closed = False
+
+    def add_termination_listener(self, callback):
+        self.termination_listeners.append(callback)
+
+    async def add_listener(self, channel, callback):
+        self.listeners[channel] = callback
+
+    async def execute(self, query):
+        pass
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+    def terminate(self):
+        for callback in self.termination_listeners:
+            callback(self)
+
+
+def test_listener_resets_caches_on_every_connect(monkeypatch):
+    connections = []
+
+    async def connect(dsn, **kwargs):
+        connections.append(_Connection())
+        return connections[-1]
+
+    monkeypatch.setattr(invalidation_bus.asyncpg, "connect", connect)
+
+    async def scenario():
+        bus = InvalidationBus("postgresql://test", reconnect_seconds=0)
+        resets, calls = [], []
+        bus.subscribe("users", calls.append, on_reset=lambda: resets.append(1))
+        bus.start()
+        await asyncio.sleep(0.01)
+        connections[0].listeners[CHANNEL](connections[0], 1, CHANNEL, json.dumps({"table": "users", "key": "u1"}))
+        connections[0].terminate()  # Notifications sent now would be lost...
+        await asyncio.sleep(0.01)
+        await bus.stop()
+        return resets, calls, bus.snapshot()
+
+    resets, calls, snapshot = asyncio.run(scenario())
+    assert calls == ["u1"]
+    assert len(connections) == 2
+    assert resets == [1, 1]  # ...so the cache is cleared again on reconnect
+    assert snapshot["reconnects"] == 1
+    assert connections[0].closed
+
+
+class _Db:
+    def __init__(self):
+        self.calls = []
+
+    async def execute(self, statement, params=None):
+        self.calls.append(params)
+
+
+def test_publish_change_sends_notify_payload():
+    db = _Db()
+    asyncio.run(publish_change(db, "user_onboarding", 42))
+    (params,) = db.calls
+    assert params["channel"] == CHANNEL
+    assert json.loads(params["payload"]) == {"table": "user_onboarding", "op": "UPDATE", "key": "42"}
@@ -0,0 +1,120 @@
+# test_knowledge_catalog.py
+"""
+Tests for knowledge catalog parsing, prompt snippets and snapshot lookups
+"""
+
+import json
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.knowledge_catalog import (
+    KnowledgeCatalog,
+    KnowledgeEntry,
+    parse_instructions,
+    render_prompt_snippet,
+)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, ()),
+    ("", ()),
+    (["Sit comfortably", "  Breathe in  ", "", None], ("Sit comfortably", "Breathe in")),
+    ('["Warm the oil", "Massage gently"]', ("Warm the oil", "Massage gently")),
+    ("Avoid after meals", ("Avoid after meals",)),
+    (
+        [{"step": 2, "instruction": "Exhale"}, {"step": 1, "instruction": "Inhale"}],
+        ("Inhale", "Exhale"),
+    ),
+    (json.dumps([{"step": 1, "text": "Rest"}]), ("Rest",)),
+    ({"instruction": "Only one"}, ("Only one",)),
+    (42, ()),
+])
+def test_parse_instructions(value, expected):
+    assert parse_instructions(value) == expected
+
+
+def test_snippet_with_steps_and_precautions():
+    snippet = render_prompt_snippet(
+        "Nadi Shodhana",
+        "Alternate nostril breathing",
+        ("Sit upright", "Close the right nostril"),
+        ("Skip with a cold", "Stop if dizzy")
+    )
+    assert snippet == (
+        "- Nadi Shodhana: Alternate nostril breathing\n"
+        "  Steps: 1. Sit upright 2. Close the right nostril\n"
+        "  Precautions: Skip with a cold; Stop if dizzy\n"
+    )
+
+
+def test_snippet_without_details():
+    assert render_prompt_snippet("Ginger tea", None, (), ()) == "- Ginger tea: \n"
+
+
+def _row(title: str, updated_at: datetime = None, **fields) -> SimpleNamespace:
+    values = dict(
+        knowledge_id=uuid.uuid4(),
+        content_type="practice",
+        title=title,
+        description_short="Short",
+        description_detailed=None,
+        balances_doshas=["Vata"],
+        helps_with_emotions="anxiety",
+        not_recommended_for=None,
+        best_for_season=None,
+        best_time_of_day=None,
+        difficulty=None,
+        duration_minutes=None,
+        steps='["One", "Two"]',
+        precautions=None,
+        updated_at=updated_at
+    )
+    values.update(fields)
+    return SimpleNamespace(**values)
+
+
+def test_entry_from_row_parses_once():
+    entry = KnowledgeEntry.from_row(_row("Abhyanga"))
+    assert entry.steps == ("One", "Two")
+    assert entry.precautions == ()
+    assert entry.balances_doshas == ("Vata",)
+    assert entry.helps_with_emotions == ("anxiety",)
+    assert entry.not_recommended_for == ()
+    assert entry.prompt_snippet == "- Abhyanga: Short\n  Steps: 1. One 2. Two\n"
+
+
+def test_get_many_and_resolve():
+    catalog = KnowledgeCatalog()
+    stamp = datetime(2026, 10, 19, 8, 0)
+    known = _row("Abhyanga", updated_at=stamp)
+    entry = KnowledgeEntry.from_row(known)
+    catalog._publish({entry.knowledge_id: entry})
+    assert catalog.ready
+    assert catalog.current.version == 1
+
+    missing_id = str(uuid.uuid4())
+    found, missing = catalog.get_many([missing_id, known.knowledge_id])
+    assert found == [entry]
+    assert missing == [missing_id]
+
+    # Same updated_at: the cached entry; newer row or unknown row: parsed from the row
+    changed = _row("Abhyanga (new)", updated_at=datetime(2026, 10, 19, 9, 0), knowledge_id=known.knowledge_id)
+    resolved = catalog.resolve([known, changed, _row("Nasya")])
+    assert resolved[0] is entry
+    assert resolved[1].title == "Abhyanga (new)"
+    assert resolved[2].title == "Nasya"
+
+
+def test_publish_replaces_the_snapshot():
+    catalog = KnowledgeCatalog()
+    entry = KnowledgeEntry.from_row(_row("Abhyanga", updated_at=datetime(2026, 10, 19, 8, 0)))
+    catalog._publish({entry.knowledge_id: entry})
+    first = catalog.current
+    catalog._publish({})
+    assert first.entries == {entry.knowledge_id: entry}
+    assert catalog.current.version == 2
+    assert catalog.current.fingerprint == (0, None)
+    assert first.fingerprint == (1, datetime(2026, 10, 19, 8, 0))
@@ -0,0 +1,194 @@
+# test_knowledge_index.py
+"""
+Tests for the in-process BM25 knowledge index
+"""
+
+from datetime import datetime
+
+from app.services.knowledge_catalog import KnowledgeEntry, render_prompt_snippet
+from app.services.knowledge_index import KnowledgeIndex, stem, tokenize
+
+
+def _entry(knowledge_id: str, title: str, description_short: str = None, **fields) -> KnowledgeEntry:
+    values = dict(
+        knowledge_id=knowledge_id,
+        content_type="practice",
+        title=title,
+        description_short=description_short,
+        description_detailed=None,
+        balances_doshas=(),
+        helps_with_emotions=(),
+        not_recommended_for=(),
+        best_for_season=None,
+        best_time_of_day=None,
+        difficulty=None,
+        duration_minutes=None,
+        steps=(),
+        precautions=(),
+        updated_at=None,
+        prompt_snippet=render_prompt_snippet(title, description_short, (), ())
+    )
+    values.update(fields)
+    return KnowledgeEntry(**values)
+
+
+def _index(*entries: KnowledgeEntry, tags_by_id: dict = None) -> KnowledgeIndex:
+    index = KnowledgeIndex()
+    index.build(entries, tags_by_id or {})
+    return index
+
+
+def _ids(results) -> list:
+    return [entry.knowledge_id for entry in results]
+
+
+def test_stem_and_tokenize():
+    assert stem("stopping") == "stop"
+    assert stem("stress") == "stress"
+    assert stem("worries") == "worry"
+    assert tokenize("I am feeling really STRESSED today") == ["stress"]
+
+
+def test_title_match_outranks_description_match():
+    index = _index(
+        _entry("a", "Gentle evening routine", "Slow breathing before bed"),
+        _entry("b", "Breathing for stress"),
+        _entry("c", "Morning walk", "Brisk walk outdoors"),
+    )
+    assert _ids(index.search("breathing exercises")) == ["b", "a"]
+
+
+def test_rarer_term_weighs_more():
+    index = _index(
+        _entry("a", "Calm tea"),
+        _entry("b", "Calm breathing"),
+        _entry("c", "Calm walk"),
+    )
+    assert _ids(index.search("calm tea", limit=1)) == ["a"]
+
+
+def test_search_matches_stemmed_forms():
+    index = _index(_entry("a", "Sleep hygiene"), _entry("b", "Morning walk"))
+    assert _ids(index.search("I can't stop sleeping")) == ["a"]
+
+
+def test_limit_and_no_match():
+    index = _index(*(_entry(str(n), f"Breathing practice {n}") for n in range(5)))
+    assert len(index.search("breathing", limit=3)) == 3
+    assert index.search("astronomy") == []
+    assert index.search("the and of") == []
+
+
+def test_knowledge_tags_are_searchable():
+    index = _index(
+        _entry("a", "Abhyanga"),
+        _entry("b", "Nasya"),
+        tags_by_id={"a": [("emotion", "restlessness")]}
+    )
+    assert _ids(index.search("restless")) == ["a"]
+
+
+def test_remove_and_upsert():
+    index = _index(_entry("a", "Breathing for stress"), _entry("b", "Ginger tea"))
+    index.remove("a")
+    assert index.search("breathing") == []
+    index.upsert(_entry("b", "Tulsi tea"))
+    assert index.search("ginger") == []
+    assert _ids(index.search("tulsi")) == ["b"]
+    assert index.snapshot()["documents"] == 1
+
+
+# -- tag bitsets ---------------------------------------------------------------
+
+MORNING = datetime(2026, 10, 19, 8, 0)
+NIGHT = datetime(2026, 10, 19, 22, 0)
+
+
+def test_not_recommended_rows_are_filtered():
+    index = _index(
+        _entry("cold", "Cold shower", not_recommended_for=("anxiety",)),
+        _entry("warm", "Warm shower"),
+    )
+    assert _ids(index.search("shower", emotion="Anxiety", now=MORNING)) == ["warm"]
+    assert sorted(_ids(index.search("shower", now=MORNING))) == ["cold", "warm"]
+
+
+def test_time_of_day_filter_uses_given_time():
+    index = _index(
+        _entry("sunrise", "Sunrise yoga", best_time_of_day="morning"),
+        _entry("bedtime", "Bedtime yoga", best_time_of_day="night"),
+        _entry("chair", "Chair yoga", best_time_of_day="anytime"),
+    )
+    assert sorted(_ids(index.search("yoga", now=MORNING))) == ["chair", "sunrise"]
+    assert sorted(_ids(index.search("yoga", now=NIGHT))) == ["bedtime", "chair"]
+
+
+def test_content_type_filter():
+    index = _index(
+        _entry("recipe", "Ginger tea", content_type="food"),
+        _entry("practice", "Ginger compress", content_type="practice"),
+    )
+    assert _ids(index.search("ginger", content_types=["food"], now=MORNING)) == ["recipe"]
+
+
+def test_bikriti_reorders_equal_text_matches():
+    index = _index(
+        _entry("vata", "Calming tea", balances_doshas=("Vata",)),
+        _entry("pitta", "Calming tea", balances_doshas=("Pitta",)),
+    )
+    assert _ids(index.search("tea", bikriti="Pitta", now=MORNING)) == ["pitta", "vata"]
+    assert _ids(index.search("tea", bikriti="Vata", now=MORNING)) == ["vata", "pitta"]
+
+
+def test_combined_dosha_matches_either():
+    index = _index(
+        _entry("vata", "Oil massage", balances_doshas=("vata",)),
+        _entry("kapha", "Dry brushing", balances_doshas=("kapha",)),
+    )
+    assert _ids(index.search("unrelated", prakriti="Vata-Pitta", now=MORNING)) == ["vata"]
+
+
+def test_season_tag_uses_given_date():
+    index = _index(
+        _entry("summer", "Cooling tea", best_for_season="summer"),
+        _entry("autumn", "Cooling tea", best_for_season="autumn"),
+    )
+    assert _ids(index.search("tea", now=MORNING))[0] == "autumn"
+    assert _ids(index.search("tea", now=datetime(2026, 7, 1, 8, 0)))[0] == "summer"
+
+
+def test_tag_only_matches_fill_the_page():
+    index = _index(
+        _entry("tea", "Ginger tea"),
+        _entry("massage", "Abhyanga", helps_with_emotions=("anxiety",)),
+        _entry("walk", "Morning walk"),
+    )
+    assert _ids(index.search("tea", limit=2, emotion="anxiety", now=MORNING)) == ["tea", "massage"]
+    assert _ids(index.search("tea", limit=2, now=MORNING)) == ["tea"]
+
+
+def test_removed_slot_is_reused_without_its_tags():
+    index = _index(
+        _entry("a", "Abhyanga", helps_with_emotions=("anxiety",)),
+        _entry("b", "Nasya", helps_with_emotions=("sadness",)),
+    )
+    slot = index._slots["a"]
+    index.remove("a")
+    index.upsert(_entry("c", "Walking", helps_with_emotions=("grief",)))
+
+    assert index._slots["c"] == slot
+    assert index._free_slots == []
+    assert index._all_bits == 0b11
+    assert index.search("zzz", emotion="anxiety", now=MORNING) == []
+    assert _ids(index.search("zzz", emotion="grief", now=MORNING)) == ["c"]
+    assert _ids(index.search("zzz", emotion="sadness", now=MORNING)) == ["b"]
+
+
+def test_snapshot_counts_searches_with_emotion():
+    index = _index(_entry("a", "Abhyanga"))
+    index.search("oil", emotion="anxiety", now=MORNING)
+    index.search("oil", now=MORNING)
+    snapshot = index.snapshot()
+    assert snapshot["searches"] == 2
+    assert snapshot["searches_with_emotion"] == 1
+    assert snapshot["emotion_rate"] == 0.5
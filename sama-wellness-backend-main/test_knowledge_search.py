@@ -0,0 +1,113 @@
+# test_knowledge_search.py
+"""
+Tests for full-text knowledge search: the websearch query built from the
+user's words, and which retrieval backend a check-in turn uses
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import app.api.daily_checkin as daily_checkin
+import app.services.database_service as database_service
+from app.services.database_service import get_relevant_knowledge
+
+
+class _Query:
+    """Stands in for select(...): records the limit"""
+
+    def where(self, *criteria):
+        return self
+
+    def order_by(self, *columns):
+        return self
+
+    def limit(self, limit):
+        self.limit_value = limit
+        return self
+
+
+class _Result:
+    def scalars(self):
+        return self
+
+    def all(self):
+        return ["knowledge"]
+
+
+class _Db:
+    def __init__(self):
+        self.queries = []
+
+    async def execute(self, query):
+        self.queries.append(query)
+        return _Result()
+
+
+@pytest.fixture
+def tsqueries(monkeypatch) -> list:
+    """The text of every websearch_to_tsquery built"""
+    tsqueries = []
+
+    def websearch_to_tsquery(config, text):
+        assert config == "english"
+        tsqueries.append(text)
+        return text
+
+    monkeypatch.setattr(database_service, "func", SimpleNamespace(
+        websearch_to_tsquery=websearch_to_tsquery,
+        ts_rank_cd=lambda vector, query: query
+    ))
+    monkeypatch.setattr(database_service, "select", lambda *entities: _Query())
+    monkeypatch.setattr(database_service, "desc", lambda column: column)
+    return tsqueries
+
+
+def test_words_are_ored(tsqueries):
+    db = _Db()
+    items = asyncio.run(get_relevant_knowledge(db, "Can't SLEEP, feeling anxious!", limit=5))
+    assert items == ["knowledge"]
+    assert tsqueries == ["can or t or sleep or feeling or anxious"]
+    assert db.queries[0].limit_value == 5
+
+
+def test_or_is_not_a_search_word(tsqueries):
+    asyncio.run(get_relevant_knowledge(_Db(), "tea or coffee OR water"))
+    assert tsqueries == ["tea or coffee or water"]
+
+
+@pytest.mark.parametrize("text", ["", "  ?! ", "or OR"])
+def test_no_words_skips_the_query(tsqueries, text):
+    db = _Db()
+    assert asyncio.run(get_relevant_knowledge(db, text)) == []
+    assert db.queries == []
+    assert tsqueries == []
+
+
+class _Session:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+@pytest.mark.parametrize("backend, index_ready, source", [
+    ("postgres", True, "fts"),
+    ("memory", True, "memory"),
+    ("memory", False, "fts"),  # Index still building
+])
+def test_retrieval_backend(monkeypatch, backend, index_ready, source):
+    async def relevant_knowledge(db, text):
+        return ["fts"]
+
+    knowledge_index = SimpleNamespace(ready=index_ready, search=lambda text: ["memory"])
+    monkeypatch.setattr(daily_checkin.settings, "KNOWLEDGE_RETRIEVAL_BACKEND", backend)
+    monkeypatch.setattr(daily_checkin, "get_knowledge_index", lambda: knowledge_index)
+    monkeypatch.setattr(daily_checkin, "get_embedding_index", lambda: SimpleNamespace(ready=False))
+    monkeypatch.setattr(daily_checkin, "AsyncSessionLocal", _Session)
+    monkeypatch.setattr(daily_checkin, "get_relevant_knowledge", relevant_knowledge)
+    monkeypatch.setattr(daily_checkin, "get_knowledge_catalog", lambda: SimpleNamespace(resolve=list))
+
+    assert asyncio.run(daily_checkin._fetch_relevant_knowledge("can't sleep")) == [source]
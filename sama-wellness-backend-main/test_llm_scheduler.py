@@ -0,0 +1,257 @@
+# test_llm_scheduler.py
+"""
+Tests for LLM admission control: lane order, crisis headroom, shedding,
+releasing a half-open circuit probe when a call never leaves the queue,
+and hedged requests taking their own slot
+"""
+
+import asyncio
+
+import pytest
+
+import app.api.llm as llm_module
+from app.api.llm import LLMService, LLM_FALLBACK_RESPONSE
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.llm_scheduler import AdmissionRejected, LLMAdmissionScheduler, LLMPriority
+
+
+def _scheduler(**overrides) -> LLMAdmissionScheduler:
+    options = dict(
+        max_concurrency=1,
+        rate_per_second=0,  # concurrency limit only
+        burst=10,
+        crisis_reserved_slots=0,
+        max_queue=10,
+        background_max_queue=10
+    )
+    options.update(overrides)
+    return LLMAdmissionScheduler(**options)
+
+
+async def _settle():
+    """Let woken waiters run"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_waiters_admitted_highest_lane_first():
+    async def scenario():
+        scheduler = _scheduler()
+        await scheduler.acquire(LLMPriority.INTERACTIVE)
+        admitted = []
+
+        async def waiter(priority):
+            await scheduler.acquire(priority)
+            admitted.append(priority)
+
+        tasks = [
+            asyncio.create_task(waiter(priority))
+            for priority in (LLMPriority.BACKGROUND, LLMPriority.INTERACTIVE, LLMPriority.CRISIS)
+        ]
+        await _settle()
+        assert admitted == []
+        for _ in tasks:
+            scheduler.release()
+            await _settle()
+        await asyncio.gather(*tasks)
+        return admitted
+
+    assert asyncio.run(scenario()) == [LLMPriority.CRISIS, LLMPriority.INTERACTIVE, LLMPriority.BACKGROUND]
+
+
+def test_crisis_uses_reserved_slots():
+    async def scenario():
+        scheduler = _scheduler(crisis_reserved_slots=1)
+        await scheduler.acquire(LLMPriority.INTERACTIVE)
+        await asyncio.wait_for(scheduler.acquire(LLMPriority.CRISIS), timeout=1)
+        with pytest.raises(AdmissionRejected):
+            await scheduler.acquire(LLMPriority.CRISIS, timeout=0.01)
+        return scheduler.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot["in_flight"] == 2
+    assert snapshot["lanes"]["crisis"]["admitted"] == 1
+    assert snapshot["lanes"]["crisis"]["rejected"] == 1
+
+
+def test_full_queue_sheds_newest_background_waiter():
+    async def scenario():
+        scheduler = _scheduler(max_queue=2)
+        await scheduler.acquire(LLMPriority.INTERACTIVE)
+        oldest = asyncio.create_task(scheduler.acquire(LLMPriority.BACKGROUND))
+        newest = asyncio.create_task(scheduler.acquire(LLMPriority.BACKGROUND))
+        await _settle()
+
+        interactive = asyncio.create_task(scheduler.acquire(LLMPriority.INTERACTIVE))
+        await _settle()
+        with pytest.raises(AdmissionRejected):
+            await newest
+        assert not oldest.done()
+
+        # Nothing below the background lane to shed
+        with pytest.raises(AdmissionRejected):
+            await scheduler.acquire(LLMPriority.BACKGROUND)
+
+        scheduler.release()
+        await _settle()
+        assert interactive.done() and not oldest.done()
+        scheduler.release()
+        await _settle()
+        assert oldest.done()
+        return scheduler.snapshot()["lanes"]
+
+    lanes = asyncio.run(scenario())
+    assert lanes["background"]["shed"] == 1
+    assert lanes["background"]["rejected"] == 1
+    assert lanes["background"]["admitted"] == 1
+    assert lanes["interactive"]["admitted"] == 2
+
+
+def test_full_lane_rejects():
+    async def scenario():
+        scheduler = _scheduler(background_max_queue=1)
+        await scheduler.acquire(LLMPriority.INTERACTIVE)
+        queued = asyncio.create_task(scheduler.acquire(LLMPriority.BACKGROUND))
+        await _settle()
+        with pytest.raises(AdmissionRejected):
+            await scheduler.acquire(LLMPriority.BACKGROUND)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_after_grant_returns_slot():
+    async def scenario():
+        scheduler = _scheduler()
+        await scheduler.acquire(LLMPriority.INTERACTIVE)
+        waiter = asyncio.create_task(scheduler.acquire(LLMPriority.INTERACTIVE))
+        await _settle()
+        scheduler.release()  # grants the slot to the waiter...
+        waiter.cancel()      # ...which is cancelled before it resumes
+        await asyncio.gather(waiter, return_exceptions=True)
+        return scheduler.snapshot()["in_flight"]
+
+    assert asyncio.run(scenario()) == 0
+
+
+def _half_open_service(monkeypatch, scheduler: LLMAdmissionScheduler) -> LLMService:
+    breaker = CircuitBreaker("test", min_calls=1, cooldown_seconds=0)
+    breaker.record_failure(10)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    service = LLMService.__new__(LLMService)
+    service.client = None
+    service.model = object()  # Never called: the call doesn't get past admission
+    service.breaker = breaker
+    monkeypatch.setattr(llm_module, "get_llm_scheduler", lambda: scheduler)
+    return service
+
+
+def test_probe_released_when_admission_rejected(monkeypatch):
+    service = _half_open_service(monkeypatch, _scheduler(max_concurrency=0, max_queue=0))
+    response = asyncio.run(service.generate_response([{"content": "hi"}]))
+    assert response == LLM_FALLBACK_RESPONSE
+    assert service.breaker.state == CircuitBreaker.HALF_OPEN
+    assert service.breaker.allow_request()
+
+
+def test_probe_released_when_cancelled_in_queue(monkeypatch):
+    service = _half_open_service(monkeypatch, _scheduler(max_concurrency=0))
+
+    async def scenario():
+        call = asyncio.create_task(service.generate_response([{"content": "hi"}]))
+        await _settle()
+        assert not service.breaker.allow_request()  # The queued call holds the probe
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    asyncio.run(scenario())
+    assert service.breaker.allow_request()
+
+
+def test_stream_probe_released_when_closed_in_queue(monkeypatch):
+    service = _half_open_service(monkeypatch, _scheduler(max_concurrency=0))
+
+    async def scenario():
+        stream = service.stream_response([{"content": "hi"}])
+        pending = asyncio.create_task(stream.__anext__())
+        await _settle()
+        pending.cancel()
+        await asyncio.gather(pending, return_exceptions=True)
+        await stream.aclose()
+
+    asyncio.run(scenario())
+    assert service.breaker.allow_request()
+
+
+def test_try_acquire_never_waits_or_jumps_the_queue():
+    async def scenario():
+        scheduler = _scheduler(max_concurrency=1)
+        assert scheduler.try_acquire(LLMPriority.INTERACTIVE)
+        assert not scheduler.try_acquire(LLMPriority.INTERACTIVE)  # No free slot
+        waiter = asyncio.create_task(scheduler.acquire(LLMPriority.CRISIS))
+        await _settle()
+        scheduler.max_concurrency = 2  # A slot frees up, but a crisis call is queued ahead
+        assert not scheduler.try_acquire(LLMPriority.INTERACTIVE)
+        scheduler.release()
+        await waiter
+        return scheduler.snapshot()["in_flight"]
+
+    assert asyncio.run(scenario()) == 1
+
+
+def _hedging_service(monkeypatch, scheduler: LLMAdmissionScheduler, latencies: list) -> LLMService:
+    """A service whose provider calls take the given seconds, in order"""
+    service = LLMService.__new__(LLMService)
+    service.client = None
+    service.model = object()
+    service.breaker = CircuitBreaker("test")
+    delays = iter(latencies)
+
+    class _Response:
+        def __init__(self, text):
+            self.text = text
+
+    async def call_provider(prompt):
+        delay = next(delays)
+        await asyncio.sleep(delay)
+        return _Response(f"reply after {delay}s")
+
+    service._call_provider = call_provider
+    monkeypatch.setattr(llm_module, "get_llm_scheduler", lambda: scheduler)
+    monkeypatch.setattr(llm_module, "record_usage", lambda *args, **kwargs: None)
+    return service
+
+
+def test_hedge_takes_its_own_slot(monkeypatch):
+    scheduler = _scheduler(max_concurrency=2)
+    service = _hedging_service(monkeypatch, scheduler, [1.0, 0.01])
+
+    async def scenario():
+        scheduler.try_acquire(LLMPriority.INTERACTIVE)  # The primary call's slot
+        reply = await service._hedged_call("hi", 0.01, {}, LLMPriority.INTERACTIVE)
+        scheduler.release()
+        return reply, scheduler.snapshot()
+
+    reply, snapshot = asyncio.run(scenario())
+    assert reply == "reply after 0.01s"
+    assert snapshot["lanes"]["interactive"]["admitted"] == 2
+    assert snapshot["in_flight"] == 0
+
+
+def test_no_hedge_without_a_free_slot(monkeypatch):
+    scheduler = _scheduler(max_concurrency=1)
+    service = _hedging_service(monkeypatch, scheduler, [0.05, 0.01])
+
+    async def scenario():
+        scheduler.try_acquire(LLMPriority.INTERACTIVE)
+        reply = await service._hedged_call("hi", 0.01, {}, LLMPriority.INTERACTIVE)
+        scheduler.release()
+        return reply, scheduler.snapshot()
+
+    reply, snapshot = asyncio.run(scenario())
+    assert reply == "reply after 0.05s"
+    assert snapshot["lanes"]["interactive"]["admitted"] == 1
+    assert snapshot["in_flight"] == 0
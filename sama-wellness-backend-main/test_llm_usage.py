@@ -0,0 +1,108 @@
+# test_llm_usage.py
+"""
+Tests for LLM usage records: every call that reached the provider gets one,
+including timeouts, hedge losers, cancellations and errors (tokens unknown,
+outcome appended to endpoint_used)
+"""
+
+import asyncio
+
+import pytest
+
+import app.api.llm as llm_module
+from app.api.llm import LLMService, LLM_FALLBACK_RESPONSE
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.llm_scheduler import LLMAdmissionScheduler, LLMPriority
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+
+def _service(monkeypatch, latencies: list, fail: bool = False):
+    """A service whose provider calls take the given seconds, in order; returns (service, usage rows)"""
+    service = LLMService.__new__(LLMService)
+    service.client = None
+    service.model = object()
+    service.breaker = CircuitBreaker("test")
+    delays = iter(latencies)
+    rows = []
+
+    async def call_provider(prompt):
+        delay = next(delays)
+        await asyncio.sleep(delay)
+        if fail:
+            raise RuntimeError("provider error")
+        return _Response(f"reply after {delay}s")
+
+    service._call_provider = call_provider
+    monkeypatch.setattr(llm_module, "record_usage", lambda provider, **fields: rows.append(fields))
+    monkeypatch.setattr(llm_module, "get_llm_scheduler", lambda: LLMAdmissionScheduler(rate_per_second=0))
+    monkeypatch.setattr(llm_module.settings, "LLM_HEDGING_ENABLED", False)
+    return service, rows
+
+
+TAGS = {"user_id": "u1", "endpoint_used": "/api/checkin/chat"}
+
+
+def test_completed_call_records_tokens(monkeypatch):
+    service, rows = _service(monkeypatch, [0])
+    assert asyncio.run(service._call_with_timeout("hi", TAGS)) == "reply after 0s"
+    assert len(rows) == 1
+    assert rows[0]["endpoint_used"] == "/api/checkin/chat"
+    assert rows[0]["tokens_used"] == 0
+
+
+def test_timed_out_call_is_recorded(monkeypatch):
+    monkeypatch.setattr(llm_module.settings, "LLM_TIMEOUT_SECONDS", 0.02)
+    service, rows = _service(monkeypatch, [1.0])
+    assert asyncio.run(service._call_with_timeout("hi", TAGS)) == LLM_FALLBACK_RESPONSE
+    assert rows == [{
+        "endpoint_used": "/api/checkin/chat:timeout",
+        "user_id": "u1",
+        "tokens_used": None,
+        "characters_processed": 2,
+        "cost_incurred": None
+    }]
+
+
+def test_failed_call_is_recorded(monkeypatch):
+    service, rows = _service(monkeypatch, [0], fail=True)
+    assert asyncio.run(service._call_with_timeout("hi", TAGS)) == LLM_FALLBACK_RESPONSE
+    assert [row["endpoint_used"] for row in rows] == ["/api/checkin/chat:error"]
+
+
+def test_hedge_loser_is_recorded(monkeypatch):
+    service, rows = _service(monkeypatch, [1.0, 0.01])
+
+    async def scenario():
+        return await service._hedged_call("hi", 0.01, TAGS, LLMPriority.INTERACTIVE)
+
+    assert asyncio.run(scenario()) == "reply after 0.01s"
+    assert sorted(row["endpoint_used"] for row in rows) == [
+        "/api/checkin/chat", "/api/checkin/chat:hedge_lost"
+    ]
+
+
+def test_hedged_call_timeout_tags_both_attempts(monkeypatch):
+    monkeypatch.setattr(llm_module.settings, "LLM_TIMEOUT_SECONDS", 0.05)
+    service, rows = _service(monkeypatch, [1.0, 1.0])
+    monkeypatch.setattr(service, "_hedge_delay_seconds", lambda: 0.01)
+    assert asyncio.run(service._call_with_timeout("hi", TAGS)) == LLM_FALLBACK_RESPONSE
+    assert [row["endpoint_used"] for row in rows] == ["/api/checkin/chat:timeout"] * 2
+
+
+def test_abandoned_call_is_recorded(monkeypatch):
+    service, rows = _service(monkeypatch, [1.0])
+
+    async def scenario():
+        call = asyncio.create_task(service._call_with_timeout("hi", TAGS))
+        await asyncio.sleep(0.01)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    asyncio.run(scenario())
+    assert [row["endpoint_used"] for row in rows] == ["/api/checkin/chat:cancelled"]
@@ -0,0 +1,340 @@
+# test_post_response.py
+"""
+Tests for the post-response outbox workers: retry backoff, failing jobs,
+the bound on the local hand-off queue, and leases (jobs of a dead replica,
+retries claimed from the table, jobs another worker already completed).
+The job table is replaced by a recording session or an in-memory outbox,
+so no database is needed.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import app.services.post_response as post_response
+from app.services.post_response import (
+    CLAIM_JOBS_SQL,
+    COMPLETE_JOB_SQL,
+    RELEASE_JOB_SQL,
+    STAGE_JOB_SQL,
+    ClaimedJob,
+    OutboxJob,
+    PostResponseQueue,
+    stage_jobs,
+)
+
+
+class _Result:
+    def __init__(self, value):
+        self.value = value
+
+    def first(self):
+        return (self.value,) if self.value is not None else None
+
+    def scalar_one_or_none(self):
+        return self.value
+
+
+class _Session:
+    """Stands in for AsyncSessionLocal(): records statements, answers the outbox ones"""
+
+    def __init__(self, calls: list, release_status: str, job_found: bool = True):
+        self.calls = calls
+        self.release_status = release_status
+        self.job_found = job_found
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, params=None):
+        self.calls.append((statement, params))
+        if statement is COMPLETE_JOB_SQL:
+            return _Result(params["job_id"] if self.job_found else None)
+        if statement is RELEASE_JOB_SQL:
+            return _Result(self.release_status)
+        return _Result(None)
+
+    async def commit(self):
+        self.calls.append(("commit", None))
+
+    async def rollback(self):
+        self.calls.append(("rollback", None))
+
+
+def _use_sessions(monkeypatch, release_status: str = "pending", job_found: bool = True) -> list:
+    calls = []
+    monkeypatch.setattr(post_response, "AsyncSessionLocal", lambda: _Session(calls, release_status, job_found))
+    return calls
+
+
+class _Context:
+    def __init__(self, task):
+        self.task = task
+
+
+def test_retry_delay_doubles():
+    queue = PostResponseQueue(retry_base_seconds=0.5)
+    assert [queue.retry_delay(attempts) for attempts in (1, 2, 3, 4)] == [0.5, 1.0, 2.0, 4.0]
+
+
+def test_successful_job_completes_in_its_transaction(monkeypatch):
+    calls = _use_sessions(monkeypatch)
+    queue = PostResponseQueue()
+    seen = []
+
+    async def handler(db, payload, context):
+        seen.append((payload, context))
+
+    queue.register("progress", handler)
+    asyncio.run(queue._run(ClaimedJob(job_id=1, job_type="progress", payload={"day": 1})))
+
+    assert seen == [({"day": 1}, None)]
+    assert calls == [(COMPLETE_JOB_SQL, {"job_id": 1}), ("commit", None)]
+    assert queue.processed == 1
+
+
+def test_failed_job_released_with_backoff(monkeypatch):
+    calls = _use_sessions(monkeypatch, release_status="pending")
+    queue = PostResponseQueue(max_attempts=3, retry_base_seconds=0.5)
+
+    async def handler(db, payload, context):
+        raise RuntimeError("deadlock detected")
+
+    queue.register("emotion", handler)
+    asyncio.run(queue._run(ClaimedJob(job_id=7, job_type="emotion", payload={}, attempts=2)))
+
+    statement, params = calls[0]
+    assert statement is RELEASE_JOB_SQL
+    assert params["job_id"] == 7
+    assert params["max_attempts"] == 3
+    assert params["delay_seconds"] == 1.0
+    assert "deadlock detected" in params["error"]
+    assert queue.retried == 1
+    assert queue.failed == 0
+    assert queue.processed == 0
+
+
+def test_job_failing_its_last_attempt_drops_context(monkeypatch):
+    _use_sessions(monkeypatch, release_status="failed")
+    queue = PostResponseQueue(max_attempts=2)
+
+    async def handler(db, payload, context):
+        raise RuntimeError("still failing")
+
+    async def scenario():
+        emotion = asyncio.create_task(asyncio.sleep(60))
+        queue.register("emotion", handler)
+        queue._contexts[3] = _Context(emotion)
+        await queue._run(ClaimedJob(job_id=3, job_type="emotion", payload={}, attempts=2))
+        await asyncio.gather(emotion, return_exceptions=True)
+        return emotion
+
+    emotion = asyncio.run(scenario())
+    assert emotion.cancelled()
+    assert queue.failed == 1
+    assert queue.snapshot()["contexts"] == 0
+
+
+def test_unknown_job_type_is_released(monkeypatch):
+    calls = _use_sessions(monkeypatch)
+    queue = PostResponseQueue()
+    asyncio.run(queue._run(ClaimedJob(job_id=5, job_type="missing", payload={})))
+    assert calls[0][0] is RELEASE_JOB_SQL
+    assert "no handler registered" in calls[0][1]["error"]
+
+
+def test_dispatch_is_bounded():
+    async def scenario():
+        queue = PostResponseQueue(max_size=2)
+        tasks = [asyncio.create_task(asyncio.sleep(60)) for _ in range(3)]
+        queue.dispatch([
+            ClaimedJob(job_id=n, job_type="emotion", payload={}, context=_Context(task))
+            for n, task in enumerate(tasks, 1)
+        ])
+        await asyncio.sleep(0)
+        cancelled = [task.cancelled() for task in tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return queue.snapshot(), cancelled
+
+    snapshot, cancelled = asyncio.run(scenario())
+    assert snapshot["depth"] == 2
+    assert snapshot["contexts"] == 2
+    assert snapshot["dropped"] == 1
+    # Only the job that didn't fit loses its in-process context
+    assert cancelled == [False, False, True]
+
+
+class _Outbox:
+    """post_response_jobs rows applying the queue's statements; time is time.monotonic() seconds"""
+
+    def __init__(self):
+        self.rows = {}
+        self.next_id = 1
+
+    def execute(self, statement, params):
+        now = time.monotonic()
+        if statement is STAGE_JOB_SQL:
+            job_id = self.next_id
+            self.next_id += 1
+            self.rows[job_id] = {
+                "job_id": job_id, "job_type": params["job_type"], "payload": params["payload"],
+                "attempts": 1, "status": "pending", "available_at": now,
+                "locked_until": now + params["lease_seconds"], "created_at": datetime.now(timezone.utc)
+            }
+            return _Rows(scalar=job_id)
+        if statement is CLAIM_JOBS_SQL:
+            ready = [
+                row for row in sorted(self.rows.values(), key=lambda row: row["job_id"])
+                if row["status"] == "pending" and row["available_at"] <= now
+                and (row["locked_until"] is None or row["locked_until"] < now)
+            ][:params["limit"]]
+            for row in ready:
+                row["attempts"] += 1
+                row["locked_until"] = now + params["lease_seconds"]
+            return _Rows([dict(row) for row in ready])
+        if statement is COMPLETE_JOB_SQL:
+            row = self.rows.pop(params["job_id"], None)
+            return _Rows([{"job_id": row["job_id"]}] if row else [])
+        if statement is RELEASE_JOB_SQL:
+            row = self.rows[params["job_id"]]
+            row.update(
+                status="failed" if row["attempts"] >= params["max_attempts"] else "pending",
+                locked_until=None,
+                available_at=now + params["delay_seconds"],
+                last_error=params["error"]
+            )
+            return _Rows(scalar=row["status"])
+        raise AssertionError(f"unexpected statement {statement}")
+
+
+class _Rows:
+    def __init__(self, rows=(), scalar=None):
+        self.rows = list(rows)
+        self.scalar = scalar
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def scalar_one(self):
+        return self.scalar
+
+    def scalar_one_or_none(self):
+        return self.scalar
+
+
+class _OutboxSession:
+    def __init__(self, outbox: _Outbox):
+        self.outbox = outbox
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, params=None):
+        return self.outbox.execute(statement, params or {})
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+
+def _use_outbox(monkeypatch) -> _Outbox:
+    outbox = _Outbox()
+    monkeypatch.setattr(post_response, "AsyncSessionLocal", lambda: _OutboxSession(outbox))
+    return outbox
+
+
+async def _until(condition, timeout: float = 1):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+def test_job_of_a_dead_replica_is_claimed_after_its_lease(monkeypatch):
+    outbox = _use_outbox(monkeypatch)
+
+    async def scenario():
+        # Replica A staged the job with a short lease and died before running it
+        await stage_jobs(_OutboxSession(outbox), [OutboxJob("progress", {"user_id": "u1"})], lease_seconds=0.05)
+        ran = []
+
+        async def handler(db, payload, context):
+            ran.append((payload, context))
+
+        replica_b = PostResponseQueue(workers=1, poll_seconds=0.01)
+        replica_b.register("progress", handler)
+        replica_b.start()
+        await asyncio.sleep(0.02)
+        assert ran == []  # Still leased to replica A
+        await _until(lambda: ran)
+        await replica_b.stop()
+        return ran, replica_b.snapshot()
+
+    ran, snapshot = asyncio.run(scenario())
+    assert ran == [({"user_id": "u1"}, None)]  # Payload decoded from the row; no in-process context
+    assert snapshot["claimed"] == 1
+    assert snapshot["processed"] == 1
+    assert outbox.rows == {}
+
+
+def test_failed_job_is_retried_from_the_table(monkeypatch):
+    outbox = _use_outbox(monkeypatch)
+
+    async def scenario():
+        queue = PostResponseQueue(workers=1, poll_seconds=0.01, retry_base_seconds=0.01)
+        attempts = []
+
+        async def flaky(db, payload, context):
+            attempts.append(context)
+            if len(attempts) == 1:
+                raise RuntimeError("deadlock detected")
+
+        queue.register("emotion", flaky)
+        staged = await stage_jobs(_OutboxSession(outbox), [OutboxJob("emotion", {}, context="emotion task")])
+        queue.start()
+        queue.dispatch(staged)
+        await _until(lambda: queue.processed)
+        await queue.stop()
+        return attempts, queue.snapshot()
+
+    attempts, snapshot = asyncio.run(scenario())
+    # The retry comes back through CLAIM and still gets this replica's context
+    assert attempts == ["emotion task", "emotion task"]
+    assert snapshot["retried"] == 1
+    assert snapshot["claimed"] == 1
+    assert outbox.rows == {}
+
+
+def test_job_completed_elsewhere_is_rolled_back(monkeypatch):
+    # Our lease ran out and another replica already ran the job and deleted its row
+    calls = _use_sessions(monkeypatch, job_found=False)
+
+    async def scenario():
+        queue = PostResponseQueue()
+
+        async def handler(db, payload, context):
+            await db.execute("UPDATE user_streaks", None)
+
+        queue.register("progress", handler)
+        await queue._run(ClaimedJob(job_id=9, job_type="progress", payload={}))
+        return queue.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert [call[0] for call in calls] == ["UPDATE user_streaks", COMPLETE_JOB_SQL, "rollback"]
+    assert snapshot["processed"] == 1
+    assert snapshot["retried"] == 0
@@ -0,0 +1,265 @@
+# test_save_checkin_turn.py
+"""
+Tests for persisting a check-in turn in one transaction: both messages,
+the emotion row, outbox jobs and the Idempotency-Key completion commit
+together (or not at all), and outbox jobs are dispatched only after commit.
+Concurrent turns take their sequence numbers from the session counter row.
+"""
+
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+import app.services.database_service as database_service
+from app.models.chat_message import ConversationMessage
+from app.models.emotion_analysis import EmotionAnalysis
+from app.services.cache import SessionTranscriptCache
+from app.services.database_service import ALLOCATE_SEQUENCE_SQL, allocate_sequence_numbers, save_checkin_turn
+from app.services.idempotency import COMPLETE_KEY_SQL, KeyCompletion
+from app.services.post_response import STAGE_JOB_SQL, OutboxJob
+
+SESSION_ID = "1d6f3c2a-5b4e-4a3d-8c2b-9e1f0a7d6c55"
+USER_ID = "7b0c8a4e-0d7f-4f8e-9d8c-3f0c1f7e2a11"
+
+
+class _Insert:
+    """Stands in for sqlalchemy insert(): remembers the table and values"""
+
+    def __init__(self, table):
+        self.table = table
+        self.rows = None
+
+    def values(self, rows=None, **columns):
+        self.rows = rows if rows is not None else [columns]
+        return self
+
+    def returning(self, *columns):
+        return self
+
+
+class _Result:
+    def __init__(self, rows=(), scalar=None):
+        self.rows = list(rows)
+        self.scalar = scalar
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def scalar_one(self):
+        return self.scalar
+
+    def scalar_one_or_none(self):
+        return self.scalar
+
+
+class _Database:
+    """
+    Committed state plus per-session counter row locks. As in Postgres, the
+    UPDATE of a session's counter locks the row until the transaction ends.
+    """
+
+    def __init__(self):
+        self.counters = {SESSION_ID: 0}
+        self.locks = {SESSION_ID: asyncio.Lock()}
+        self.tables = {"messages": [], "emotions": [], "jobs": [], "keys": []}
+        self.job_ids = itertools.count(1)
+        self.commits = 0
+
+
+class _Transaction:
+    def __init__(self, database: _Database, fail_on=None):
+        self.database = database
+        self.fail_on = fail_on
+        self.pending = {name: [] for name in database.tables}
+        self.counter_updates = {}
+        self.held = []
+
+    async def execute(self, statement, params=None):
+        await asyncio.sleep(0)  # A round trip: other turns can run in between
+        if self.fail_on is not None and self.fail_on in (statement, getattr(statement, "table", None)):
+            raise RuntimeError("database error")
+        if statement is ALLOCATE_SEQUENCE_SQL:
+            session_id = params["session_id"]
+            if session_id not in self.database.counters:
+                return _Result()
+            if session_id not in self.held:
+                await self.database.locks[session_id].acquire()
+                self.held.append(session_id)
+                self.counter_updates[session_id] = self.database.counters[session_id]
+            self.database.counters[session_id] += params["count"]
+            return _Result(scalar=self.database.counters[session_id])
+        if statement is STAGE_JOB_SQL:
+            job_id = next(self.database.job_ids)
+            self.pending["jobs"].append((job_id, params["job_type"]))
+            return _Result(scalar=job_id)
+        if statement is COMPLETE_KEY_SQL:
+            self.pending["keys"].append(params["key"])
+            return _Result()
+        if isinstance(statement, _Insert) and statement.table is ConversationMessage:
+            self.pending["messages"].extend(statement.rows)
+            return _Result(SimpleNamespace(message_id=row["message_id"], created_at=None) for row in statement.rows)
+        if isinstance(statement, _Insert):
+            self.pending["emotions"].extend(statement.rows)
+            return _Result()
+        raise AssertionError(f"unexpected statement {statement}")
+
+    async def commit(self):
+        for name, rows in self.pending.items():
+            self.database.tables[name].extend(rows)
+        self.database.commits += 1
+        self._end()
+
+    async def rollback(self):
+        # Undo counter updates, like an aborted UPDATE
+        self.database.counters.update(self.counter_updates)
+        self._end()
+
+    def _end(self):
+        self.pending = {name: [] for name in self.database.tables}
+        self.counter_updates = {}
+        for session_id in self.held:
+            self.database.locks[session_id].release()
+        self.held = []
+
+
+class _Queue:
+    def __init__(self, database: _Database):
+        self.database = database
+        self.dispatched = []
+
+    def dispatch(self, jobs):
+        # Jobs must already be committed when they reach the workers
+        committed = {job_id for job_id, _ in self.database.tables["jobs"]}
+        assert all(job.job_id in committed for job in jobs)
+        self.dispatched.extend(job.job_type for job in jobs)
+
+
+@pytest.fixture
+def database(monkeypatch) -> _Database:
+    database = _Database()
+    monkeypatch.setattr(database_service, "insert", _Insert)
+    monkeypatch.setattr(database_service, "get_post_response_queue", lambda: database.queue)
+    monkeypatch.setattr(database_service, "get_session_transcript_cache", lambda: database.transcripts)
+    database.queue = _Queue(database)
+    database.transcripts = SessionTranscriptCache()
+    return database
+
+
+def _jobs(user_message_id):
+    return [
+        OutboxJob("turn_progress", {"message_id": user_message_id}),
+        OutboxJob("turn_emotion", {"message_id": user_message_id})
+    ]
+
+
+def _save(database, transaction=None, **overrides):
+    options = dict(
+        db=transaction or _Transaction(database),
+        session_id=SESSION_ID,
+        user_id=USER_ID,
+        transcript_text="I slept badly",
+        ai_response_text="That sounds tiring."
+    )
+    options.update(overrides)
+    return save_checkin_turn(**options)
+
+
+def test_turn_commits_once_with_all_rows(database):
+    user_message, ai_message = asyncio.run(_save(
+        database,
+        emotion={"primary_emotion": "tired"},
+        post_response_jobs=_jobs,
+        idempotency=KeyCompletion("checkin", USER_ID, "key-1", {"message": "That sounds tiring."})
+    ))
+
+    assert database.commits == 1
+    assert (user_message.sequence_number, ai_message.sequence_number) == (1, 2)
+    assert user_message.transcript_text == "I slept badly"
+    assert ai_message.ai_response_text == "That sounds tiring."
+    assert len(database.tables["messages"]) == 2
+    assert database.tables["emotions"][0]["message_id"] == database.tables["messages"][0]["message_id"]
+    assert [job_type for _, job_type in database.tables["jobs"]] == ["turn_progress", "turn_emotion"]
+    assert database.tables["keys"] == ["key-1"]
+    assert database.queue.dispatched == ["turn_progress", "turn_emotion"]
+
+
+def test_outbox_payload_gets_the_user_message_id(database):
+    seen = []
+
+    def jobs(user_message_id):
+        seen.append(user_message_id)
+        return []
+
+    user_message, _ = asyncio.run(_save(database, post_response_jobs=jobs))
+    assert seen == [user_message.message_id]
+
+
+@pytest.mark.parametrize("failing", ["emotion", "outbox", "key"])
+def test_failure_writes_nothing_and_dispatches_nothing(database, failing):
+    fail_on = {"emotion": EmotionAnalysis, "outbox": STAGE_JOB_SQL, "key": COMPLETE_KEY_SQL}[failing]
+    transaction = _Transaction(database, fail_on=fail_on)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(_save(
+            database,
+            transaction,
+            emotion={"primary_emotion": "tired"},
+            post_response_jobs=_jobs,
+            idempotency=KeyCompletion("checkin", USER_ID, "key-1", {})
+        ))
+
+    assert database.commits == 0
+    assert all(rows == [] for rows in database.tables.values())
+    assert database.counters[SESSION_ID] == 0
+    assert database.queue.dispatched == []
+
+
+def test_saved_turn_extends_cached_transcript(database):
+    database.transcripts.put(SESSION_ID, [])
+    asyncio.run(_save(database))
+    assert [m.sequence_number for m in database.transcripts.get(SESSION_ID)] == [1, 2]
+
+
+def test_concurrent_turns_get_distinct_consecutive_numbers(database):
+    async def scenario():
+        return await asyncio.gather(*(
+            _save(database, transcript_text=f"turn {n}") for n in range(5)
+        ))
+
+    turns = asyncio.run(scenario())
+    numbers = sorted((user.sequence_number, ai.sequence_number) for user, ai in turns)
+    assert numbers == [(1, 2), (3, 4), (5, 6), (7, 8), (9, 10)]
+    assert database.counters[SESSION_ID] == 10
+
+
+def test_rolled_back_turn_frees_its_numbers(database):
+    async def scenario():
+        failing = _save(database, _Transaction(database, fail_on=ConversationMessage))
+        return await asyncio.gather(failing, _save(database), return_exceptions=True)
+
+    failed, (user_message, ai_message) = asyncio.run(scenario())
+    assert isinstance(failed, RuntimeError)
+    # The second turn waited on the counter row, then got the numbers back
+    assert (user_message.sequence_number, ai_message.sequence_number) == (1, 2)
+    assert database.counters[SESSION_ID] == 2
+
+
+def test_allocation_for_unknown_session_fails(database):
+    async def scenario():
+        return await allocate_sequence_numbers(_Transaction(database), "no-such-session", count=2)
+
+    with pytest.raises(ValueError):
+        asyncio.run(scenario())
+
+
+def test_allocation_returns_first_of_the_block(database):
+    async def scenario():
+        transaction = _Transaction(database)
+        first = await allocate_sequence_numbers(transaction, SESSION_ID, count=3)
+        second = await allocate_sequence_numbers(transaction, SESSION_ID)
+        await transaction.commit()
+        return first, second
+
+    assert asyncio.run(scenario()) == (1, 4)
@@ -0,0 +1,86 @@
+# test_session_list.py
+"""
+Tests for the session list page query: the first page and cursor pages use
+separate statements, and has_more / next_before come from the extra row
+"""
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.services.database_service import (
+    SESSION_LIST_AFTER_CURSOR_SQL,
+    SESSION_LIST_FIRST_PAGE_SQL,
+    SESSION_PREVIEW_CHARS,
+    list_conversation_sessions,
+)
+
+USER_ID = "7b0c8a4e-0d7f-4f8e-9d8c-3f0c1f7e2a11"
+START = datetime(2026, 10, 18, 9, 0)
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class _Db:
+    """Returns up to params["limit"] of the given rows and remembers what was asked"""
+
+    def __init__(self, rows: list):
+        self.rows = rows
+        self.calls = []
+
+    async def execute(self, statement, params=None):
+        self.calls.append((statement, params))
+        return _Result(self.rows[:params["limit"]])
+
+
+def _sessions(count: int) -> list:
+    return [
+        SimpleNamespace(session_id=uuid.uuid4(), start_time=START - timedelta(hours=n))
+        for n in range(count)
+    ]
+
+
+def test_first_page_has_no_cursor_params():
+    db = _Db(_sessions(3))
+    page = asyncio.run(list_conversation_sessions(db, USER_ID, limit=5))
+
+    statement, params = db.calls[0]
+    assert statement is SESSION_LIST_FIRST_PAGE_SQL
+    assert params == {"user_id": USER_ID, "limit": 6, "preview_chars": SESSION_PREVIEW_CHARS}
+    assert len(page.sessions) == 3
+    assert not page.has_more
+    assert page.next_before is None
+
+
+def test_cursor_page_binds_the_cursor():
+    before_id = uuid.uuid4()
+    db = _Db(_sessions(1))
+    asyncio.run(list_conversation_sessions(db, USER_ID, limit=5, before=(START, before_id)))
+
+    statement, params = db.calls[0]
+    assert statement is SESSION_LIST_AFTER_CURSOR_SQL
+    assert params["before_start"] == START
+    assert params["before_id"] == str(before_id)
+
+
+def test_extra_row_sets_has_more_and_next_cursor():
+    sessions = _sessions(4)
+    page = asyncio.run(list_conversation_sessions(_Db(sessions), USER_ID, limit=3))
+
+    assert page.sessions == sessions[:3]
+    assert page.has_more
+    assert page.next_before == (sessions[2].start_time, sessions[2].session_id)
+
+
+def test_exactly_full_page_has_no_more():
+    page = asyncio.run(list_conversation_sessions(_Db(_sessions(3)), USER_ID, limit=3))
+    assert len(page.sessions) == 3
+    assert not page.has_more
+    assert page.next_before is None
@@ -0,0 +1,63 @@
+# test_timing.py
+"""
+Tests for per-stage timers and the fixed-bucket latency histogram
+"""
+
+from app.services.timing import LatencyHistogram, LatencyRecorder, StageTimer
+
+
+def test_percentile_of_empty_histogram():
+    assert LatencyHistogram().percentile(50) is None
+
+
+def test_percentile_returns_bucket_upper_bound():
+    histogram = LatencyHistogram(buckets=(10, 100, 1000))
+    for ms in (5, 5, 50, 500):
+        histogram.observe(ms)
+    assert histogram.percentile(50) == 10.0
+    assert histogram.percentile(75) == 100.0
+    assert histogram.percentile(99) == 1000.0
+    assert histogram.percentile(100) == 1000.0
+
+
+def test_bucket_bounds_are_inclusive():
+    histogram = LatencyHistogram(buckets=(10, 100))
+    histogram.observe(10)
+    assert histogram.counts == [1, 0, 0]
+    assert histogram.percentile(50) == 10.0
+
+
+def test_open_bucket_percentile_is_max():
+    histogram = LatencyHistogram(buckets=(10, 100))
+    histogram.observe(5)
+    histogram.observe(2345.67)
+    assert histogram.percentile(50) == 10.0
+    assert histogram.percentile(95) == 2345.7
+
+
+def test_snapshot():
+    histogram = LatencyHistogram(buckets=(10, 100))
+    for ms in (4, 40, 400):
+        histogram.observe(ms)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 3
+    assert snapshot["avg_ms"] == 148.0
+    assert snapshot["max_ms"] == 400
+    assert snapshot["buckets"] == {"le_10": 1, "le_100": 1, "inf": 1}
+
+
+def test_late_stages_are_observed_once():
+    recorder = LatencyRecorder()
+    timer = StageTimer(route="checkin")
+    with timer.stage("context"):
+        pass
+    recorder.observe(timer)
+    with timer.stage("emotion"):
+        pass
+    recorder.observe_late(timer)
+    recorder.observe_late(timer)
+
+    histograms = recorder.snapshot()["histograms"]["checkin"]
+    assert histograms["context"]["count"] == 1
+    assert histograms["emotion"]["count"] == 1
+    assert histograms["total"]["count"] == 1
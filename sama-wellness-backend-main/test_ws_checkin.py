@@ -0,0 +1,75 @@
+# test_ws_checkin.py
+"""
+Tests for WebSocket check-in turns: a client that disconnects mid-stream
+closes the LLM stream (and with it the provider call and admission slot)
+and the turn is recorded as cancelled
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import WebSocketDisconnect
+
+import app.api.daily_checkin as daily_checkin
+from app.api.daily_checkin import _WebSocketCheckin
+
+
+class _WebSocket:
+    url = SimpleNamespace(path="/api/checkin/ws")
+
+    def __init__(self, disconnect_after: int):
+        self.sent = []
+        self.disconnect_after = disconnect_after
+
+    async def send_json(self, payload):
+        if len(self.sent) == self.disconnect_after:
+            raise WebSocketDisconnect()
+        self.sent.append(payload)
+
+
+class _Session:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def test_disconnect_mid_stream_closes_the_llm_stream(monkeypatch):
+    events = []
+
+    async def stream_llm_response(**kwargs):
+        try:
+            for chunk in ("I'm ", "here ", "with you."):
+                yield chunk
+                await asyncio.sleep(0)
+        finally:
+            # Where the real stream releases its admission slot and provider stream
+            events.append("stream closed")
+
+    async def await_knowledge(*args):
+        return []
+
+    async def record_cancelled_turn(db, request, session_id, **kwargs):
+        events.append("turn cancelled")
+
+    def start_turn_analysis(*args):
+        return asyncio.get_running_loop().create_future(), None
+
+    monkeypatch.setattr(daily_checkin, "stream_llm_response", stream_llm_response)
+    monkeypatch.setattr(daily_checkin, "_await_knowledge", await_knowledge)
+    monkeypatch.setattr(daily_checkin, "_start_turn_analysis", start_turn_analysis)
+    monkeypatch.setattr(daily_checkin, "_record_cancelled_turn", record_cancelled_turn)
+    monkeypatch.setattr(daily_checkin, "build_checkin_prompt", lambda **kwargs: kwargs["user_text"])
+    monkeypatch.setattr(daily_checkin, "AsyncSessionLocal", _Session)
+
+    state = _WebSocketCheckin(
+        user_id="u1", session_id="s1", user=None, preferences=None,
+        dosha_type_name="Vata", dosha_context={}
+    )
+    websocket = _WebSocket(disconnect_after=1)
+    with pytest.raises(WebSocketDisconnect):
+        asyncio.run(daily_checkin._ws_turn(websocket, state, "I had a rough day at work"))
+    assert events == ["stream closed", "turn cancelled"]
+    assert websocket.sent == [{"type": "token", "text": "I'm "}]